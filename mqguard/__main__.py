@@ -14,14 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
-import threading
-
-from mqreceive.receiving import BrokerThreadManager
+import signal
 
 from mqguard.supervising import DeviceRegistry
 from mqguard.reporting import ReportingManager
 from mqguard.system import System
+from mqguard.reloading import ConfigReloader
+from mqguard.lifecycle import Lifecycle
 
 def main():
     System.initialize()
@@ -30,30 +31,58 @@ def main():
     for reporter in System.getReporters():
         reportingManager.addReporter(reporter)
     deviceRegistry = DeviceRegistry(reportingManager)
+    deviceRegistry.setHistory(System.getHistory())
+    deviceRegistry.setTimeoutTable(System.getTimeoutTable())
+    deviceRegistry.setStatistics(System.getIngestStatistics())
+    deviceRegistry.setFlapDetector(System.getFlapDetector())
+
+    # Take over alarm states of previous run.
+    checkpoint = System.getStateCheckpoint()
+    if checkpoint is not None:
+        deviceRegistry.restoreAlarmStates(checkpoint.load())
 
-    listenDescriptors = System.getBrokerListenDescriptors()
-    brokerThreadManager = BrokerThreadManager(listenDescriptors, deviceRegistry)
+    ingestBackend = System.getIngestBackend(deviceRegistry)
 
     for device, guard in System.getDeviceGuards():
         deviceRegistry.addGuardedDevice(device, guard)
         reportingManager.addDevice(device, guard)
 
+    for template in System.getDeviceTemplates():
+        deviceRegistry.addDeviceTemplate(template)
+    deviceRegistry.addDiscoveryListener(System.addDeviceGuard)
+
     # Start reporting threads.
     reportingManager.start()
 
     # Notify device registry to start.
     deviceRegistry.start()
 
-    # Start receiving threads.
-    brokerThreadManager.start()
+    # Start receiving messages.
+    ingestBackend.start()
+
+    lifecycle = Lifecycle(ingestBackend, deviceRegistry, reportingManager,
+        System.getShutdownTimeout(), checkpoint)
+
+    # Report traffic summary periodically.
+    statisticsSummarizer = System.getStatisticsSummarizer(reportingManager)
+    if statisticsSummarizer is not None:
+        lifecycle.startService(statisticsSummarizer)
+
+    # Reload configuration on SIGHUP, shut down on SIGTERM and SIGINT.
+    configReloader = ConfigReloader(deviceRegistry, reportingManager)
+    signal.signal(signal.SIGHUP, lambda signum, frame: configReloader.requestReload())
+    signal.signal(signal.SIGTERM, lambda signum, frame: lifecycle.requestShutdown())
+    signal.signal(signal.SIGINT, lambda signum, frame: lifecycle.requestShutdown())
 
-    exitLock = threading.Semaphore(value = 0)
+    # Lock main thread. It wakes up only to reload configuration or to shut down.
+    while configReloader.waitForRequest(interrupted = lifecycle.isShutdownRequested):
+        configReloader.reload()
 
-    try:
-        # Lock main thread
-        exitLock.acquire()
-    finally:
-        pass
+    if not lifecycle.shutdown():
+        # Threads of reporters which didn't finish would keep program running.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(1)
 
 if __name__ == '__main__':
     main()
@@ -19,9 +19,16 @@ Module with update alarms.
 
 from enum import Enum
 import datetime
+import copy
+import math
+import time
+import collections
+import functools
+import json
+import re
 
-__all__ = ['FloodingAlarm', 'TimeoutAlarm', 'RangeAlarm', 'ErrorCodesAlarm',
-            'PresenceAlarm', 'NumericAlarm', 'AlphanumericAlarm', 'AlphabeticAlarm']
+__all__ = ['FloodingAlarm', 'RateAlarm', 'TimeoutAlarm', 'RangeAlarm', 'AnomalyAlarm', 'DerivativeAlarm', 'ErrorCodesAlarm',
+            'RegexAlarm', 'EnumerationAlarm', 'JSONFieldAlarm', 'PresenceAlarm', 'NumericAlarm', 'AlphanumericAlarm', 'AlphabeticAlarm']
 
 class AlarmType(Enum):
     messageDriven = 1
@@ -38,6 +45,19 @@ class BaseAlarm:
     Basic alarm implementation.
     """
 
+    ## @var numeric
+    # Alarm expects numeric messages. Numeric alarms implement checkValue() method.
+    numeric = False
+
+    ## @var document
+    # Alarm checks parsed JSON document. Document alarms implement checkDocument() method.
+    document = False
+
+    ## @var aggregate
+    # Alarm checks all topics matching wildcard guard together, instead of every
+    # concrete topic separately.
+    aggregate = False
+
     def __init__(self, alarmType, alarmPriority):
         """!
         Initiate object:
@@ -74,6 +94,15 @@ class BaseAlarm:
         """
         return True, "Not implemented"
 
+    def isTableChecked(self):
+        """!
+        Check if periodic state of alarm is evaluated by timeout table instead of
+        checkPeriodic().
+
+        @return False.
+        """
+        return False
+
     def checkDecodedMessage(self, dataIdentifier, data):
         """!
         Convenient method. Decode message
@@ -86,6 +115,15 @@ class BaseAlarm:
     def getCriteria(self):
         return None
 
+    def clone(self):
+        """!
+        Create alarm with same configuration and fresh state. Used for instantiating
+        alarms of wildcard update guards.
+
+        @return New alarm object.
+        """
+        return copy.copy(self)
+
 class TimedAlarm(BaseAlarm):
     """!
     Time related alarm. Base class.
@@ -108,6 +146,11 @@ class TimedAlarm(BaseAlarm):
     def getCriteria(self):
         return "{}s per message".format(self.period.total_seconds())
 
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.lastMessageTime = None
+        return alarm
+
 class FloodingAlarm(TimedAlarm):
     """!
     Check too many updates in short time period.
@@ -135,69 +178,302 @@ class FloodingAlarm(TimedAlarm):
             self.updateMessageTime()
         return False, None
 
+class RateAlarm(BaseAlarm):
+    """!
+    Check maximum number of messages in sliding time window.
+
+    Timestamps of last allowed number of messages are kept in fixed-size ring, so
+    every message is checked in constant time. Unlike FloodingAlarm, single short
+    gap between two messages doesn't trigger the alarm.
+    """
+
+    ## @var maxMessages
+    # Maximum number of messages in window.
+
+    ## @var window
+    # Window length in seconds.
+
+    ## @var timestamps
+    # Monotonic times of last maxMessages messages.
+
+    def __init__(self, maxMessages, window, aggregate = False):
+        """!
+        Initiate alarm.
+
+        @param maxMessages Maximum number of messages in window.
+        @param window Window length in seconds.
+        @param aggregate Check all topics of wildcard guard together.
+        """
+        BaseAlarm.__init__(self, AlarmType.messageDriven, AlarmPriority.other)
+        self.maxMessages = maxMessages
+        self.window = window
+        self.aggregate = aggregate
+        self.timestamps = collections.deque(maxlen = maxMessages)
+
+    @classmethod
+    def fromSeconds(cls, maxMessages, seconds):
+        return cls(maxMessages, seconds)
+
+    @classmethod
+    def aggregated(cls, maxMessages, seconds):
+        return cls(maxMessages, seconds, True)
+
+    def checkMessage(self, dataIdentifier, data):
+        currentTime = time.monotonic()
+        oldestTime = None
+        if len(self.timestamps) == self.maxMessages:
+            oldestTime = self.timestamps[0]
+        self.timestamps.append(currentTime)
+        if oldestTime is not None and currentTime - oldestTime < self.window:
+            return True, "Message rate exceeded, {} messages received in {:.3f} seconds".format(
+                self.maxMessages + 1, currentTime - oldestTime)
+        return False, None
+
+    def getCriteria(self):
+        return "{} messages per {}s".format(self.maxMessages, self.window)
+
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.timestamps = collections.deque(maxlen = self.maxMessages)
+        return alarm
+
 class TimeoutAlarm(TimedAlarm):
     """!
     Check timeouting.
     """
 
+    ## @var timeoutTable
+    # TimeoutTable object keeping state of the alarm, or None if alarm is checked
+    # by checkPeriodic().
+
+    ## @var timeoutSlot
+    # Slot of the alarm in timeout table.
+
     def __init__(self, period):
         TimedAlarm.__init__(self, AlarmType.periodic, AlarmPriority.other, period)
+        self.timeoutTable = None
+        self.timeoutSlot = None
 
     @classmethod
     def fromSeconds(cls, seconds):
         return cls(datetime.timedelta(seconds = seconds))
 
+    def attachTable(self, timeoutTable, timeoutSlot):
+        """!
+        Move alarm state into timeout table.
+
+        @param timeoutTable TimeoutTable object or None.
+        @param timeoutSlot Slot of the alarm in timeout table.
+        """
+        self.timeoutTable = timeoutTable
+        self.timeoutSlot = timeoutSlot
+
+    def isTableChecked(self):
+        return self.timeoutTable is not None
+
     def notifyMessage(self, dataIdentifier, data):
-        self.updateMessageTime()
+        if self.timeoutTable is not None:
+            self.timeoutTable.touch(self.timeoutSlot, time.monotonic())
+        else:
+            self.updateMessageTime()
 
     def checkPeriodic(self):
         if self.isLastTimeKnown():
             currentTime = datetime.datetime.now()
             delta = currentTime - self.lastMessageTime
             if delta > self.period:
-                return True, "Update timeouted: {} seconds".format(delta.total_seconds())
+                return True, self.getTimeoutMessage(delta.total_seconds())
         else:
             # First message is still not received. Update its timestamp. It will trigger
             # alarm in case that it never be received.
             self.updateMessageTime()
         return False, None
 
-class RangeAlarm(BaseAlarm):
+    def getTimeoutMessage(self, seconds):
+        return "Update timeouted: {} seconds".format(seconds)
+
+    def clone(self):
+        alarm = TimedAlarm.clone(self)
+        alarm.attachTable(None, None)
+        return alarm
+
+class NumericValueAlarm(BaseAlarm):
     """!
-    Alarm for checking valid range of data
+    Base class of alarms checking numeric value of message. Update guard parses
+    message value once and passes it to checkValue() of all numeric alarms.
     """
 
-    def __init__(self, lowerLimit, upperLimit):
+    numeric = True
+
+    def __init__(self):
         BaseAlarm.__init__(self, AlarmType.messageDriven, AlarmPriority.value)
+
+    def checkDecodedMessage(self, dataIdentifier, data):
+        try:
+            value = float(data)
+        except ValueError as ex:
+            return True, "Can't decode value '{}' as a number".format(data)
+        return self.checkValue(dataIdentifier, value)
+
+    def checkValue(self, dataIdentifier, value):
+        """!
+        Check already parsed message value.
+
+        @param dataIdentifier DataIdentifier object.
+        @param value Float value of message.
+        """
+        return True, "Not implemented"
+
+class RangeAlarm(NumericValueAlarm):
+    """!
+    Alarm for checking valid range of data. With hysteresis, active alarm is cleared
+    only when value returns into range narrowed by hysteresis, so value oscillating
+    around limit doesn't switch alarm on every message.
+    """
+
+    ## @var hysteresis
+    # Distance from limits which value must reach to clear active alarm.
+
+    ## @var active
+    # Alarm was active after last checked value.
+
+    def __init__(self, lowerLimit, upperLimit, hysteresis = 0.0):
+        NumericValueAlarm.__init__(self)
         self.lowerLimit = lowerLimit
         self.upperLimit = upperLimit
+        self.hysteresis = hysteresis
+        self.active = False
 
     @classmethod
-    def atInterval(cls, lowerLimit, upperLimit):
-        return cls(lowerLimit, upperLimit)
+    def atInterval(cls, lowerLimit, upperLimit, hysteresis = 0.0):
+        return cls(lowerLimit, upperLimit, hysteresis)
 
     @classmethod
-    def lowerLimit(cls, lowerLimit):
-        return cls(lowerLimit, float('inf'))
+    def lowerLimit(cls, lowerLimit, hysteresis = 0.0):
+        return cls(lowerLimit, float('inf'), hysteresis)
 
     @classmethod
-    def upperLimit(cls, upperLimit):
-        return cls(float('-inf'), upperLimit)
-
-    def checkDecodedMessage(self, dataIdentifier, data):
-        try:
-            value = float(data)
-            if value < self.lowerLimit:
-                return True, "Value {} exceeds minimum allowed range ({})".format(value, self.lowerLimit)
-            if value > self.upperLimit:
-                return True, "Value {} exceeds maximum allowed range ({})".format(value, self.upperLimit)
-            return False, None
-        except ValueError as ex:
-            return True, "Can't decode value '{}' as a number".format(data)
+    def upperLimit(cls, upperLimit, hysteresis = 0.0):
+        return cls(float('-inf'), upperLimit, hysteresis)
+
+    def checkValue(self, dataIdentifier, value):
+        wasActive = self.active
+        self.active = True
+        if value < self.lowerLimit:
+            return True, "Value {} exceeds minimum allowed range ({})".format(value, self.lowerLimit)
+        if value > self.upperLimit:
+            return True, "Value {} exceeds maximum allowed range ({})".format(value, self.upperLimit)
+        if wasActive and not (self.lowerLimit + self.hysteresis <= value <= self.upperLimit - self.hysteresis):
+            return True, "Value {} didn't return into allowed range by hysteresis ({})".format(value, self.hysteresis)
+        self.active = False
+        return False, None
 
     def getCriteria(self):
+        if self.hysteresis > 0:
+            return "{} <= x <= {}, hysteresis {}".format(self.lowerLimit, self.upperLimit, self.hysteresis)
         return "{} <= x <= {}".format(self.lowerLimit, self.upperLimit)
 
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.active = False
+        return alarm
+
+class AnomalyAlarm(NumericValueAlarm):
+    """!
+    Detect values deviating from running statistics of the topic.
+
+    Running mean and variance are updated incrementally with every value, so alarm
+    state is just a few floats. Without smoothing factor, cumulative statistics of all
+    values are kept (Welford's algorithm). With smoothing factor, exponentially weighted
+    mean and variance are kept, so statistics follow slow drifts of the value.
+    """
+
+    ## @var threshold
+    # Maximum allowed distance from mean in standard deviations.
+
+    ## @var alpha
+    # Smoothing factor of exponentially weighted statistics, or None for cumulative statistics.
+
+    ## @var warmup
+    # Number of values needed before alarm is evaluated.
+
+    def __init__(self, threshold, alpha = None, warmup = 10):
+        """!
+        Initiate alarm.
+
+        @param threshold Maximum allowed z-score.
+        @param alpha Smoothing factor from interval (0, 1], or None for cumulative statistics.
+        @param warmup Number of values needed before alarm is evaluated.
+        """
+        NumericValueAlarm.__init__(self)
+        self.threshold = threshold
+        self.alpha = alpha
+        self.warmup = warmup
+        self.resetStatistics()
+
+    @classmethod
+    def cumulative(cls, threshold, warmup = 10):
+        return cls(threshold, None, warmup)
+
+    @classmethod
+    def exponential(cls, threshold, alpha, warmup = 10):
+        return cls(threshold, alpha, warmup)
+
+    def resetStatistics(self):
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def checkValue(self, dataIdentifier, value):
+        if math.isnan(value) or math.isinf(value):
+            return True, "Value {} can't be evaluated".format(value)
+        zScore = self.getZScore(value)
+        self.addValue(value)
+        if zScore is not None and abs(zScore) > self.threshold:
+            return True, "Value {} deviates from mean {:.3f} by {:.2f} standard deviations".format(
+                value, self.mean, zScore)
+        return False, None
+
+    def getZScore(self, value):
+        """!
+        Get distance of value from mean in standard deviations.
+
+        @param value Evaluated value.
+        @return Z-score, or None if statistics aren't ready yet.
+        """
+        if self.count < self.warmup or self.variance <= 0.0:
+            return None
+        return (value - self.mean) / math.sqrt(self.variance)
+
+    def addValue(self, value):
+        """!
+        Update running statistics.
+
+        @param value New value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        if self.alpha is None:
+            self.mean += delta / self.count
+            # Variance is kept as population variance instead of sum of squares.
+            self.variance += (delta * (value - self.mean) - self.variance) / self.count
+        elif self.count == 1:
+            self.mean = value
+        else:
+            increment = self.alpha * delta
+            self.mean += increment
+            self.variance = (1 - self.alpha) * (self.variance + delta * increment)
+
+    def getCriteria(self):
+        if self.alpha is None:
+            return "|z| <= {}".format(self.threshold)
+        return "|z| <= {}, alpha {}".format(self.threshold, self.alpha)
+
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.resetStatistics()
+        return alarm
+
 class PresenceAlarm(BaseAlarm):
     """!
     Checking device presence message.
@@ -240,6 +516,237 @@ class ErrorCodesAlarm(BaseAlarm):
     def getCriteria(self):
         return ", ".join(self.errorCodes)
 
+class DerivativeAlarm(NumericValueAlarm):
+    """!
+    Check rate of value change per second. Only previous value and its time are
+    kept per topic.
+    """
+
+    ## @var maxRate
+    # Maximum allowed absolute change of value per second.
+
+    def __init__(self, maxRate):
+        NumericValueAlarm.__init__(self)
+        self.maxRate = maxRate
+        self.lastValue = None
+        self.lastTime = None
+
+    def checkValue(self, dataIdentifier, value):
+        currentTime = time.monotonic()
+        lastValue, lastTime = self.lastValue, self.lastTime
+        self.lastValue, self.lastTime = value, currentTime
+        if lastTime is None or currentTime <= lastTime:
+            return False, None
+        rate = (value - lastValue) / (currentTime - lastTime)
+        if abs(rate) > self.maxRate:
+            return True, "Value changed from {} to {} at rate {:.3f} per second".format(lastValue, value, rate)
+        return False, None
+
+    def getCriteria(self):
+        return "|dx/dt| <= {}/s".format(self.maxRate)
+
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.lastValue = None
+        alarm.lastTime = None
+        return alarm
+
+@functools.lru_cache(maxsize = None)
+def getCombinedPattern(patterns):
+    """!
+    Compile patterns into single regular expression matching any of them. Compiled
+    expression is cached, so guards sharing the same patterns share one object.
+
+    @param patterns Tuple of regular expression strings.
+    @return Compiled regular expression.
+    @throws re.error If some pattern is invalid.
+    """
+    return re.compile("|".join("(?:{})".format(pattern) for pattern in patterns))
+
+@functools.lru_cache(maxsize = None)
+def getValueSet(values):
+    """!
+    Create set of allowed values containing both strings and their UTF-8 encoded
+    bytes. Sets are cached, so guards sharing the same values share one object.
+
+    @param values Tuple of value strings.
+    @return Frozenset of strings and bytes.
+    """
+    return frozenset(values) | frozenset(value.encode("utf-8") for value in values)
+
+class RegexAlarm(BaseAlarm):
+    """!
+    Check that whole message matches some of regular expressions.
+    """
+
+    def __init__(self, patterns):
+        """!
+        Initiate alarm.
+
+        @param patterns Iterable of regular expression strings.
+        @throws re.error If some pattern is invalid.
+        """
+        BaseAlarm.__init__(self, AlarmType.messageDriven, AlarmPriority.value)
+        self.patterns = tuple(patterns)
+        self.regex = getCombinedPattern(self.patterns)
+
+    def checkDecodedMessage(self, dataIdentifier, data):
+        if self.regex.fullmatch(data) is not None:
+            return False, None
+        return True, "'{}' doesn't match expected pattern".format(data)
+
+    def getCriteria(self):
+        return " | ".join(self.patterns)
+
+class EnumerationAlarm(BaseAlarm):
+    """!
+    Check message in list of allowed values. Raw message bytes are checked first,
+    so allowed messages are never decoded.
+    """
+
+    def __init__(self, values):
+        """!
+        Initiate alarm.
+
+        @param values Iterable of allowed value strings.
+        """
+        BaseAlarm.__init__(self, AlarmType.messageDriven, AlarmPriority.value)
+        self.values = tuple(values)
+        self.allowedValues = getValueSet(self.values)
+
+    def checkMessage(self, dataIdentifier, data):
+        if data in self.allowedValues:
+            return False, None
+        return BaseAlarm.checkMessage(self, dataIdentifier, data)
+
+    def checkDecodedMessage(self, dataIdentifier, data):
+        if data in self.allowedValues:
+            return False, None
+        return True, "Unexpected value: {}".format(repr(data))
+
+    def getCriteria(self):
+        return ", ".join(self.values)
+
+class FieldAccessor:
+    """!
+    Compiled path of field inside JSON document. Path levels are separated by dots,
+    numeric levels index arrays, e.g. `sensors.0.temperature`.
+    """
+
+    __slots__ = ("path", "keys")
+
+    def __init__(self, path):
+        """!
+        Compile field path.
+
+        @param path Field path string.
+        @throws ValueError If some path level is empty.
+        """
+        self.path = path
+        keys = path.split(".")
+        if any(len(key) == 0 for key in keys):
+            raise ValueError("empty level in field path '{}'".format(path))
+        self.keys = tuple((key, int(key) if key.isdecimal() else None) for key in keys)
+
+    def get(self, document):
+        """!
+        Get field value.
+
+        @param document Parsed JSON document.
+        @return Field value.
+        @throws KeyError If document doesn't contain the field.
+        """
+        for key, index in self.keys:
+            if isinstance(document, dict):
+                document = document[key]
+            elif isinstance(document, list) and index is not None and index < len(document):
+                document = document[index]
+            else:
+                raise KeyError(key)
+        return document
+
+@functools.lru_cache(maxsize = None)
+def getFieldAccessor(path):
+    """!
+    Get compiled field accessor. Accessors are cached, so all alarms of the same
+    field share one object.
+
+    @param path Field path string.
+    @return FieldAccessor object.
+    """
+    return FieldAccessor(path)
+
+class JSONFieldAlarm(BaseAlarm):
+    """!
+    Apply alarm to single field of JSON message. Message is parsed once by update
+    guard and the document is passed to all field alarms.
+    """
+
+    document = True
+
+    ## @var accessor
+    # FieldAccessor object.
+
+    ## @var alarm
+    # Alarm checking field value.
+
+    ## @var maxSize
+    # Maximum size of message in bytes. Larger messages are not parsed.
+
+    def __init__(self, path, alarm, maxSize):
+        """!
+        Initiate alarm.
+
+        @param path Field path string.
+        @param alarm Message driven alarm checking field value.
+        @param maxSize Maximum size of message in bytes.
+        """
+        BaseAlarm.__init__(self, AlarmType.messageDriven, alarm.alarmPriority)
+        self.accessor = getFieldAccessor(path)
+        self.alarm = alarm
+        self.maxSize = maxSize
+
+    def checkMessage(self, dataIdentifier, data):
+        if len(data) > self.maxSize:
+            return True, "Message size {} exceeds limit {}".format(len(data), self.maxSize)
+        try:
+            document = json.loads(data)
+        except (ValueError, RecursionError) as ex:
+            return True, "Can't decode message as JSON: {}".format(ex)
+        return self.checkDocument(dataIdentifier, document)
+
+    def checkDocument(self, dataIdentifier, document):
+        """!
+        Check field of already parsed JSON document.
+
+        @param dataIdentifier DataIdentifier object.
+        @param document Parsed JSON document.
+        """
+        try:
+            value = self.accessor.get(document)
+        except KeyError:
+            return True, "Field '{}' not found".format(self.accessor.path)
+        if self.alarm.numeric and isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                value = float(value)
+            except OverflowError:
+                return True, "Field '{}' value can't be evaluated, number is too large".format(self.accessor.path)
+            return self.alarm.checkValue(dataIdentifier, value)
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        return self.alarm.checkDecodedMessage(dataIdentifier, value)
+
+    def getName(self):
+        return "{}({})".format(self.alarm.getName(), self.accessor.path)
+
+    def getCriteria(self):
+        return "{}: {}".format(self.accessor.path, self.alarm.getCriteria())
+
+    def clone(self):
+        alarm = BaseAlarm.clone(self)
+        alarm.alarm = self.alarm.clone()
+        return alarm
+
 class DataTypeAlarm(BaseAlarm):
 
     def __init__(self):
@@ -250,6 +757,8 @@ class NumericAlarm(DataTypeAlarm):
     Check if message is numeric.
     """
 
+    numeric = True
+
     def checkDecodedMessage(self, dataIdentifier, data):
         try:
             num = float(data)
@@ -257,6 +766,9 @@ class NumericAlarm(DataTypeAlarm):
         except ValueError as ex:
             return True, "'{}' can't be decoded as numer".format(data)
 
+    def checkValue(self, dataIdentifier, value):
+        return False, None
+
     def getCriteria(self):
         return "Numbers only"
 
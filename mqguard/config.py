@@ -14,15 +14,36 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import configparser
+import re
 
 from mqreceive.broker import Broker
 from mqreceive.data import DataIdentifier
 
 from mqguard.alarms import *
-from mqguard.linereporting import PrintReporter, LogReporter
-from mqguard.streamreporting import SocketReporter, WebsocketReporter
-from mqguard.formatting import JSONFormatter, SystemDataProvider
+from mqguard.alarms import AlarmType, AlarmPriority, getFieldAccessor
 from mqguard.device import DevicePresence
+from mqguard.topics import isValidTopicFilter, isWildcardTopic, getWildcardLevels
+from mqguard.timeouts import isNumpyAvailable
+from mqguard.throttling import NotificationThrottle
+from mqguard.plugins import PluginRegistry, PluginException
+
+## Registry of reporter factories by reporter type. Factory is called with
+## ProgramConfig object and reporter section name. Reporter modules are imported
+## only when some reporter section uses them.
+reporterRegistry = PluginRegistry("mqguard.reporters", {
+    "socket": "mqguard.streamreporting:createSocketReporter",
+    "websocket": "mqguard.streamreporting:createWebsocketReporter",
+    "print": "mqguard.linereporting:createPrintReporter",
+    "log": "mqguard.linereporting:createLogReporter",
+    "database": "mqguard.dbreporting:createDatabaseReporter",
+    "http": "mqguard.httpreporting:createHTTPReporter",
+    "trigger": "mqguard.triggerreporting:createTriggerReporter",
+    "mail": "mqguard.mailreporting:createMailReporter",
+    "webhook": "mqguard.webhookreporting:createWebhookReporter"})
+
+## Registry of alarm factories referenced by update guard option Alarms. Factory
+## is called with ProgramConfig object and update guard section name.
+alarmRegistry = PluginRegistry("mqguard.alarms")
 
 class ProgramConfig:
     """!
@@ -44,21 +65,32 @@ class ProgramConfig:
         self.configFile = configFile
         self.parser = configparser.ConfigParser()
 
-    def parse(self):
+    def parse(self, runningConfig = None):
         """!
         Parse config file.
 
+        @param runningConfig Running ConfigCache object. Reporters with unchanged
+            sections are taken from it instead of being created again.
         @return Configuration object.
         """
         self.parser.read(self.configFile)
         self.checkForMandatorySections()
         configCache = ConfigCache()
+        self.getGlobalOptions(configCache)
+        configCache.addSignature("global", "Global",
+            self.getSectionSignature("Global") if self.parser.has_section("Global") else ())
         for broker, subscriptions in self.getBrokers():
             configCache.addBroker(broker, subscriptions)
+            configCache.addSignature("broker", broker.name, self.getSectionSignature(broker.name))
         for deviceName, presence, guards in self.getGuardedDevices():
             configCache.addDevice(deviceName, presence, guards)
-        for reporterName, reporterType, reporter in self.getReporters():
+            configCache.addSignature("device", deviceName, self.getDeviceSignature(deviceName))
+        for templateName, presence, nameFormat, guards in self.getDeviceTemplates():
+            configCache.addTemplate(templateName, presence, nameFormat, guards)
+            configCache.addSignature("template", templateName, self.getDeviceSignature(templateName))
+        for reporterName, reporterType, reporter in self.getReporters(runningConfig):
             configCache.addReporter(reporterName, reporterType, reporter)
+            configCache.addSignature("reporter", reporterName, self.getSectionSignature(reporterName))
         return configCache
 
     def checkForMandatorySections(self):
@@ -100,17 +132,87 @@ class ProgramConfig:
             self.checkForDeviceMandatoryOptions(deviceSection)
             yield self.createDevice(deviceSection)
 
-    def getReporters(self):
+    def getDeviceTemplates(self):
+        """!
+        Get iterable of device templates used for device discovery.
+
+        @throws ConfigException If some template section is missing.
+        """
+        section = "Devices"
+        if not self.parser.has_option(section, "Templates"):
+            return
+        templateSections = self.parser.get(section, "Templates").split()
+        self.checkForSectionList(templateSections)
+        for templateSection in templateSections:
+            self.checkForTemplateMandatoryOptions(templateSection)
+            yield self.createDeviceTemplate(templateSection)
+
+    def getReporters(self, runningConfig = None):
         """!
         Get iterable of enabled reporters.
+
+        @param runningConfig Running ConfigCache object or None. Reporter objects
+            of unchanged sections are reused, so reload doesn't open sockets or
+            create directories of reporters which stay running.
         """
         section = "Reporters"
         self.checkForEnabledOption(section)
         reporterSections = self.getEnabledSectionNames(section)
         self.checkForSectionList(reporterSections)
+        runningSignatures = runningConfig.getSignatures("reporter") if runningConfig is not None else {}
         for reporterSection in reporterSections:
             self.checkForReporterMandatoryOptions(reporterSection)
-            yield self.createReporter(reporterSection)
+            if runningSignatures.get(reporterSection) == self.getSectionSignature(reporterSection):
+                yield runningConfig.getReporter(reporterSection)
+            else:
+                yield self.createReporter(reporterSection)
+
+### Global #####################################################################
+
+    def getGlobalOptions(self, configCache):
+        """!
+        Read options of optional '[Global]' section.
+
+        @param configCache ConfigCache object to store options into.
+        @throws ConfigException If some option has invalid value.
+        """
+        section = "Global"
+        configCache.addGlobal("HistorySize", self.getNonNegativeInt(section, "HistorySize", 32))
+        configCache.addGlobal("ValueHistorySize", self.getNonNegativeInt(section, "ValueHistorySize", 0))
+        configCache.addGlobal("StatisticsInterval", self.getNonNegativeInt(section, "StatisticsInterval", 0))
+        configCache.addGlobal("FlapThreshold", self.getNonNegativeInt(section, "FlapThreshold", 0))
+        configCache.addGlobal("FlapWindow", self.getNonNegativeInt(section, "FlapWindow", 300))
+        configCache.addGlobal("ShutdownTimeout", self.getNonNegativeInt(section, "ShutdownTimeout", 10))
+        configCache.addGlobal("StateFile", self.parser.get(section, "StateFile", fallback = None))
+        timeoutTable = self.parser.get(section, "TimeoutTable", fallback = "no")
+        if timeoutTable not in ("no", "yes", "numpy"):
+            raise ConfigException("Section {}: unsupported TimeoutTable value: {}".format(section, timeoutTable))
+        if timeoutTable == "numpy" and not isNumpyAvailable():
+            raise ConfigException("Section {}: TimeoutTable requires NumPy, which is not installed".format(section))
+        configCache.addGlobal("TimeoutTable", timeoutTable)
+        ingest = self.parser.get(section, "Ingest", fallback = "threaded")
+        if ingest not in ("threaded", "asyncio"):
+            raise ConfigException("Section {}: unsupported Ingest value: {}".format(section, ingest))
+        configCache.addGlobal("Ingest", ingest)
+
+    def getNonNegativeInt(self, section, option, fallback):
+        """!
+        Get non-negative integer option.
+
+        @param section Section name.
+        @param option Option name.
+        @param fallback Value used if section or option is missing.
+        @return Integer value.
+        @throws ConfigException If value isn't non-negative integer.
+        """
+        try:
+            value = self.parser.getint(section, option, fallback = fallback)
+        except ValueError as ex:
+            raise ConfigException("Section {}: option {} can't be interpreted as number ({})".format(
+                section, option, self.parser.get(section, option)))
+        if value < 0:
+            raise ConfigException("Section {}: option {} can't be negative".format(section, option))
+        return value
 
 ### Broker #####################################################################
 
@@ -188,7 +290,7 @@ class ProgramConfig:
         presenceFactory = self.getDevicePresenceFactory(deviceSection)
         guardSection = self.parser.get(deviceSection, "Guard")
         self.checkForSection(guardSection)
-        guards = self.getDeviceGuards(guardSection)
+        guards = list(self.getDeviceGuards(guardSection))
         return (deviceName, presenceFactory, guards)
 
     def getDevicePresenceFactory(self, deviceSection):
@@ -212,14 +314,66 @@ class ProgramConfig:
             raise ConfigException("Device {}: 'PresenceOffline' value is missing".deviceSection)
         return (presenceOnline, presenceOffline)
 
+    def checkForTemplateMandatoryOptions(self, templateSection):
+        """!
+        Check for mandatory options of single device template section.
+        """
+        self.checkForOptionList(templateSection,
+            ["Guard", "PresenceTopic", "PresenceOnline", "PresenceOffline"])
+
+    def createDeviceTemplate(self, templateSection):
+        """!
+        Create device template from template section.
+
+        @param templateSection Template section name.
+        @return Tuple (templateName, presenceFactory, nameFormat, guards).
+        @throws ConfigException If presence topic doesn't contain wildcards.
+        @throws ConfigException If name or guard topic refers to level not matched
+            by presence topic wildcards.
+        """
+        presenceFactory = self.getDevicePresenceFactory(templateSection)
+        if not isWildcardTopic(presenceFactory.presenceTopic):
+            raise ConfigException("Section {}: template presence topic must contain wildcards".format(templateSection))
+        # Presence filter matches itself, wildcards capture themselves as levels.
+        levels = getWildcardLevels(presenceFactory.presenceTopic, presenceFactory.presenceTopic)
+        nameFormat = self.parser.get(templateSection, "Name", fallback = None)
+        if nameFormat is not None:
+            self.checkTemplateFormat(templateSection, nameFormat, levels)
+        guardSection = self.parser.get(templateSection, "Guard")
+        self.checkForSection(guardSection)
+        guards = list(self.getDeviceGuards(guardSection))
+        for guardName, (brokerName, topicFormat), alarms in guards:
+            self.checkTemplateFormat(guardSection, topicFormat, levels)
+        return (templateSection, presenceFactory, nameFormat, guards)
+
+    def checkTemplateFormat(self, section, formatString, levels):
+        """!
+        Check if format string of device template can be filled with matched
+        topic levels.
+
+        @param section Section name.
+        @param formatString Device name or guard topic format string.
+        @param levels Topic levels matched by presence topic wildcards.
+        @throws ConfigException If format string is invalid or refers to missing level.
+        """
+        try:
+            formatString.format(*levels)
+        except (IndexError, KeyError, ValueError, AttributeError) as ex:
+            raise ConfigException("Section {}: invalid template format {}, presence topic has {} wildcards ({})".format(
+                section, formatString, len(levels), ex))
+
     def getDeviceGuards(self, guardSection):
         """!
         Get update guards specified in single guard section
         """
         for updateGuardLine in self.parser.options(guardSection):
             brokerName, topic = updateGuardLine.split()
-            updateGuardSection = self.parser.get(guardSection, updateGuardLine)
-            updateGuard = self.createUpdateGuard(updateGuardSection)
+            if not isValidTopicFilter(topic):
+                raise ConfigException("Section {}: invalid topic filter: {}".format(guardSection, topic))
+            updateGuard = []
+            # Single topic may be checked by several update sections, e.g. for different JSON fields.
+            for updateGuardSection in self.parser.get(guardSection, updateGuardLine).split():
+                updateGuard.extend(self.createUpdateGuard(updateGuardSection))
             yield (guardSection, (brokerName, topic), updateGuard)
 
     def createUpdateGuard(self, updateGuardSection):
@@ -228,17 +382,76 @@ class ProgramConfig:
         alarms = self.createUpdateAlarms(updateGuardSection)
         if len(alarms) == 0:
             raise ConfigException("Update guard {} doesn't specify any alarms", updateGuardSection)
+        if len(alarms) > 1 and any(alarm.aggregate for alarm in alarms):
+            # Aggregated guard keeps single state for all topics, other alarms would lose per topic state.
+            raise ConfigException("Section {}: RateAggregate can't be combined with other alarm options".format(
+                updateGuardSection))
+        if self.parser.has_option(updateGuardSection, "Field"):
+            alarms = self.createFieldAlarms(updateGuardSection, alarms)
         return alarms
 
+    def createFieldAlarms(self, updateGuardSection, alarms):
+        """!
+        Apply value alarms to field of JSON message. Timing alarms are kept for
+        whole message.
+
+        @param updateGuardSection Update guard section name.
+        @param alarms List of alarms of update section.
+        @return List of alarms.
+        @throws ConfigException If field path or size limit is invalid.
+        """
+        path = self.parser.get(updateGuardSection, "Field")
+        try:
+            getFieldAccessor(path)
+        except ValueError as ex:
+            raise ConfigException("Section {}: invalid Field option ({})".format(updateGuardSection, ex))
+        try:
+            maxSize = self.parser.getint(updateGuardSection, "FieldMaxSize", fallback = 65536)
+        except ValueError as ex:
+            raise ConfigException("Section {}: option FieldMaxSize can't be interpreted as number ({})".format(
+                updateGuardSection, self.parser.get(updateGuardSection, "FieldMaxSize")))
+        fieldAlarms = []
+        for alarm in alarms:
+            if alarm.alarmType is AlarmType.messageDriven and alarm.alarmPriority is not AlarmPriority.other:
+                fieldAlarms.append(JSONFieldAlarm(path, alarm, maxSize))
+            else:
+                fieldAlarms.append(alarm)
+        return fieldAlarms
+
     def createUpdateAlarms(self, updateGuardSection):
         alarmsBuilder = AlarmBuilder()
         alarmsBuilder.add(self.getDataTypeAlarm(updateGuardSection))
         alarmsBuilder.add(self.getRangeAlarm(updateGuardSection))
+        alarmsBuilder.add(self.getAnomalyAlarm(updateGuardSection))
+        alarmsBuilder.add(self.getDerivativeAlarm(updateGuardSection))
         alarmsBuilder.add(self.getPeriodMinAlarm(updateGuardSection))
+        alarmsBuilder.add(self.getRateAlarm(updateGuardSection))
         alarmsBuilder.add(self.getPeriodMaxAlarm(updateGuardSection))
         alarmsBuilder.add(self.getErrorCodesAlarm(updateGuardSection))
+        alarmsBuilder.add(self.getRegexAlarm(updateGuardSection))
+        alarmsBuilder.add(self.getEnumerationAlarm(updateGuardSection))
+        for alarm in self.getPluginAlarms(updateGuardSection):
+            alarmsBuilder.add(alarm)
         return alarmsBuilder.getAlarms()
 
+    def getPluginAlarms(self, updateGuardSection):
+        """!
+        Create alarms listed in Alarms option. Alarm plugins read their own options
+        of update guard section.
+
+        @param updateGuardSection Update guard section name.
+        @return List of alarms.
+        @throws ConfigException If some alarm plugin can't be loaded.
+        """
+        alarms = []
+        for alarmName in self.parser.get(updateGuardSection, "Alarms", fallback = "").split():
+            try:
+                factory = alarmRegistry.load(alarmName)
+            except PluginException as ex:
+                raise ConfigException("Section {}: {}".format(updateGuardSection, ex))
+            alarms.append(factory(self, updateGuardSection))
+        return alarms
+
     def getDataTypeAlarm(self, updateGuardSection):
         if self.parser.has_option(updateGuardSection, "Type"):
             dataTypeAlarmName = self.parser.get(updateGuardSection, "Type")
@@ -267,15 +480,57 @@ class ProgramConfig:
             minRange = self.parser.getfloat(updateGuardSection, "ValidRangeMin")
         if hasMaxRange:
             maxRange = self.parser.getfloat(updateGuardSection, "ValidRangeMax")
+        hysteresis = self.getRangeHysteresis(updateGuardSection)
         if hasMinRange and hasMaxRange:
-            return RangeAlarm.atInterval(minRange, maxRange)
+            if maxRange - minRange < 2 * hysteresis:
+                raise ConfigException("Section {}: ValidRangeHysteresis is wider than half of valid range".format(
+                    updateGuardSection))
+            return RangeAlarm.atInterval(minRange, maxRange, hysteresis)
         elif hasMinRange:
-            return RangeAlarm.lowerLimit(minRange)
+            return RangeAlarm.lowerLimit(minRange, hysteresis)
         elif hasMaxRange:
-            return RangeAlarm.upperLimit(maxRange)
+            return RangeAlarm.upperLimit(maxRange, hysteresis)
         else:
             return None
 
+    def getRangeHysteresis(self, updateGuardSection):
+        try:
+            hysteresis = self.parser.getfloat(updateGuardSection, "ValidRangeHysteresis", fallback = 0.0)
+        except ValueError as ex:
+            raise ConfigException("Section {}: option ValidRangeHysteresis can't be interpreted as number ({})".format(
+                updateGuardSection, self.parser.get(updateGuardSection, "ValidRangeHysteresis")))
+        if hysteresis < 0:
+            raise ConfigException("Section {}: option ValidRangeHysteresis can't be negative".format(updateGuardSection))
+        return hysteresis
+
+    def getAnomalyAlarm(self, updateGuardSection):
+        if not self.parser.has_option(updateGuardSection, "AnomalyThreshold"):
+            return None
+        try:
+            threshold = self.parser.getfloat(updateGuardSection, "AnomalyThreshold")
+            alpha = self.parser.getfloat(updateGuardSection, "AnomalyAlpha", fallback = None)
+            warmup = self.parser.getint(updateGuardSection, "AnomalyWarmup", fallback = 10)
+        except ValueError as ex:
+            raise ConfigException("Section {}: anomaly options can't be interpreted as numbers".format(
+                updateGuardSection))
+        if threshold <= 0:
+            raise ConfigException("Section {}: AnomalyThreshold must be positive".format(updateGuardSection))
+        if alpha is None:
+            return AnomalyAlarm.cumulative(threshold, warmup)
+        if not 0 < alpha <= 1:
+            raise ConfigException("Section {}: AnomalyAlpha must be from interval (0, 1]".format(updateGuardSection))
+        return AnomalyAlarm.exponential(threshold, alpha, warmup)
+
+    def getDerivativeAlarm(self, updateGuardSection):
+        if not self.parser.has_option(updateGuardSection, "ChangeRateMax"):
+            return None
+        try:
+            maxRate = self.parser.getfloat(updateGuardSection, "ChangeRateMax")
+        except ValueError as ex:
+            raise ConfigException("Section {}: option ChangeRateMax can't be interpreted as number ({})".format(
+                updateGuardSection, self.parser.get(updateGuardSection, "ChangeRateMax")))
+        return DerivativeAlarm(maxRate)
+
     def getPeriodMinAlarm(self, updateGuardSection):
         periodMinOption = "PeriodMin"
         if self.parser.has_option(updateGuardSection, periodMinOption):
@@ -290,6 +545,22 @@ class ProgramConfig:
         else:
             return None
 
+    def getRateAlarm(self, updateGuardSection):
+        if not self.parser.has_option(updateGuardSection, "RateMax"):
+            return None
+        try:
+            rateMax = self.parser.getint(updateGuardSection, "RateMax")
+            rateWindow = self.parser.getfloat(updateGuardSection, "RateWindow", fallback = 1.0)
+            aggregate = self.parser.getboolean(updateGuardSection, "RateAggregate", fallback = False)
+        except ValueError as ex:
+            raise ConfigException("Section {}: rate options can't be interpreted ({})".format(
+                updateGuardSection, ex))
+        if rateMax < 1 or rateWindow <= 0:
+            raise ConfigException("Section {}: RateMax and RateWindow must be positive".format(updateGuardSection))
+        if aggregate:
+            return RateAlarm.aggregated(rateMax, rateWindow)
+        return RateAlarm.fromSeconds(rateMax, rateWindow)
+
     def getPeriodMaxAlarm(self, updateGuardSection):
         periodMaxOption = "PeriodMax"
         if self.parser.has_option(updateGuardSection, periodMaxOption):
@@ -311,6 +582,25 @@ class ProgramConfig:
         else:
             return None
 
+    def getRegexAlarm(self, updateGuardSection):
+        if not self.parser.has_option(updateGuardSection, "Regex"):
+            return None
+        lines = self.parser.get(updateGuardSection, "Regex").splitlines()
+        patterns = [line.strip() for line in lines if len(line.strip()) > 0]
+        if len(patterns) == 0:
+            raise ConfigException("Section {}: option Regex is empty".format(updateGuardSection))
+        try:
+            return RegexAlarm(patterns)
+        except re.error as ex:
+            raise ConfigException("Section {}: invalid regular expression: {}".format(updateGuardSection, ex))
+
+    def getEnumerationAlarm(self, updateGuardSection):
+        if self.parser.has_option(updateGuardSection, "AllowedValues"):
+            values = self.parser.get(updateGuardSection, "AllowedValues").split()
+            return EnumerationAlarm(values)
+        else:
+            return None
+
 ### Reporter ###################################################################
 
     def checkForReporterMandatoryOptions(self, reporterSection):
@@ -325,41 +615,75 @@ class ProgramConfig:
         """
         reporterName = reporterSection
         reporterType = self.parser.get(reporterSection, "Type")
-        reporter = None
-        if reporterType == "socket":
-            reporter = self.createSocketReporter(reporterSection)
-        elif reporterType == "websocket":
-            reporter = self.createWebsocketReporter(reporterSection)
-        elif reporterType == "print":
-            reporter = self.createPrintReporter(reporterSection)
-        elif reporterType == "log":
-            reporter = self.createLogReporter(reporterSection)
-        else:
-            raise ConfigException("Unsupported reporter type: {}".format(reporterType))
+        try:
+            factory = reporterRegistry.load(reporterType)
+        except PluginException as ex:
+            raise ConfigException("Section {}: unsupported reporter type: {}".format(reporterSection, ex))
+        reporter = factory(self, reporterSection)
         return (reporterName, reporterType, reporter)
 
-    def createSocketReporter(self, reporterSection):
-        """!
-        Create socket reporter.
-        """
-        listenAddress = self.getListenAddress(reporterSection)
-        return SocketReporter(None, JSONFormatter(SystemDataProvider()), listenAddress)
-
-    def createWebsocketReporter(self, reporterSection):
-        listenAddress = self.getListenAddress(reporterSection)
-        return WebsocketReporter(None, JSONFormatter(SystemDataProvider()), listenAddress)
-
     def getListenAddress(self, reporterSection):
         listenAddress = self.parser.get(reporterSection, "ListenAddress")
         listenPort = self.parser.getint(reporterSection, "ListenPort")
         return listenAddress, listenPort
 
-    def createPrintReporter(self, reporterSection):
-        return PrintReporter(None)
+### Signatures #################################################################
+
+    def getSectionSignature(self, section):
+        """!
+        Get comparable representation of single section. Signatures are used for
+        detecting changes between two versions of configuration file.
+
+        @param section Section name.
+        @return Tuple of section (option, value) pairs.
+        """
+        return tuple(sorted(self.parser.items(section, raw = True)))
+
+    def getDeviceSignature(self, deviceSection):
+        """!
+        Get comparable representation of device or device template section.
+
+        @param deviceSection Device section name.
+        @return Tuple (presenceSignature, guardSignatures).
+            @li presenceSignature Device section signature without 'Guard' option.
+            @li guardSignatures Mapping (brokerName, topic) : update guard signature.
+        """
+        presenceSignature = tuple(
+            (option, value) for option, value in self.getSectionSignature(deviceSection)
+                if option != "guard")
+        guardSection = self.parser.get(deviceSection, "Guard")
+        guardSignatures = {}
+        for updateGuardLine in self.parser.options(guardSection):
+            brokerName, topic = updateGuardLine.split()
+            updateGuardSections = self.parser.get(guardSection, updateGuardLine).split()
+            guardSignatures[(brokerName, topic)] = tuple(
+                self.getUpdateGuardSignature(updateGuardSection) for updateGuardSection in updateGuardSections)
+        return presenceSignature, guardSignatures
 
-    def createLogReporter(self, reporterSection):
-        logfile = self.parser.get(reporterSection, "File")
-        return LogReporter(None, logfile);
+    def getUpdateGuardSignature(self, updateGuardSection):
+        """!
+        Get comparable representation of update guard section.
+
+        @param updateGuardSection Update guard section name.
+        @return Update guard signature.
+        """
+        return (updateGuardSection, self.getSectionSignature(updateGuardSection))
+
+    def createNotificationThrottle(self, reporterSection):
+        """!
+        Create notification throttle of throttled reporter.
+
+        @param reporterSection Reporter section name.
+        @return NotificationThrottle object.
+        @throws ConfigException If some option isn't non-negative integer.
+        """
+        deviceLimit = self.getNonNegativeInt(reporterSection, "DeviceRateLimit", 10)
+        globalLimit = self.getNonNegativeInt(reporterSection, "GlobalRateLimit", 100)
+        ratePeriod = self.getNonNegativeInt(reporterSection, "RateLimitPeriod", 3600)
+        digestInterval = self.getNonNegativeInt(reporterSection, "DigestInterval", 300)
+        if ratePeriod == 0:
+            raise ConfigException("Section {}: option RateLimitPeriod must be positive".format(reporterSection))
+        return NotificationThrottle(deviceLimit, globalLimit, ratePeriod, digestInterval)
 
 ### Common #####################################################################
 
@@ -434,7 +758,22 @@ class ConfigCache:
     def __init__(self):
         self.brokers = []
         self.devices = []
+        self.templates = []
         self.reporters = []
+        self.signatures = {}
+        self.globals = {}
+
+    def addGlobal(self, option, value):
+        self.globals[option] = value
+
+    def getGlobal(self, option):
+        """!
+        Get value of global option.
+
+        @param option Option name.
+        @return Option value.
+        """
+        return self.globals[option]
 
     def addBroker(self, broker, subscriptions):
         self.brokers.append((broker, subscriptions))
@@ -442,9 +781,57 @@ class ConfigCache:
     def addDevice(self, deviceName, presence, guards):
         self.devices.append((deviceName, presence, guards))
 
+    def addTemplate(self, templateName, presence, nameFormat, guards):
+        self.templates.append((templateName, presence, nameFormat, guards))
+
     def addReporter(self, reporterName, reporterType, reporter):
         self.reporters.append((reporterName, reporterType, reporter))
 
+    def addSignature(self, kind, name, signature):
+        """!
+        Store signature of configuration section.
+
+        @param kind Section kind: "global", "broker", "device", "template" or "reporter".
+        @param name Section name.
+        @param signature Section signature.
+        """
+        self.signatures.setdefault(kind, {})[name] = signature
+
+    def getSignatures(self, kind):
+        """!
+        Get signatures of all sections of given kind.
+
+        @param kind Section kind.
+        @return Mapping name : signature.
+        """
+        return self.signatures.get(kind, {})
+
+    def getDevice(self, deviceName):
+        """!
+        Get device configuration tuple.
+
+        @param deviceName Device name.
+        @return Tuple (deviceName, presenceFactory, guards).
+        @throws ConfigException If device isn't configured.
+        """
+        for device in self.devices:
+            if device[0] == deviceName:
+                return device
+        raise ConfigException("Unknown device name: {}".format(deviceName))
+
+    def getReporter(self, reporterName):
+        """!
+        Get reporter configuration tuple.
+
+        @param reporterName Reporter name.
+        @return Tuple (reporterName, reporterType, reporter).
+        @throws ConfigException If reporter isn't configured.
+        """
+        for reporter in self.reporters:
+            if reporter[0] == reporterName:
+                return reporter
+        raise ConfigException("Unknown reporter name: {}".format(reporterName))
+
     def getBrokerByName(self, brokerName):
         """!
         Get broker object identified by its't name.
@@ -0,0 +1,233 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""!
+Reporting into SQLite database.
+"""
+
+import sqlite3
+import sys
+import time
+
+from mqguard.reporting import BaseReporter, BatchQueue
+from mqguard.config import ConfigException
+
+class DatabaseReporter(BaseReporter):
+    """!
+    Store alarm transitions and presence changes into SQLite database. Rows are
+    inserted by reporter thread in batched transactions, reporting only queues them.
+    """
+
+    ## @var database
+    # Path to database file.
+
+    ## @var queue
+    # BatchQueue of row lists. Single item holds rows of one device report.
+
+    ## @var batchSize
+    # Maximum number of queued reports inserted in single transaction.
+
+    ## @var flushInterval
+    # Maximum time in seconds row stays in queue.
+
+    ## @var retryCount
+    # Number of repeated inserts of batch after database error. Batch is dropped
+    # when all of them fail.
+
+    ## @var retryDelay
+    # Delay in seconds before first repeated insert. Delay doubles with every
+    # following attempt.
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS alarm_transitions (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            device TEXT NOT NULL,
+            broker TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            alarm TEXT NOT NULL,
+            active INTEGER NOT NULL,
+            message TEXT)""",
+        """CREATE TABLE IF NOT EXISTS presence_changes (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            device TEXT NOT NULL,
+            broker TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            active INTEGER NOT NULL,
+            message TEXT)""",
+        "CREATE INDEX IF NOT EXISTS alarm_transitions_device ON alarm_transitions (device, time)",
+        "CREATE INDEX IF NOT EXISTS alarm_transitions_topic ON alarm_transitions (broker, topic, time)",
+        "CREATE INDEX IF NOT EXISTS alarm_transitions_time ON alarm_transitions (time)",
+        "CREATE INDEX IF NOT EXISTS presence_changes_device ON presence_changes (device, time)",
+        "CREATE INDEX IF NOT EXISTS presence_changes_topic ON presence_changes (broker, topic, time)",
+        "CREATE INDEX IF NOT EXISTS presence_changes_time ON presence_changes (time)"]
+
+    insertAlarm = """INSERT INTO alarm_transitions (time, device, broker, topic, alarm, active, message)
+        VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+    insertPresence = """INSERT INTO presence_changes (time, device, broker, topic, active, message)
+        VALUES (?, ?, ?, ?, ?, ?)"""
+
+    def __init__(self, synchronizer, database, queueSize = 1000000, batchSize = 10000, flushInterval = 1,
+            retryCount = 3, retryDelay = 1):
+        """!
+        Initialize database reporter.
+
+        @param synchronizer
+        @param database Path to SQLite database file.
+        @param queueSize Maximum number of queued reports. Reports are dropped when queue is full.
+        @param batchSize Maximum number of reports inserted in single transaction.
+        @param flushInterval Maximum time in seconds report stays in queue.
+        @param retryCount Number of repeated inserts of batch after database error.
+        @param retryDelay Delay in seconds before first repeated insert.
+        """
+        BaseReporter.__init__(self, synchronizer)
+        self.database = database
+        self.queue = BatchQueue(queueSize)
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.retryCount = retryCount
+        self.retryDelay = retryDelay
+
+    def report(self, deviceReport):
+        """!
+        @copydoc BaseReporter::report()
+        """
+        if not deviceReport.hasChanges():
+            return
+        now = time.time()
+        alarmRows = []
+        presenceRows = []
+        for dataIdentifier, alarm, report in deviceReport.getAlarmChanges():
+            active, _, _, message = report
+            alarmRows.append((now, deviceReport.device, dataIdentifier.broker.name,
+                dataIdentifier.topic, alarm.getName(), int(active), message))
+        if deviceReport.hasPresenceChange():
+            devicePresence, track = deviceReport.getPresence()
+            active, _, _, message = track
+            dataIdentifier = devicePresence.getDataIdentifier()
+            presenceRows.append((now, deviceReport.device, dataIdentifier.broker.name,
+                dataIdentifier.topic, int(active), message))
+        self.queue.put((alarmRows, presenceRows))
+
+    def __call__(self):
+        """!
+        Run database writer.
+        """
+        self.running = True
+        connection = None
+        try:
+            try:
+                connection = self.connect()
+            except sqlite3.Error as ex:
+                print("{}: database can't be opened: {}".format(self.__class__.__name__, ex), file=sys.stderr)
+            while not self.queue.isDrained():
+                batch = self.queue.getBatch(self.batchSize, self.flushInterval)
+                if len(batch) > 0:
+                    connection = self.writeBatch(connection, batch)
+                dropped = self.queue.takeDropped()
+                if dropped > 0:
+                    print("{}: {} reports dropped, queue is full".format(self.__class__.__name__, dropped),
+                        file=sys.stderr)
+        finally:
+            if connection is not None:
+                connection.close()
+            self.running = False
+
+    def stop(self):
+        """!
+        Stop database writer. Already queued reports are inserted.
+        """
+        self.queue.close()
+
+    def connect(self):
+        """!
+        Open database connection and create schema.
+
+        @return Database connection object.
+        """
+        connection = sqlite3.connect(self.database)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        with connection:
+            for statement in self.schema:
+                connection.execute(statement)
+        return connection
+
+    def writeBatch(self, connection, batch):
+        """!
+        Insert batch of reports. Database errors don't stop the writer, connection
+        is reopened and insert is repeated with growing delay. Batch is dropped
+        when all attempts fail.
+
+        @param connection Database connection object or None if database isn't
+            connected.
+        @param batch List of (alarmRows, presenceRows) tuples.
+        @return Database connection object or None if database isn't connected.
+        """
+        for attempt in range(self.retryCount + 1):
+            if attempt > 0:
+                time.sleep(self.retryDelay * 2 ** (attempt - 1))
+            try:
+                if connection is None:
+                    connection = self.connect()
+                self.insertBatch(connection, batch)
+                return connection
+            except sqlite3.Error as ex:
+                print("{}: insert of {} reports failed: {}".format(self.__class__.__name__, len(batch), ex),
+                    file=sys.stderr)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+        print("{}: {} reports dropped, database is not writable".format(self.__class__.__name__, len(batch)),
+            file=sys.stderr)
+        return None
+
+    def insertBatch(self, connection, batch):
+        """!
+        Insert batch of reports in single transaction.
+
+        @param connection Database connection object.
+        @param batch List of (alarmRows, presenceRows) tuples.
+        """
+        alarmRows = []
+        presenceRows = []
+        for reportAlarmRows, reportPresenceRows in batch:
+            alarmRows.extend(reportAlarmRows)
+            presenceRows.extend(reportPresenceRows)
+        with connection:
+            if len(alarmRows) > 0:
+                connection.executemany(self.insertAlarm, alarmRows)
+            if len(presenceRows) > 0:
+                connection.executemany(self.insertPresence, presenceRows)
+
+def createDatabaseReporter(config, reporterSection):
+    """!
+    Create DatabaseReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return DatabaseReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    database = config.parser.get(reporterSection, "File")
+    try:
+        queueSize = config.parser.getint(reporterSection, "QueueSize", fallback = 1000000)
+        batchSize = config.parser.getint(reporterSection, "BatchSize", fallback = 10000)
+    except ValueError as ex:
+        raise ConfigException("Section {}: {}".format(reporterSection, ex))
+    return DatabaseReporter(None, database, queueSize, batchSize)
@@ -0,0 +1,121 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""!
+Automatic device discovery.
+"""
+
+from mqreceive.data import DataIdentifier
+
+from mqguard.alarms import PresenceAlarm
+from mqguard.device import DevicePresence
+from mqguard.supervising import DeviceGuard, UpdateGuard
+from mqguard.topics import getWildcardLevels
+
+class DeviceTemplate:
+    """!
+    Template for devices discovered at runtime. Device is created when presence
+    message is received on topic matching template presence topic filter.
+
+    Topic levels matched by presence filter wildcards are used to create device
+    name and topics of device update guards. Guard topics and name format may
+    refer these levels by their position, e.g. `{0}/temperature`.
+    """
+
+    ## @var name
+    # Template name.
+
+    ## @var presenceDataIdentifier
+    # DataIdentifier object with wildcard presence topic filter.
+
+    ## @var presenceValues
+    # Tuple of presence online and offline messages.
+
+    ## @var nameFormat
+    # Device name format string or None.
+
+    ## @var guards
+    # List of tuples (guardName, broker, topicFormat, alarms).
+
+    def __init__(self, name, presenceDataIdentifier, presenceValues, nameFormat, guards):
+        """!
+        Initiate device template.
+
+        @param name Template name.
+        @param presenceDataIdentifier DataIdentifier object with wildcard presence topic filter.
+        @param presenceValues Tuple of presence online and offline messages.
+        @param nameFormat Device name format string. If None, matched topic levels
+            joined with '-' are used as device name.
+        @param guards List of tuples (guardName, broker, topicFormat, alarms). Alarms
+            are used as prototypes, every device gets their clones.
+        """
+        self.name = name
+        self.presenceDataIdentifier = presenceDataIdentifier
+        self.presenceValues = presenceValues
+        self.nameFormat = nameFormat
+        self.guards = guards
+
+    def getTopicLevels(self, dataIdentifier):
+        """!
+        Get topic levels matched by presence filter wildcards.
+
+        @param dataIdentifier Presence DataIdentifier object.
+        @return List of topic levels or None if topic doesn't match.
+        """
+        return getWildcardLevels(self.presenceDataIdentifier.topic, dataIdentifier.topic)
+
+    def createDeviceName(self, levels):
+        """!
+        Create device name.
+
+        @param levels Topic levels matched by presence filter wildcards.
+        @return Device name.
+        """
+        if self.nameFormat is None:
+            return "-".join(levels)
+        return self.nameFormat.format(*levels)
+
+    def build(self, dataIdentifier):
+        """!
+        Build device from template.
+
+        @param dataIdentifier Concrete presence DataIdentifier object.
+        @return Tuple (deviceName, DeviceGuard).
+        """
+        levels = self.getTopicLevels(dataIdentifier)
+        deviceName = self.createDeviceName(levels)
+        deviceGuard = DeviceGuard()
+        deviceGuard.addPresenceGuard(
+            DevicePresence(dataIdentifier, self.presenceValues),
+            self.createPresenceGuard(deviceName, dataIdentifier))
+        for guardName, broker, topicFormat, alarms in self.guards:
+            updateGuard = UpdateGuard(guardName, DataIdentifier(broker, topicFormat.format(*levels)))
+            for alarm in alarms:
+                updateGuard.addAlarm(alarm.clone())
+            deviceGuard.addUpdateGuard(updateGuard)
+        return deviceName, deviceGuard
+
+    def createPresenceGuard(self, deviceName, dataIdentifier):
+        """!
+        Create presence update guard of discovered device.
+
+        @param deviceName Device name.
+        @param dataIdentifier Concrete presence DataIdentifier object.
+        @return UpdateGuard object.
+        """
+        presenceGuard = UpdateGuard(deviceName, dataIdentifier)
+        presenceGuard.addAlarm(PresenceAlarm(self.presenceValues))
+        return presenceGuard
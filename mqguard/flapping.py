@@ -0,0 +1,147 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Flap damping of alarm state transitions.
+"""
+
+import collections
+
+class FlapDetector:
+    """!
+    Detect alarms changing state too often. Alarm with at least threshold state
+    changes within time window is flapping. Flapping alarm is held active and its
+    further state changes are suppressed. Alarm settles when number of state changes
+    within window drops below half of threshold, then its real state is reported.
+
+    Only alarms with some recent state change have flap state, so stable alarms
+    cost single dictionary lookup.
+    """
+
+    ## @var threshold
+    # Number of state changes within window which make alarm flapping.
+
+    ## @var window
+    # Length of observed time window in seconds.
+
+    ## @var states
+    # Mapping device : {(DataIdentifier, alarm) : FlapState}.
+
+    def __init__(self, threshold, window):
+        """!
+        Initiate flap detector.
+
+        @param threshold Number of state changes within window which make alarm flapping.
+        @param window Length of time window in seconds.
+        """
+        self.threshold = threshold
+        self.window = window
+        self.states = {}
+
+    def getFlappingMessage(self):
+        """!
+        Get message of flapping alarm.
+
+        @return Message string.
+        """
+        return "Flapping: state changed at least {} times in {} seconds".format(self.threshold, self.window)
+
+    def update(self, device, dataIdentifier, alarm, wasActive, active, message, now):
+        """!
+        Record new alarm state and get state which should be reported.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param alarm Alarm object.
+        @param wasActive Currently reported alarm state.
+        @param active New alarm state.
+        @param message New alarm message.
+        @param now Current monotonic time in seconds.
+        @return Tuple (active, message) of reported alarm state.
+        """
+        key = dataIdentifier, alarm
+        deviceStates = self.states.get(device)
+        state = deviceStates.get(key) if deviceStates is not None else None
+        if state is None:
+            if active == wasActive:
+                return active, message
+            state = FlapState(wasActive)
+            self.states.setdefault(device, {})[key] = state
+        if active != state.active:
+            state.transitions.append(now)
+        state.active = active
+        state.message = message
+        self.expire(state, now)
+        if not state.flapping and len(state.transitions) >= self.threshold:
+            state.flapping = True
+        if state.flapping:
+            return True, self.getFlappingMessage()
+        return active, message
+
+    def expire(self, state, now):
+        """!
+        Forget state changes older than time window.
+
+        @param state FlapState object.
+        @param now Current monotonic time in seconds.
+        """
+        limit = now - self.window
+        transitions = state.transitions
+        while len(transitions) > 0 and transitions[0] < limit:
+            transitions.popleft()
+
+    def getSettled(self, now):
+        """!
+        Get alarms which stopped flapping. States of alarms without recent state
+        changes are forgotten.
+
+        @param now Current monotonic time in seconds.
+        @return List of tuples (device, dataIdentifier, alarm, active, message) with
+            real state of settled alarms.
+        """
+        settled = []
+        for device, deviceStates in list(self.states.items()):
+            for key, state in list(deviceStates.items()):
+                self.expire(state, now)
+                if state.flapping and len(state.transitions) < max(1, self.threshold // 2):
+                    state.flapping = False
+                    dataIdentifier, alarm = key
+                    settled.append((device, dataIdentifier, alarm, state.active, state.message))
+                if not state.flapping and len(state.transitions) == 0:
+                    del deviceStates[key]
+            if len(deviceStates) == 0:
+                del self.states[device]
+        return settled
+
+    def forgetDevice(self, device):
+        """!
+        Forget flap states of device alarms.
+
+        @param device Device identifier.
+        """
+        self.states.pop(device, None)
+
+class FlapState:
+    """!
+    Recent state changes of single alarm.
+    """
+
+    __slots__ = ("active", "message", "transitions", "flapping")
+
+    def __init__(self, active):
+        self.active = active
+        self.message = None
+        self.transitions = collections.deque()
+        self.flapping = False
@@ -32,6 +32,14 @@ class FormatDataProvider:
         @return Iterable of tuples (device, guard).
         """
 
+    def getBrokerStatistics(self, broker):
+        """!
+        Get traffic counters of broker.
+
+        @return BrokerStatistics object or None if traffic isn't counted.
+        """
+        return None
+
     def injectSystemClass(self, systemClass):
         """!
         """
@@ -50,6 +58,9 @@ class SystemDataProvider(FormatDataProvider):
     def getDevices(self):
         return self.systemClass.getDeviceGuards()
 
+    def getBrokerStatistics(self, broker):
+        return self.systemClass.getIngestStatistics().getBroker(broker)
+
 class BaseFormatter:
     """!
     Formatter base class
@@ -72,22 +83,113 @@ class JSONFormatter(BaseFormatter):
         self.deviceInitFormatting = JSONDevicesInitFormatting(dataProvider)
         self.brokerInitFormatting = JSONBrokersInitFromatting(dataProvider)
         self.deviceUpdateFormatting = JSONDevicesUpdateFormatting()
+        self.historyFormatting = JSONHistoryFormatting()
 
-    def formatInitialData(self, deviceReports):
+    def formatInitialData(self, deviceReports, sequence = None, stream = None):
         """!
         Get string to initiate session.
+
+        @param deviceReports Mapping device : DeviceReport.
+        @param sequence Sequence number of last report included in data, or None.
+        @param stream Identifier of report stream, or None.
         """
-        return self.encoder.encode({
+        document = {
             "feed": "init",
             "devices": self.deviceInitFormatting.formatInitialData(deviceReports),
-            "brokers": self.brokerInitFormatting.formatInitialData(deviceReports)})
+            "brokers": self.brokerInitFormatting.formatInitialData(deviceReports)}
+        if sequence is not None:
+            document["seq"] = sequence
+            document["stream"] = stream
+        return self.encoder.encode(document)
 
-    def formatDeviceReport(self, deviceReport):
+    def formatDeviceReport(self, deviceReport, sequence = None):
+        """!
+        Format single device report as update.
+
+        @param deviceReport DeviceReport object.
+        @param sequence Report sequence number, or None.
+        """
+        document = {
+            "feed": "update",
+            "devices": self.deviceUpdateFormatting.formatDeviceReport(deviceReport)}
+        if sequence is not None:
+            document["seq"] = sequence
+        return self.encoder.encode(document)
+
+    def formatDeviceReports(self, deviceReports):
         """!
+        Format batch of device reports as single update.
+
+        @param deviceReports Iterable of DeviceReport objects.
         """
+        devices = []
+        for deviceReport in deviceReports:
+            devices.extend(self.deviceUpdateFormatting.formatDeviceReport(deviceReport))
         return self.encoder.encode({
             "feed": "update",
-            "devices": self.deviceUpdateFormatting.formatDeviceReport(deviceReport)})
+            "devices": devices})
+
+    def formatHistory(self, device, transitions):
+        """!
+        Format alarm history of device.
+
+        @param device Device identifier.
+        @param transitions Iterable of tuples (timestamp, dataIdentifier, alarmName, active, message).
+        """
+        return self.encoder.encode({
+            "feed": "history",
+            "device": device,
+            "transitions": self.historyFormatting.formatTransitions(transitions)})
+
+    def formatValues(self, device, dataIdentifier, values):
+        """!
+        Format recent numeric values of device data identifier.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param values Iterable of tuples (timestamp, value).
+        """
+        return self.encoder.encode({
+            "feed": "values",
+            "device": device,
+            "dataIdentifier": self.historyFormatting.formatDataIdentifier(dataIdentifier),
+            "values": self.historyFormatting.formatValues(values)})
+
+    def formatError(self, message):
+        """!
+        Format error response to client request.
+
+        @param message Error message.
+        """
+        return self.encoder.encode({
+            "feed": "error",
+            "message": message})
+
+    def formatCompression(self, compression):
+        """!
+        Format answer to compression request.
+
+        @param compression Accepted compression method, "none" if request is refused.
+        """
+        return self.encoder.encode({
+            "feed": "compression",
+            "compression": compression})
+
+    def formatSessions(self, sessions):
+        """!
+        Format traffic of reporter sessions.
+
+        @param sessions Iterable of tuples (address, compression, raw bytes, sent bytes).
+        """
+        return self.encoder.encode({
+            "feed": "sessions",
+            "sessions": [{
+                "address": "{}:{}".format(*address[:2]) if address is not None else None,
+                "compression": compression,
+                "rawBytes": rawBytes,
+                "sentBytes": sentBytes,
+                "ratio": rawBytes / sentBytes if sentBytes > 0 else None}
+                for address, compression, rawBytes, sentBytes in sessions]})
 
 class JSONFormatting:
     """!
@@ -117,6 +219,9 @@ class JSONDevicesInitFormatting(JSONInitFormatting):
         """
         devices = []
         for deviceName, deviceGuard in self.dataProvider.getDevices():
+            if deviceName not in deviceReports:
+                # Device was discovered after reports were taken.
+                continue
             devices.append(
                 self.createDevice(deviceName, deviceGuard, deviceReports[deviceName]))
         return devices
@@ -229,7 +334,25 @@ class JSONBrokersInitFromatting(JSONInitFormatting):
             "host": broker.host,
             "port": broker.port,
             "public": not broker.isAuthenticationRequired(),
-            "subscriptions": subscriptions}
+            "subscriptions": subscriptions,
+            "statistics": self.createStatistics(self.dataProvider.getBrokerStatistics(broker))}
+
+    def createStatistics(self, brokerStatistics):
+        if brokerStatistics is None:
+            return None
+        statistics = self.createCounter(brokerStatistics.total)
+        statistics["subscriptions"] = {
+            subscription: self.createCounter(counter)
+                for subscription, counter in brokerStatistics.subscriptions.items()}
+        return statistics
+
+    def createCounter(self, counter):
+        return {
+            "messages": counter.messages,
+            "bytes": counter.bytes,
+            "unguarded": counter.unguarded,
+            "decodeFailures": counter.decodeFailures,
+            "lastMessageTime": counter.lastMessageTime}
 
 class JSONUpdateFormatting(JSONFormatting):
     """!
@@ -274,3 +397,23 @@ class JSONDevicesUpdateFormatting(JSONUpdateFormatting):
             "alarm": "{}".format(alarm.getName()),
             "status": self.formatStatus(active),
             "message": ["ok", message][int(active)]}
+
+class JSONHistoryFormatting(JSONFormatting):
+    """!
+    Generate history part of JSON report.
+    """
+
+    def formatTransitions(self, transitions):
+        return [self.createTransition(transition) for transition in transitions]
+
+    def createTransition(self, transition):
+        timestamp, dataIdentifier, alarmName, active, message = transition
+        return {
+            "time": timestamp,
+            "guard": self.formatDataIdentifier(dataIdentifier),
+            "alarm": alarmName,
+            "status": self.formatStatus(active),
+            "message": ["ok", message][int(active)]}
+
+    def formatValues(self, values):
+        return [{"time": timestamp, "value": value} for timestamp, value in values]
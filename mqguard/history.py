@@ -0,0 +1,222 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""!
+In-memory history of alarm transitions and numeric values.
+"""
+
+import array
+import heapq
+import itertools
+
+class RingBuffer:
+    """!
+    Fixed-size ring buffer of time ordered records. Oldest records are overwritten
+    when buffer is full. Storage is allocated at once, so memory use doesn't grow.
+    """
+
+    ## @var size
+    # Buffer capacity.
+
+    ## @var times
+    # Array of record timestamps.
+
+    ## @var records
+    # Array or list of records.
+
+    ## @var start
+    # Physical index of the oldest record.
+
+    ## @var count
+    # Number of stored records.
+
+    def __init__(self, size, typecode = None):
+        """!
+        Initiate ring buffer.
+
+        @param size Buffer capacity.
+        @param typecode Array type code of records, e.g. 'd' for floats. If None,
+            records are stored in list and can be arbitrary objects.
+        """
+        self.size = size
+        self.times = array.array('d', itertools.repeat(0.0, size))
+        if typecode is None:
+            self.records = [None] * size
+        else:
+            self.records = array.array(typecode, itertools.repeat(0, size))
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp, record):
+        """!
+        Append record. The oldest record is overwritten if buffer is full.
+
+        @param timestamp Record timestamp. Timestamps are expected in ascending order.
+        @param record Stored record.
+        """
+        if self.count < self.size:
+            index = (self.start + self.count) % self.size
+            self.count += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.size
+        self.times[index] = timestamp
+        self.records[index] = record
+
+    def query(self, since = None, until = None):
+        """!
+        Get records from time range.
+
+        @param since Lower time bound, inclusive. None for no bound.
+        @param until Upper time bound, inclusive. None for no bound.
+        @return List of tuples (timestamp, record) in time order.
+        """
+        first = 0 if since is None else self.bisect(since, False)
+        last = self.count if until is None else self.bisect(until, True)
+        result = []
+        for i in range(first, last):
+            index = (self.start + i) % self.size
+            result.append((self.times[index], self.records[index]))
+        return result
+
+    def bisect(self, timestamp, right):
+        """!
+        Find logical position of timestamp using binary search.
+
+        @param timestamp Searched timestamp.
+        @param right If True, position after records with equal timestamp is returned.
+        @return Logical index.
+        """
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            middleTime = self.times[(self.start + middle) % self.size]
+            if middleTime < timestamp or (right and middleTime == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __len__(self):
+        return self.count
+
+class AlarmHistory:
+    """!
+    History of alarm transitions and numeric values of all devices. Every data
+    identifier of device has its own ring buffer, buffers are allocated when first
+    record is stored.
+    """
+
+    ## @var historySize
+    # Number of stored transitions per data identifier.
+
+    ## @var valueHistorySize
+    # Number of stored values per numeric data identifier. Zero disables value history.
+
+    ## @var transitions
+    # Mapping device : DataIdentifier : RingBuffer of (alarmName, active, message) tuples.
+
+    ## @var values
+    # Mapping device : DataIdentifier : RingBuffer of floats.
+
+    def __init__(self, historySize, valueHistorySize = 0):
+        """!
+        Initiate alarm history.
+
+        @param historySize Number of stored transitions per data identifier.
+        @param valueHistorySize Number of stored values per numeric data identifier.
+        """
+        self.historySize = historySize
+        self.valueHistorySize = valueHistorySize
+        self.transitions = {}
+        self.values = {}
+
+    def hasValueHistory(self):
+        return self.valueHistorySize > 0
+
+    def addTransition(self, device, dataIdentifier, timestamp, alarmName, active, message):
+        """!
+        Store alarm transition.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param timestamp Transition time.
+        @param alarmName Alarm name.
+        @param active Is alarm active flag.
+        @param message Alarm message.
+        """
+        buffers = self.transitions.setdefault(device, {})
+        buffer = buffers.get(dataIdentifier)
+        if buffer is None:
+            buffer = RingBuffer(self.historySize)
+            buffers[dataIdentifier] = buffer
+        buffer.append(timestamp, (alarmName, active, message))
+
+    def addValue(self, device, dataIdentifier, timestamp, value):
+        """!
+        Store numeric value.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param timestamp Message time.
+        @param value Numeric value.
+        """
+        buffers = self.values.setdefault(device, {})
+        buffer = buffers.get(dataIdentifier)
+        if buffer is None:
+            buffer = RingBuffer(self.valueHistorySize, 'd')
+            buffers[dataIdentifier] = buffer
+        buffer.append(timestamp, value)
+
+    def removeDevice(self, device):
+        """!
+        Forget history of device.
+
+        @param device Device identifier.
+        """
+        self.transitions.pop(device, None)
+        self.values.pop(device, None)
+
+    def getTransitions(self, device, since = None, until = None):
+        """!
+        Get alarm transitions of device from time range.
+
+        @param device Device identifier.
+        @param since Lower time bound, inclusive. None for no bound.
+        @param until Upper time bound, inclusive. None for no bound.
+        @return List of tuples (timestamp, dataIdentifier, alarmName, active, message)
+            in time order.
+        """
+        buffers = self.transitions.get(device, {})
+        queries = [[(timestamp, dataIdentifier) + record for timestamp, record in buffer.query(since, until)]
+            for dataIdentifier, buffer in buffers.items()]
+        return list(heapq.merge(*queries, key = lambda transition: transition[0]))
+
+    def getValues(self, device, dataIdentifier, since = None, until = None):
+        """!
+        Get numeric values of data identifier from time range.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param since Lower time bound, inclusive. None for no bound.
+        @param until Upper time bound, inclusive. None for no bound.
+        @return List of tuples (timestamp, value) in time order.
+        """
+        buffer = self.values.get(device, {}).get(dataIdentifier)
+        if buffer is None:
+            return []
+        return buffer.query(since, until)
@@ -0,0 +1,282 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""!
+HTTP state query API.
+"""
+
+import json
+import http.server
+import threading
+import urllib.parse
+import uuid
+
+from mqguard.reporting import BaseReporter
+from mqguard.formatting import JSONDevicesInitFormatting, JSONBrokersInitFromatting, SystemDataProvider
+
+class HTTPReporter(BaseReporter):
+    """!
+    Serve current state of guarded devices over HTTP. Responses are rendered once
+    per state version and cached. Clients polling with If-None-Match header get
+    '304 Not Modified' until the state changes.
+
+    Endpoints:
+        @li /summary - Fleet summary.
+        @li /devices - All devices.
+        @li /devices/<name> - Single device.
+        @li /failures - Devices with failures.
+        @li /brokers/<name> - Broker and devices guarding some of its topics.
+    """
+
+    ## @var bindAddress
+    # Tuple (address, port).
+
+    ## @var instance
+    # Identifier unique for every reporter instance. It prefixes entity tags, so
+    # tags of previous process or reloaded reporter never match current state.
+
+    ## @var version
+    # State version counter. Incremented on every reported change.
+
+    ## @var deviceVersions
+    # Mapping device : state version of the last device change.
+
+    ## @var cache
+    # Mapping path : (etag, body) of cached responses.
+
+    def __init__(self, synchronizer, dataProvider, bindAddress):
+        """!
+        Initialize HTTP reporter.
+
+        @param synchronizer
+        @param dataProvider FormatDataProvider object.
+        @param bindAddress Tuple (address, port).
+        """
+        BaseReporter.__init__(self, synchronizer)
+        self.dataProvider = dataProvider
+        self.bindAddress = bindAddress
+        self.deviceFormatting = JSONDevicesInitFormatting(dataProvider)
+        self.brokerFormatting = JSONBrokersInitFromatting(dataProvider)
+        self.encoder = json.JSONEncoder(indent = 4)
+        self.instance = uuid.uuid4().hex
+        self.version = 0
+        self.deviceVersions = {}
+        self.cache = {}
+        self.cacheLock = threading.Lock()
+        self.server = None
+
+    def injectSystemClass(self, systemClass):
+        self.dataProvider.injectSystemClass(systemClass)
+
+    def addDevice(self, device, guard):
+        self.changeVersion(device)
+
+    def removeDevice(self, device):
+        self.changeVersion(device)
+
+    def report(self, deviceReport):
+        if deviceReport.hasAlarmChanges() or deviceReport.hasPresenceUpdate():
+            self.changeVersion(deviceReport.device)
+
+    def changeVersion(self, device):
+        """!
+        Increment state version.
+
+        @param device Changed device.
+        """
+        self.version += 1
+        self.deviceVersions[device] = self.version
+
+    def __call__(self):
+        reporter = self
+        class RequestHandler(HTTPReporterRequestHandler):
+            httpReporter = reporter
+        self.server = http.server.ThreadingHTTPServer(self.bindAddress, RequestHandler)
+        self.server.daemon_threads = True
+        self.running = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.running = False
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def getResponse(self, path):
+        """!
+        Get response for request path.
+
+        @param path Request path.
+        @return Tuple (etag, body) or None if path is unknown.
+        """
+        etag = self.getETag(path)
+        if etag is None:
+            return None
+        with self.cacheLock:
+            cached = self.cache.get(path)
+            if cached is not None and cached[0] == etag:
+                return cached
+        body = self.render(path)
+        if body is None:
+            return None
+        response = (etag, body)
+        with self.cacheLock:
+            self.cache[path] = response
+        return response
+
+    def getETag(self, path):
+        """!
+        Get entity tag of current state of given path.
+
+        @param path Request path.
+        @return Entity tag string or None if path is unknown.
+        """
+        parts = self.splitPath(path)
+        if parts == ["devices"] or parts == ["summary"] or parts == ["failures"] or \
+                (len(parts) == 2 and parts[0] == "brokers"):
+            return '"{}-{}"'.format(self.instance, self.version)
+        if len(parts) == 2 and parts[0] == "devices":
+            # Devices added before reporter start have version 0. Device name
+            # isn't part of the tag, tags are compared per path.
+            return '"{}-d{}"'.format(self.instance, self.deviceVersions.get(parts[1], 0))
+        return None
+
+    def splitPath(self, path):
+        return [urllib.parse.unquote(part) for part in path.split("?")[0].split("/") if part != ""]
+
+    def render(self, path):
+        """!
+        Render response body.
+
+        @param path Request path.
+        @return Response body bytes or None if path is unknown.
+        """
+        parts = self.splitPath(path)
+        if parts == ["summary"]:
+            content = self.renderSummary()
+        elif parts == ["devices"]:
+            content = self.renderDevices(lambda deviceReport: True)
+        elif parts == ["failures"]:
+            content = self.renderDevices(lambda deviceReport: deviceReport.hasFailures())
+        elif parts[0] == "devices":
+            content = self.renderDevice(parts[1])
+        else:
+            content = self.renderBroker(parts[1])
+        if content is None:
+            return None
+        return self.encoder.encode(content).encode("utf-8")
+
+    def renderSummary(self):
+        deviceReports = self.deviceRegistry.getDeviceReports()
+        failing = sum(1 for deviceReport in deviceReports.values() if deviceReport.hasFailures())
+        return {
+            "version": self.version,
+            "devices": len(deviceReports),
+            "ok": len(deviceReports) - failing,
+            "error": failing,
+            "brokers": [broker.name for broker, _ in self.dataProvider.getBrokerListenDescriptors()]}
+
+    def renderDevices(self, condition):
+        deviceReports = self.deviceRegistry.getDeviceReports()
+        devices = []
+        for deviceName, deviceGuard in self.dataProvider.getDevices():
+            deviceReport = deviceReports.get(deviceName)
+            if deviceReport is not None and condition(deviceReport):
+                devices.append(self.deviceFormatting.createDevice(deviceName, deviceGuard, deviceReport))
+        return devices
+
+    def renderDevice(self, device):
+        for deviceName, deviceGuard in self.dataProvider.getDevices():
+            if deviceName == device:
+                deviceReport = self.deviceRegistry.getDeviceReports().get(device)
+                if deviceReport is None:
+                    return None
+                return self.deviceFormatting.createDevice(deviceName, deviceGuard, deviceReport)
+        return None
+
+    def renderBroker(self, brokerName):
+        for broker, subscriptions in self.dataProvider.getBrokerListenDescriptors():
+            if broker.name == brokerName:
+                content = self.brokerFormatting.createBroker(broker, subscriptions)
+                content["devices"] = self.renderDevices(
+                    lambda deviceReport: self.isGuardingBroker(deviceReport, brokerName))
+                return content
+        return None
+
+    def isGuardingBroker(self, deviceReport, brokerName):
+        for dataIdentifier, _, _ in deviceReport.getAlarmReport():
+            if dataIdentifier.broker.name == brokerName:
+                return True
+        return False
+
+class HTTPReporterRequestHandler(http.server.BaseHTTPRequestHandler):
+    """!
+    Request handler of HTTP reporter.
+    """
+
+    ## @var httpReporter
+    # HTTPReporter object. Set by sub-class.
+    httpReporter = None
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        response = self.httpReporter.getResponse(self.path)
+        if response is None:
+            self.sendEmpty(404)
+            return
+        etag, body = response
+        if etag in self.getRequestedETags():
+            self.sendEmpty(304, etag)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def getRequestedETags(self):
+        ifNoneMatch = self.headers.get("If-None-Match")
+        if ifNoneMatch is None:
+            return set()
+        return set(tag.strip() for tag in ifNoneMatch.split(","))
+
+    def sendEmpty(self, code, etag = None):
+        self.send_response(code)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """!
+        Don't log requests to stderr.
+        """
+
+def createHTTPReporter(config, reporterSection):
+    """!
+    Create HTTPReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return HTTPReporter object.
+    """
+    listenAddress = config.getListenAddress(reporterSection)
+    return HTTPReporter(None, SystemDataProvider(), listenAddress)
@@ -0,0 +1,401 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Ingest backends. Backend receives MQTT messages from brokers and delivers them to
+data handler, usually DeviceRegistry object.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from mqreceive.data import DataIdentifier
+from mqreceive.receiving import BrokerReceiver, BrokerReceiverIDManager
+
+from mqguard.reporting import BatchQueue
+from mqguard.topics import topicMatches
+
+class IngestBackend:
+    """!
+    Ingest backend base class.
+
+    Data handler must implement onNewData(dataIdentifier, data) method. Backends
+    able to receive more messages at once deliver them by onNewDataBatch(messages)
+    method, where messages is list of tuples (dataIdentifier, data).
+    """
+
+    ## @var listenDescriptors
+    # Iterable of tuples (broker, subscriptions).
+
+    ## @var dataHandler
+    # Object receiving messages.
+
+    def __init__(self, listenDescriptors, dataHandler):
+        """!
+        Initiate backend.
+
+        @param listenDescriptors Iterable of tuples (broker, subscriptions).
+        @param dataHandler Object receiving messages.
+        """
+        self.listenDescriptors = list(listenDescriptors)
+        self.dataHandler = dataHandler
+
+    def start(self):
+        """!
+        Start receiving messages.
+        """
+
+    def stop(self):
+        """!
+        Stop receiving messages.
+        """
+
+class ThreadedIngestBackend(IngestBackend):
+    """!
+    Receive messages of every broker in separate thread. Messages are delivered one
+    by one.
+    """
+
+    ## @var receivers
+    # List of BrokerReceiver objects.
+
+    ## @var threads
+    # List of receiver threads.
+
+    ## @var joinTimeout
+    # Maximum time in seconds stop() waits for receiver threads.
+
+    joinTimeout = 10
+
+    def __init__(self, listenDescriptors, dataHandler):
+        IngestBackend.__init__(self, listenDescriptors, dataHandler)
+        idManager = BrokerReceiverIDManager()
+        self.receivers = [BrokerReceiver(idManager.createReceiverID(), listenDescriptor, dataHandler)
+            for listenDescriptor in self.listenDescriptors]
+        self.threads = []
+
+    def start(self):
+        self.threads = [threading.Thread(target = receiver) for receiver in self.receivers]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """!
+        Disconnect receivers and wait until their threads finish, so no message is
+        delivered after stop() returns. Disconnect is repeated, because receiver
+        still connecting to broker ignores it.
+        """
+        deadline = time.monotonic() + self.joinTimeout
+        for receiver, thread in zip(self.receivers, self.threads):
+            while thread.is_alive() and time.monotonic() < deadline:
+                receiver.stop()
+                thread.join(0.1)
+            if thread.is_alive():
+                print("{}: receiver of broker {} didn't stop within {} s".format(self.__class__.__name__,
+                    receiver.broker.name, self.joinTimeout), file=sys.stderr)
+
+class AsyncioIngestBackend(IngestBackend):
+    """!
+    Receive messages of all brokers on single asyncio event loop running in its own
+    thread. MQTT clients are driven by event loop readiness callbacks instead of
+    their own network loops. Messages received during one loop iteration are
+    delivered as single batch.
+    """
+
+    ## @var receivers
+    # List of AsyncioBrokerReceiver objects.
+
+    ## @var pending
+    # Messages waiting for delivery.
+
+    def __init__(self, listenDescriptors, dataHandler):
+        IngestBackend.__init__(self, listenDescriptors, dataHandler)
+        idManager = BrokerReceiverIDManager()
+        self.receivers = [AsyncioBrokerReceiver(self, idManager.createReceiverID(), listenDescriptor)
+            for listenDescriptor in self.listenDescriptors]
+        self.pending = []
+        self.loop = None
+        self.stopEvent = None
+        self.thread = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.stopEvent = asyncio.Event()
+        self.thread = threading.Thread(target = self.run)
+        self.thread.start()
+
+    def run(self):
+        """!
+        Event loop thread.
+        """
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.receive())
+        finally:
+            self.loop.close()
+
+    async def receive(self):
+        for receiver in self.receivers:
+            receiver.start(self.loop)
+        await self.stopEvent.wait()
+        for receiver in self.receivers:
+            receiver.stop()
+        # Let cancelled tasks finish.
+        await asyncio.sleep(0)
+        self.flush()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopEvent.set)
+        self.thread.join()
+
+    def addMessage(self, dataIdentifier, data):
+        """!
+        Queue received message. Delivery is scheduled on next loop iteration, so
+        messages from all readable sockets are delivered together.
+
+        @param dataIdentifier DataIdentifier object.
+        @param data Message bytes.
+        """
+        self.pending.append((dataIdentifier, data))
+        if len(self.pending) == 1:
+            self.loop.call_soon(self.flush)
+
+    def flush(self):
+        """!
+        Deliver pending messages.
+        """
+        if len(self.pending) == 0:
+            return
+        messages, self.pending = self.pending, []
+        self.dataHandler.onNewDataBatch(messages)
+
+class AsyncioBrokerReceiver:
+    """!
+    MQTT client of single broker driven by asyncio event loop.
+    """
+
+    ## @var keepAlive
+    # MQTT keep alive interval in seconds.
+
+    ## @var reconnectDelay
+    # Delay between connection attempts in seconds.
+
+    ## @var maxReadPackets
+    # Maximum number of packets read at once from readable socket.
+
+    keepAlive = 60
+    reconnectDelay = 5
+    maxReadPackets = 1000
+
+    def __init__(self, backend, clientID, listenDescriptor):
+        """!
+        Initiate receiver.
+
+        @param backend AsyncioIngestBackend object.
+        @param clientID Client identification.
+        @param listenDescriptor Tuple (broker, subscriptions).
+        """
+        self.backend = backend
+        self.broker, self.subscriptions = listenDescriptor
+        self.client = createClient(str(clientID))
+        if self.broker.isAuthenticationRequired():
+            self.client.username_pw_set(self.broker.user, self.broker.password)
+        self.client.on_connect = self.onConnect
+        self.client.on_disconnect = self.onDisconnect
+        self.client.on_message = self.onMessage
+        self.client.on_socket_open = self.onSocketOpen
+        self.client.on_socket_close = self.onSocketClose
+        self.client.on_socket_register_write = self.onSocketRegisterWrite
+        self.client.on_socket_unregister_write = self.onSocketUnregisterWrite
+        self.loop = None
+        self.running = False
+        self.miscTask = None
+        self.connectTask = None
+        self.received = 0
+
+    def start(self, loop):
+        """!
+        Start connecting to broker.
+
+        @param loop Event loop.
+        """
+        self.loop = loop
+        self.running = True
+        self.miscTask = loop.create_task(self.runMisc())
+        self.connectTask = loop.create_task(self.connect(False))
+
+    def stop(self):
+        self.running = False
+        self.miscTask.cancel()
+        self.connectTask.cancel()
+        self.client.disconnect()
+
+    async def connect(self, reconnect):
+        """!
+        Connect to broker, retry until connection succeeds. TCP connection is
+        established synchronously, so it blocks the loop shortly.
+
+        @param reconnect Connection was already established before.
+        """
+        while self.running:
+            try:
+                if reconnect:
+                    self.client.reconnect()
+                else:
+                    self.client.connect(self.broker.host, self.broker.port, self.keepAlive)
+                return
+            except OSError:
+                reconnect = False
+                await asyncio.sleep(self.reconnectDelay)
+
+    async def runMisc(self):
+        """!
+        Periodic client housekeeping, e.g. keep alive messages.
+        """
+        while self.running:
+            self.client.loop_misc()
+            await asyncio.sleep(1)
+
+    def onConnect(self, client, userdata, *args):
+        for subscription in self.subscriptions:
+            self.client.subscribe(subscription)
+
+    def onDisconnect(self, client, userdata, *args):
+        if self.running:
+            self.connectTask = self.loop.create_task(self.reconnect())
+
+    async def reconnect(self):
+        await asyncio.sleep(self.reconnectDelay)
+        await self.connect(True)
+
+    def onMessage(self, client, userdata, msg):
+        self.received += 1
+        self.backend.addMessage(DataIdentifier(self.broker, msg.topic), msg.payload)
+
+    def onReadable(self):
+        """!
+        Read messages from readable socket. Client reads single packet per call, so it
+        is called until no more message is received.
+        """
+        for _ in range(self.maxReadPackets):
+            received = self.received
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.received == received:
+                return
+
+    def onSocketOpen(self, client, userdata, sock):
+        self.loop.add_reader(sock, self.onReadable)
+
+    def onSocketClose(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    def onSocketRegisterWrite(self, client, userdata, sock):
+        self.loop.add_writer(sock, self.client.loop_write)
+
+    def onSocketUnregisterWrite(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+class FakeIngestBackend(IngestBackend):
+    """!
+    In-process broker for tests and benchmarks. Messages published by publish()
+    are filtered by subscriptions of the broker and delivered in batches by delivery
+    thread, or synchronously by flush() when backend isn't started.
+    """
+
+    ## @var brokers
+    # Mapping broker name : (broker, subscriptions).
+
+    ## @var batchSize
+    # Maximum number of messages in delivered batch.
+
+    def __init__(self, listenDescriptors, dataHandler, batchSize = 1000):
+        IngestBackend.__init__(self, listenDescriptors, dataHandler)
+        self.brokers = {broker.name: (broker, list(subscriptions)) for broker, subscriptions in self.listenDescriptors}
+        self.batchSize = batchSize
+        self.queue = BatchQueue()
+        self.thread = None
+
+    def publish(self, brokerName, topic, data):
+        """!
+        Publish message to fake broker.
+
+        @param brokerName Broker name.
+        @param topic Message topic.
+        @param data Message bytes.
+        @return True if some subscription matches the topic, False otherwise.
+        """
+        broker, subscriptions = self.brokers[brokerName]
+        for subscription in subscriptions:
+            if topicMatches(subscription, topic):
+                return self.queue.put((DataIdentifier(broker, topic), data))
+        return False
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run)
+        self.thread.start()
+
+    def run(self):
+        """!
+        Delivery thread.
+        """
+        while not self.queue.isDrained():
+            messages = self.queue.getBatch(self.batchSize)
+            if len(messages) > 0:
+                self.dataHandler.onNewDataBatch(messages)
+
+    def stop(self):
+        """!
+        Stop delivery thread. Already published messages are delivered.
+        """
+        self.queue.close()
+        self.thread.join()
+
+    def flush(self):
+        """!
+        Deliver published messages in caller's thread.
+        """
+        while len(self.queue) > 0:
+            self.dataHandler.onNewDataBatch(self.queue.getBatch(self.batchSize))
+
+def createClient(clientID):
+    """!
+    Create MQTT client. Connection callbacks of receivers accept arguments of both
+    paho-mqtt 1.x and 2.x callback versions.
+
+    @param clientID Client identification string.
+    @return MQTT client object.
+    """
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id = clientID)
+    return mqtt.Client(client_id = clientID)
+
+def createIngestBackend(backendName, listenDescriptors, dataHandler):
+    """!
+    Create ingest backend by name.
+
+    @param backendName Backend name: 'threaded' or 'asyncio'.
+    @param listenDescriptors Iterable of tuples (broker, subscriptions).
+    @param dataHandler Object receiving messages.
+    @return IngestBackend object.
+    @throws ValueError If backend name is unknown.
+    """
+    if backendName == "threaded":
+        return ThreadedIngestBackend(listenDescriptors, dataHandler)
+    if backendName == "asyncio":
+        return AsyncioIngestBackend(listenDescriptors, dataHandler)
+    raise ValueError("Unknown ingest backend: {}".format(backendName))
@@ -0,0 +1,170 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Program shutdown and state checkpoint.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+class StateCheckpoint:
+    """!
+    File keeping alarm states between program runs. Checkpoint is written on
+    shutdown and loaded on start, so alarms active before restart aren't reported
+    again and their recovery isn't lost.
+    """
+
+    ## @var path
+    # Checkpoint file path.
+
+    VERSION = 1
+
+    def __init__(self, path):
+        """!
+        Initiate checkpoint.
+
+        @param path Checkpoint file path.
+        """
+        self.path = path
+
+    def save(self, states):
+        """!
+        Write alarm states. File is replaced atomically, so reader never sees
+        partially written checkpoint.
+
+        @param states Iterable of tuples (device, broker name, topic, alarm name, active, message).
+        """
+        document = {
+            "version": self.VERSION,
+            "time": time.time(),
+            "alarms": [{
+                "device": device,
+                "broker": brokerName,
+                "topic": topic,
+                "alarm": name,
+                "active": active,
+                "message": message} for device, brokerName, topic, name, active, message in states]}
+        with open(self.path + ".tmp", "w", encoding = "utf-8") as f:
+            json.dump(document, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def load(self):
+        """!
+        Read alarm states. Missing or unreadable checkpoint gives no states.
+
+        @return List of tuples (device, broker name, topic, alarm name, active, message).
+        """
+        try:
+            with open(self.path, encoding = "utf-8") as f:
+                document = json.load(f)
+            if document.get("version") != self.VERSION:
+                raise ValueError("unsupported version {}".format(document.get("version")))
+            return [(alarm["device"], alarm["broker"], alarm["topic"], alarm["alarm"],
+                alarm["active"], alarm["message"]) for alarm in document["alarms"]]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            print("{}: can't load {}: {}".format(self.__class__.__name__, self.path, ex), file=sys.stderr)
+            return []
+
+class Lifecycle:
+    """!
+    Orderly program shutdown. Ingest is stopped first, so no new message enters
+    the pipeline. Evaluation in progress is finished, reporters are stopped and
+    flush their queues within shutdown timeout. Alarm states are written into
+    checkpoint at last.
+    """
+
+    ## @var timeout
+    # Maximum time in seconds reporters may take to flush their queues.
+
+    ## @var checkpoint
+    # StateCheckpoint object or None if state isn't kept.
+
+    ## @var services
+    # List of tuples (service, thread) of helper threads stopped with ingest.
+
+    ## @var shutdownRequested
+    # Flag signalling shutdown request.
+
+    def __init__(self, ingestBackend, deviceRegistry, reportingManager, timeout = 10, checkpoint = None):
+        """!
+        Initiate lifecycle.
+
+        @param ingestBackend IngestBackend object.
+        @param deviceRegistry DeviceRegistry object.
+        @param reportingManager ReportingManager object.
+        @param timeout Maximum time in seconds reporters may take to flush their queues.
+        @param checkpoint StateCheckpoint object or None.
+        """
+        self.ingestBackend = ingestBackend
+        self.deviceRegistry = deviceRegistry
+        self.reportingManager = reportingManager
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.services = []
+        self.shutdownRequested = False
+
+    def startService(self, service):
+        """!
+        Start helper thread, e.g. statistics summarizer, stopped on shutdown.
+
+        @param service Callable object with stop() method.
+        """
+        thread = threading.Thread(target = service)
+        thread.start()
+        self.services.append((service, thread))
+
+    def requestShutdown(self):
+        """!
+        Request shutdown. It only sets a flag, so it is safe to call from signal handler.
+        """
+        self.shutdownRequested = True
+
+    def isShutdownRequested(self):
+        return self.shutdownRequested
+
+    def shutdown(self):
+        """!
+        Stop the pipeline stage by stage and write state checkpoint.
+
+        @return True if all reporters finished, False if some of them didn't flush
+            their queues within timeout.
+        """
+        self.ingestBackend.stop()
+        self.deviceRegistry.stop()
+        for service, thread in self.services:
+            service.stop()
+            thread.join()
+        # Wait for evaluation of messages delivered before ingest stopped.
+        with self.deviceRegistry.lock:
+            pass
+        self.reportingManager.stop()
+        pending = self.reportingManager.join(self.timeout)
+        for reporter in pending:
+            print("{}: {} didn't finish within {} s".format(self.__class__.__name__,
+                reporter.__class__.__name__, self.timeout), file=sys.stderr)
+        if self.checkpoint is not None:
+            try:
+                self.checkpoint.save(self.deviceRegistry.getAlarmStates())
+            except OSError as ex:
+                print("{}: can't write state checkpoint: {}".format(self.__class__.__name__, ex), file=sys.stderr)
+        return len(pending) == 0
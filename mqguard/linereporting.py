@@ -13,24 +13,47 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import logging
-import logging.handlers
-from mqguard.reporting import BaseReporter
+import datetime
+import gzip
+import os
+import shutil
+import sys
+import threading
+
+from mqguard.reporting import BaseReporter, BatchQueue
+from mqguard.config import ConfigException
 
 class LineReporter(BaseReporter):
     """!
-    Base class for line based reporting
+    Base class for line based reporting. Lines are formatted on reporting thread
+    and written by line writer running in reporter thread.
     """
 
-    def __init__(self, synchronizer, logger):
+    def __init__(self, synchronizer, writer):
         """!
         Initialize line reporter object.
 
         @param synchronizer
-        @param logger Logger object.
+        @param writer LineWriter object.
         """
         BaseReporter.__init__(self, synchronizer)
-        self.logger = logger
+        self.writer = writer
+
+    def __call__(self):
+        """!
+        Run line writer.
+        """
+        self.running = True
+        try:
+            self.writer.run()
+        finally:
+            self.running = False
+
+    def stop(self):
+        """!
+        Stop line writer. Already queued lines are written.
+        """
+        self.writer.stop()
 
     def report(self, deviceReport):
         """!
@@ -49,7 +72,7 @@ class LineReporter(BaseReporter):
         devicePresence, track = deviceReport.getPresence()
         _, _, _, msg = track
         presenceDataIdentifier = devicePresence.getDataIdentifier()
-        self.logger.warning("{} {} Presence \"{}\"".format(
+        self.writeLine("{} {} Presence \"{}\"".format(
             presenceDataIdentifier.broker.name,
             presenceDataIdentifier.topic,
             msg))
@@ -64,45 +87,68 @@ class LineReporter(BaseReporter):
             active, _, _, message = report
             if not active:
                 message = "Is OK now"
-            self.logger.warning("{} {} {} \"{}\"".format(
+            self.writeLine("{} {} {} \"{}\"".format(
                 dataIdentifier.broker.name,
                 dataIdentifier.topic,
                 alarm.getName(),
                 message))
 
+    def reportStatistics(self, summary):
+        """!
+        @copydoc BaseReporter::reportStatistics()
+        """
+        for broker, total, delta, seconds in summary:
+            lastMessage = "never"
+            if total.lastMessageTime is not None:
+                lastMessage = datetime.datetime.fromtimestamp(total.lastMessageTime).strftime("%Y-%m-%d %H:%M:%S")
+            self.writeLine("{} Traffic {:.1f} msg/s, {:.1f} B/s, {} messages, {} unguarded, {} decode failures, last message {}".format(
+                broker.name,
+                delta.messages / seconds if seconds > 0 else 0.0,
+                delta.bytes / seconds if seconds > 0 else 0.0,
+                total.messages,
+                total.unguarded,
+                total.decodeFailures,
+                lastMessage))
+
+    def writeLine(self, message):
+        """!
+        Queue line for writing.
+
+        @param message Line message.
+        """
+        self.writer.write("{}\n".format(self.formatLine(message)))
+
+    def formatLine(self, message):
+        """!
+        Format line message. Override in sub-class to add line prefix.
+
+        @param message Line message.
+        @return Formatted line without line separator.
+        """
+        return message
+
 class LogReporter(LineReporter):
     """!
     Plain text logs.
     """
 
-    def __init__(self, synchronizer, logfile):
+    def __init__(self, synchronizer, logfile, maxBytes = 0, daily = True, compress = False, backupCount = 7):
         """!
         Initialize log reporter object.
 
         @param synchronizer
         @param logfile Path to log file.
+        @param maxBytes Rotate log file when it reaches this size. Zero disables size rotation.
+        @param daily Rotate log file at midnight.
+        @param compress Compress rotated log files with gzip.
+        @param backupCount Number of kept rotated log files.
         """
-        LineReporter.__init__(self, synchronizer, self.createLogger(logfile))
+        LineReporter.__init__(self, synchronizer,
+            FileLineWriter(logfile, maxBytes, daily, compress, backupCount))
         self.logfile = logfile
 
-    def createLogger(self, logfile):
-        """!
-        Create logger object.
-
-        @param logfile Path to log file.
-        @return Logger object.
-        """
-        logger = logging.getLogger(self.__class__.__name__)
-        logger.setLevel(logging.INFO)
-        handler = logging.handlers.TimedRotatingFileHandler(
-            logfile,
-            when="M",
-            interval=1)
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(asctime)s %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        return logger
+    def formatLine(self, message):
+        return "{} {}".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3], message)
 
 class PrintReporter(LineReporter):
     """!
@@ -115,19 +161,284 @@ class PrintReporter(LineReporter):
 
         @param synchronizer
         """
-        LineReporter.__init__(self, synchronizer, self.createLogger())
+        LineReporter.__init__(self, synchronizer, StreamLineWriter(sys.stdout))
+
+class LineWriter:
+    """!
+    Write queued lines in batches. Base class.
+    """
+
+    ## @var queue
+    # BatchQueue of preformatted lines.
+
+    ## @var batchSize
+    # Maximum number of lines written at once.
+
+    ## @var flushInterval
+    # Maximum time in seconds line stays in queue.
+
+    def __init__(self, queueSize = 100000, batchSize = 1024, flushInterval = 1):
+        """!
+        Initialize line writer.
+
+        @param queueSize Maximum number of queued lines. Lines are dropped when queue is full.
+        @param batchSize Maximum number of lines written at once.
+        @param flushInterval Maximum time in seconds line stays in queue.
+        """
+        self.queue = BatchQueue(queueSize)
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+
+    def write(self, line):
+        """!
+        Queue preformatted line. Never blocks.
+
+        @param line Line including line separator.
+        """
+        self.queue.put(line)
+
+    def run(self):
+        """!
+        Write queued lines until writer is stopped and queue is drained.
+        """
+        self.open()
+        try:
+            while not self.queue.isDrained():
+                batch = self.queue.getBatch(self.batchSize, self.flushInterval)
+                dropped = self.queue.takeDropped()
+                if dropped > 0:
+                    batch.append("{} lines dropped, writer queue is full\n".format(dropped))
+                if len(batch) > 0:
+                    self.writeBatch("".join(batch))
+        finally:
+            self.close()
+
+    def stop(self):
+        """!
+        Stop writer. Queued lines are still written.
+        """
+        self.queue.close()
+
+    def open(self):
+        """!
+        Open output. Override in sub-class.
+        """
+
+    def writeBatch(self, data):
+        """!
+        Write batch of lines. Override in sub-class.
+
+        @param data Concatenated lines.
+        """
+
+    def close(self):
+        """!
+        Close output. Override in sub-class.
+        """
+
+class StreamLineWriter(LineWriter):
+    """!
+    Write lines into already opened stream.
+    """
+
+    def __init__(self, stream, **kwargs):
+        LineWriter.__init__(self, **kwargs)
+        self.stream = stream
+
+    def writeBatch(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+class FileLineWriter(LineWriter):
+    """!
+    Write lines into file with size based and daily rotation.
+    """
+
+    ## @var filename
+    ## @var maxBytes
+    ## @var daily
+    ## @var compress
+    ## @var backupCount
+
+    def __init__(self, filename, maxBytes = 0, daily = True, compress = False, backupCount = 7,
+            bufferSize = 256 * 1024, **kwargs):
+        """!
+        Initialize file line writer.
+
+        @param filename Path to log file.
+        @param maxBytes Rotate file when it reaches this size. Zero disables size rotation.
+        @param daily Rotate file at midnight.
+        @param compress Compress rotated files with gzip.
+        @param backupCount Number of kept rotated files. Zero keeps all files.
+        @param bufferSize Size of file write buffer.
+        """
+        LineWriter.__init__(self, **kwargs)
+        self.filename = filename
+        self.maxBytes = maxBytes
+        self.daily = daily
+        self.compress = compress
+        self.backupCount = backupCount
+        self.bufferSize = bufferSize
+        self.file = None
+        self.fileSize = 0
+        self.fileDate = None
+
+    def open(self):
+        try:
+            self.openFile()
+        except OSError as ex:
+            print("{}: {} can't be opened: {}".format(self.__class__.__name__, self.filename, ex), file=sys.stderr)
+
+    def openFile(self):
+        """!
+        Open log file for appending.
+
+        @throws OSError If file can't be opened.
+        """
+        self.file = open(self.filename, "ab", buffering = self.bufferSize)
+        self.fileSize = self.file.tell()
+        self.fileDate = datetime.date.today()
+
+    def writeBatch(self, data):
+        """!
+        Write batch of lines. Write errors don't stop the writer, the batch is
+        dropped and file is opened again with next batch.
+
+        @param data Concatenated lines.
+        """
+        # File size and MaxSize are in bytes, not characters.
+        data = data.encode("utf-8")
+        try:
+            if self.file is None:
+                self.openFile()
+            elif self.shouldRotate(len(data)):
+                self.rotate()
+            self.file.write(data)
+            self.file.flush()
+            self.fileSize += len(data)
+        except OSError as ex:
+            print("{}: {} bytes dropped, {} can't be written: {}".format(
+                self.__class__.__name__, len(data), self.filename, ex), file=sys.stderr)
+            self.discardFile()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discardFile(self):
+        """!
+        Close file after write error. Data left in write buffer are lost.
+        """
+        try:
+            self.close()
+        except OSError:
+            pass
+        self.file = None
 
-    def createLogger(self):
+    def shouldRotate(self, length):
         """!
-        Create logger object.
+        Check if file should be rotated before writing data.
 
-        @return Logger object.
+        @param length Length of data to write.
+        @return True if file should be rotated.
         """
-        logger = logging.getLogger(self.__class__.__name__)
-        logger.setLevel(logging.INFO)
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(message)s")
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
-        return logger
+        if self.fileSize == 0:
+            return False
+        if self.daily and datetime.date.today() != self.fileDate:
+            return True
+        return self.maxBytes > 0 and self.fileSize + length > self.maxBytes
+
+    def rotate(self):
+        """!
+        Close current file, rename it and open new one.
+
+        @throws OSError If new file can't be opened.
+        """
+        self.close()
+        rotatedFilename = self.getRotatedFilename()
+        try:
+            os.rename(self.filename, rotatedFilename)
+        except OSError as ex:
+            # Lines are appended to current file until rotation succeeds.
+            print("{}: {} can't be rotated: {}".format(self.__class__.__name__, self.filename, ex), file=sys.stderr)
+            self.openFile()
+            return
+        if self.compress:
+            # Compression runs aside, so writing of new lines isn't delayed.
+            threading.Thread(target = self.compressFile, args = (rotatedFilename,)).start()
+        else:
+            self.removeOldFiles()
+        self.openFile()
+
+    def getRotatedFilename(self):
+        """!
+        Get unused name for rotated file.
+
+        @return File name in format 'filename.YYYY-MM-DD.N'.
+        """
+        prefix = "{}.{}".format(self.filename, self.fileDate.isoformat())
+        index = 0
+        while True:
+            rotatedFilename = "{}.{}".format(prefix, index)
+            if not os.path.exists(rotatedFilename) and not os.path.exists(rotatedFilename + ".gz"):
+                return rotatedFilename
+            index += 1
+
+    def compressFile(self, filename):
+        """!
+        Compress rotated file with gzip and remove original.
+
+        @param filename Rotated file name.
+        """
+        with open(filename, "rb") as source, gzip.open(filename + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(filename)
+        self.removeOldFiles()
+
+    def removeOldFiles(self):
+        """!
+        Remove rotated files exceeding backup count.
+        """
+        if self.backupCount <= 0:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        prefix = os.path.basename(self.filename) + "."
+        rotatedFiles = [os.path.join(directory, f) for f in os.listdir(directory) if f.startswith(prefix)]
+        rotatedFiles.sort(key = os.path.getmtime)
+        for filename in rotatedFiles[:-self.backupCount]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+def createPrintReporter(config, reporterSection):
+    """!
+    Create PrintReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return PrintReporter object.
+    """
+    return PrintReporter(None)
+
+def createLogReporter(config, reporterSection):
+    """!
+    Create LogReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return LogReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    logfile = config.parser.get(reporterSection, "File")
+    try:
+        maxBytes = config.parser.getint(reporterSection, "MaxSize", fallback = 0)
+        backupCount = config.parser.getint(reporterSection, "BackupCount", fallback = 7)
+        compress = config.parser.getboolean(reporterSection, "Compress", fallback = False)
+    except ValueError as ex:
+        raise ConfigException("Section {}: {}".format(reporterSection, ex))
+    rotate = config.parser.get(reporterSection, "Rotate", fallback = "daily").lower()
+    if rotate not in ("daily", "size"):
+        raise ConfigException("Section {}: unsupported rotation: {}".format(reporterSection, rotate))
+    return LogReporter(None, logfile, maxBytes, rotate == "daily", compress, backupCount)
@@ -0,0 +1,320 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+E-mail notifications.
+"""
+
+import collections
+import datetime
+import email.message
+import smtplib
+import ssl
+import sys
+
+from mqguard.throttling import ThrottledReporter
+from mqguard.config import ConfigException
+
+class SMTPConnection:
+    """!
+    Reusable SMTP connection. Connection is opened on first send and kept open.
+    Broken connection is reopened, failed connection attempts are retried with
+    exponential backoff.
+    """
+
+    ## @var security
+    # Connection security: 'none', 'starttls' or 'ssl'.
+
+    ## @var backoff
+    # Current reconnection delay in seconds. Zero if last attempt succeeded.
+
+    ## @var retryTime
+    # Monotonic time of next connection attempt, or None if connection may be
+    # opened immediately.
+
+    def __init__(self, host, port, security = "none", username = None, password = None,
+            timeout = 30, maxBackoff = 300):
+        """!
+        Initiate connection object. Nothing is connected yet.
+
+        @param host SMTP server host.
+        @param port SMTP server port.
+        @param security Connection security: 'none', 'starttls' or 'ssl'.
+        @param username User name or None to skip authentication.
+        @param password User password.
+        @param timeout Socket timeout in seconds.
+        @param maxBackoff Maximum reconnection delay in seconds.
+        """
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.maxBackoff = maxBackoff
+        self.smtp = None
+        self.backoff = 0
+        self.retryTime = None
+
+    def connect(self):
+        """!
+        Open connection and log in.
+
+        @throws smtplib.SMTPException, OSError If connection fails.
+        """
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout = self.timeout,
+                context = ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout = self.timeout)
+        try:
+            if self.security == "starttls":
+                smtp.starttls(context = ssl.create_default_context())
+            if self.username is not None:
+                smtp.login(self.username, self.password)
+        except:
+            smtp.close()
+            raise
+        self.smtp = smtp
+
+    def isReady(self, now):
+        """!
+        Check if connection may be used.
+
+        @param now Current monotonic time in seconds.
+        @return False if connection is waiting for reconnection backoff.
+        """
+        return self.retryTime is None or now >= self.retryTime
+
+    def getRetryTime(self):
+        return self.retryTime
+
+    def send(self, message, now):
+        """!
+        Send message. Stale connection is reopened once.
+
+        @param message EmailMessage object.
+        @param now Current monotonic time in seconds.
+        @return True if message was sent, False if server isn't reachable. Reconnection
+            is delayed by backoff after failure.
+        @throws smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError If server refuses
+            the message. Connection stays usable.
+        """
+        for attempt in range(2):
+            try:
+                if self.smtp is None:
+                    self.connect()
+                self.smtp.send_message(message)
+                self.backoff = 0
+                self.retryTime = None
+                return True
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                raise
+            except (smtplib.SMTPException, OSError) as ex:
+                self.close()
+                error = ex
+        self.backoff = min(self.maxBackoff, max(1, self.backoff * 2))
+        self.retryTime = now + self.backoff
+        print("{}: can't send mail via {}:{}, retry in {} s: {}".format(
+            self.__class__.__name__, self.host, self.port, self.backoff, error), file=sys.stderr)
+        return False
+
+    def close(self):
+        """!
+        Close connection.
+        """
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+class MailReporter(ThrottledReporter):
+    """!
+    Send notifications by e-mail. Notifications passed by throttle within flush
+    interval are grouped into single mail for every recipient. Mails are sent by
+    reporter thread over persistent SMTP connection. Mails which can't be sent wait
+    for reconnection, oldest are dropped when too many are waiting.
+    """
+
+    ## @var sender
+    # Sender address.
+
+    ## @var recipients
+    # List of recipient addresses.
+
+    ## @var flushInterval
+    # Minimal interval between two mails in seconds.
+
+    ## @var buffer
+    # List of Notification objects waiting for next mail.
+
+    ## @var outbox
+    # Deque of EmailMessage objects waiting for SMTP server.
+
+    def __init__(self, synchronizer, throttle, connection, sender, recipients,
+            subject = "mqguard", flushInterval = 60, maxOutbox = 1000):
+        """!
+        Initiate mail reporter.
+
+        @param synchronizer Synchronizing object.
+        @param throttle NotificationThrottle object.
+        @param connection SMTPConnection object.
+        @param sender Sender address.
+        @param recipients List of recipient addresses.
+        @param subject Subject prefix.
+        @param flushInterval Minimal interval between two mails in seconds.
+        @param maxOutbox Maximum number of mails waiting for SMTP server.
+        """
+        ThrottledReporter.__init__(self, synchronizer, throttle)
+        self.connection = connection
+        self.sender = sender
+        self.recipients = recipients
+        self.subject = subject
+        self.flushInterval = flushInterval
+        self.buffer = []
+        self.dropped = 0
+        self.outbox = collections.deque(maxlen = maxOutbox)
+        self.lastMailTime = None
+
+    def sendNotification(self, notification):
+        """!
+        @copydoc ThrottledReporter::sendNotification()
+        """
+        self.buffer.append(notification)
+
+    def sendDigest(self, notifications, dropped):
+        """!
+        @copydoc ThrottledReporter::sendDigest()
+        """
+        self.buffer.extend(notifications)
+        self.dropped += dropped
+
+    def getWaitTime(self, now):
+        """!
+        @copydoc ThrottledReporter::getWaitTime()
+        """
+        waitTimes = [self.throttle.getWaitTime(now)]
+        if len(self.buffer) > 0 or self.dropped > 0:
+            waitTimes.append(max(0, self.lastMailTime + self.flushInterval - now))
+        if len(self.outbox) > 0 and self.connection.getRetryTime() is not None:
+            waitTimes.append(max(0, self.connection.getRetryTime() - now))
+        waitTimes = [t for t in waitTimes if t is not None]
+        return min(waitTimes) if len(waitTimes) > 0 else None
+
+    def onFlush(self, now, final):
+        """!
+        @copydoc ThrottledReporter::onFlush()
+        """
+        if self.lastMailTime is None:
+            self.lastMailTime = now
+        if (len(self.buffer) > 0 or self.dropped > 0) and (final or now - self.lastMailTime >= self.flushInterval):
+            self.lastMailTime = now
+            for recipient in self.recipients:
+                if len(self.outbox) == self.outbox.maxlen:
+                    print("{}: mail to {} dropped, outbox is full".format(
+                        self.__class__.__name__, self.outbox[0]["To"]), file=sys.stderr)
+                self.outbox.append(self.createMessage(recipient, self.buffer, self.dropped))
+            self.buffer = []
+            self.dropped = 0
+        self.sendOutbox(now)
+        if final:
+            self.connection.close()
+
+    def sendOutbox(self, now):
+        """!
+        Send waiting mails while SMTP server accepts them.
+
+        @param now Current monotonic time in seconds.
+        """
+        while len(self.outbox) > 0 and self.connection.isReady(now):
+            message = self.outbox[0]
+            try:
+                if not self.connection.send(message, now):
+                    return
+            except smtplib.SMTPException as ex:
+                print("{}: mail to {} refused: {}".format(self.__class__.__name__, message["To"], ex),
+                    file=sys.stderr)
+            self.outbox.popleft()
+
+    def createMessage(self, recipient, notifications, dropped):
+        """!
+        Create mail describing notifications.
+
+        @param recipient Recipient address.
+        @param notifications List of Notification objects.
+        @param dropped Number of lost notifications.
+        @return EmailMessage object.
+        """
+        message = email.message.EmailMessage()
+        message["From"] = self.sender
+        message["To"] = recipient
+        active = sum(1 for notification in notifications if notification.active)
+        if len(notifications) == 1:
+            notification = notifications[0]
+            message["Subject"] = "{}: {} {} {}".format(self.subject, notification.device, notification.name,
+                "failure" if notification.active else "OK")
+        else:
+            message["Subject"] = "{}: {} alarm transitions, {} failures".format(self.subject, len(notifications), active)
+        lines = [self.formatNotification(notification) for notification in notifications]
+        if dropped > 0:
+            lines.append("{} notifications were lost, queue was full".format(dropped))
+        message.set_content("\n".join(lines) + "\n")
+        return message
+
+    def formatNotification(self, notification):
+        timestamp = datetime.datetime.fromtimestamp(notification.time).strftime("%Y-%m-%d %H:%M:%S")
+        message = notification.message if notification.active else "Is OK now"
+        return "{} {} {} {} {} \"{}\"".format(
+            timestamp,
+            notification.device,
+            notification.dataIdentifier.broker.name,
+            notification.dataIdentifier.topic,
+            notification.name,
+            message)
+
+def createMailReporter(config, reporterSection):
+    """!
+    Create MailReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return MailReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    config.checkForOptionList(reporterSection, ["From", "To"])
+    security = config.parser.get(reporterSection, "Security", fallback = "none")
+    if security not in ("none", "starttls", "ssl"):
+        raise ConfigException("Section {}: unsupported Security value: {}".format(reporterSection, security))
+    username = config.parser.get(reporterSection, "Username", fallback = None)
+    password = None
+    if username is not None:
+        config.checkForOptionList(reporterSection, ["Password"])
+        password = config.parser.get(reporterSection, "Password")
+    defaultPort = 465 if security == "ssl" else 25
+    connection = SMTPConnection(
+        config.parser.get(reporterSection, "Host", fallback = "localhost"),
+        config.getNonNegativeInt(reporterSection, "Port", defaultPort),
+        security, username, password,
+        maxBackoff = config.getNonNegativeInt(reporterSection, "MaxBackoff", 300))
+    recipients = config.parser.get(reporterSection, "To").split()
+    if len(recipients) == 0:
+        raise ConfigException("Section {}: To is empty".format(reporterSection))
+    return MailReporter(None, config.createNotificationThrottle(reporterSection), connection,
+        config.parser.get(reporterSection, "From"), recipients,
+        config.parser.get(reporterSection, "Subject", fallback = "mqguard"),
+        config.getNonNegativeInt(reporterSection, "FlushInterval", 60))
@@ -0,0 +1,136 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Lazy loading of reporter and alarm implementations.
+"""
+
+import importlib
+
+class PluginRegistry:
+    """!
+    Registry of named factories. Factories are referenced as 'module:attribute'
+    strings and their modules are imported on first use, so program doesn't pay
+    for implementations it doesn't use. Names which aren't registered are looked
+    up in entry points of registry group, which lets installed packages add
+    their own implementations.
+    """
+
+    ## @var group
+    # Entry point group name.
+
+    ## @var references
+    # Mapping name : 'module:attribute' reference of registered factories.
+
+    ## @var factories
+    # Mapping name : already loaded factory.
+
+    def __init__(self, group, references = None):
+        """!
+        Initiate registry.
+
+        @param group Entry point group name.
+        @param references Mapping name : 'module:attribute' reference of built-in factories.
+        """
+        self.group = group
+        self.references = dict(references) if references is not None else {}
+        self.factories = {}
+        self.entryPoints = None
+
+    def register(self, name, factory):
+        """!
+        Register factory.
+
+        @param name Plugin name.
+        @param factory Factory object or 'module:attribute' reference.
+        """
+        self.factories.pop(name, None)
+        if isinstance(factory, str):
+            self.references[name] = factory
+        else:
+            self.factories[name] = factory
+
+    def load(self, name):
+        """!
+        Get factory, its module is imported on first use.
+
+        @param name Plugin name.
+        @return Factory object.
+        @throws PluginException If plugin is unknown or can't be imported.
+        """
+        factory = self.factories.get(name)
+        if factory is not None:
+            return factory
+        try:
+            reference = self.references.get(name)
+            if reference is not None:
+                factory = self.resolve(reference)
+            else:
+                factory = self.loadEntryPoint(name)
+        except (ImportError, AttributeError) as ex:
+            raise PluginException("Can't load {} plugin {}: {}".format(self.group, name, ex))
+        if factory is None:
+            raise PluginException("Unknown {} plugin: {}".format(self.group, name))
+        self.factories[name] = factory
+        return factory
+
+    def resolve(self, reference):
+        """!
+        Import object referenced as 'module:attribute'.
+
+        @param reference Reference string.
+        @return Referenced object.
+        """
+        moduleName, _, attribute = reference.partition(":")
+        target = importlib.import_module(moduleName)
+        for part in attribute.split("."):
+            if part:
+                target = getattr(target, part)
+        return target
+
+    def loadEntryPoint(self, name):
+        """!
+        Load factory from entry point of registry group.
+
+        @param name Entry point name.
+        @return Factory object, or None if no package provides it.
+        """
+        if self.entryPoints is None:
+            # Package metadata are scanned only when some plugin isn't built-in.
+            import importlib.metadata
+            entryPoints = importlib.metadata.entry_points()
+            if hasattr(entryPoints, "select"):
+                entryPoints = entryPoints.select(group = self.group)
+            else:
+                entryPoints = entryPoints.get(self.group, [])
+            self.entryPoints = {entryPoint.name: entryPoint for entryPoint in entryPoints}
+        entryPoint = self.entryPoints.get(name)
+        if entryPoint is None:
+            return None
+        return entryPoint.load()
+
+    def getNames(self):
+        """!
+        Get names of registered factories. Entry points which weren't loaded yet
+        aren't included.
+
+        @return Set of names.
+        """
+        return set(self.references) | set(self.factories)
+
+class PluginException(Exception):
+    """!
+    Plugin can't be loaded.
+    """
@@ -0,0 +1,228 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""!
+Configuration reload.
+"""
+
+import sys
+import time
+
+from mqguard.config import ConfigException
+from mqguard.system import System
+
+class SectionDiff:
+    """!
+    Difference of one kind of configuration sections between two configurations.
+    """
+
+    ## @var added
+    # Set of added section names.
+
+    ## @var removed
+    # Set of removed section names.
+
+    ## @var changed
+    # Set of changed section names.
+
+    ## @var unchanged
+    # Set of unchanged section names.
+
+    def __init__(self, oldSignatures, newSignatures):
+        """!
+        Compare section signatures.
+
+        @param oldSignatures Mapping name : signature of running configuration.
+        @param newSignatures Mapping name : signature of new configuration.
+        """
+        self.added = set(newSignatures) - set(oldSignatures)
+        self.removed = set(oldSignatures) - set(newSignatures)
+        self.changed = set(name for name in set(oldSignatures) & set(newSignatures)
+            if oldSignatures[name] != newSignatures[name])
+        self.unchanged = set(oldSignatures) & set(newSignatures) - self.changed
+
+    def hasChanges(self):
+        return len(self.added) > 0 or len(self.removed) > 0 or len(self.changed) > 0
+
+class ConfigDiff:
+    """!
+    Difference between running and new configuration.
+    """
+
+    def __init__(self, oldConfig, newConfig):
+        """!
+        Compute configuration difference.
+
+        @param oldConfig Running ConfigCache object.
+        @param newConfig New ConfigCache object.
+        """
+        self.oldConfig = oldConfig
+        self.newConfig = newConfig
+        self.globals = self.compare("global")
+        self.brokers = self.compare("broker")
+        self.devices = self.compare("device")
+        self.templates = self.compare("template")
+        self.reporters = self.compare("reporter")
+
+    def compare(self, kind):
+        return SectionDiff(self.oldConfig.getSignatures(kind), self.newConfig.getSignatures(kind))
+
+    def checkApplicable(self):
+        """!
+        Check if difference can be applied to running program.
+
+        @throws ConfigException If brokers were changed. Broker connections can't
+            be changed without restart.
+        """
+        if self.brokers.hasChanges():
+            raise ConfigException("Broker sections were changed, restart is required")
+
+    def getDeviceChanges(self, deviceName):
+        """!
+        Get detailed changes of single changed device.
+
+        @param deviceName Device name.
+        @return Tuple (keptGuards, keepPresence).
+            @li keptGuards Set of (brokerName, topic) tuples of unchanged update guards.
+            @li keepPresence True if presence configuration is unchanged.
+        """
+        oldPresence, oldGuards = self.oldConfig.getSignatures("device")[deviceName]
+        newPresence, newGuards = self.newConfig.getSignatures("device")[deviceName]
+        keptGuards = set(key for key in oldGuards
+            if key in newGuards and oldGuards[key] == newGuards[key])
+        return keptGuards, oldPresence == newPresence
+
+class ConfigReloader:
+    """!
+    Apply configuration changes to running program. Only affected devices, guards
+    and reporters are changed, state of untouched alarms and reporter sessions
+    is kept.
+    """
+
+    ## @var deviceRegistry
+    ## @var reportingManager
+
+    ## @var reloadRequested
+    # Flag signalling reload request.
+
+    def __init__(self, deviceRegistry, reportingManager):
+        """!
+        Initiate configuration reloader.
+
+        @param deviceRegistry DeviceRegistry object.
+        @param reportingManager ReportingManager object.
+        """
+        self.deviceRegistry = deviceRegistry
+        self.reportingManager = reportingManager
+        self.reloadRequested = False
+
+    def requestReload(self):
+        """!
+        Request configuration reload. It only sets a flag, so it is safe to call
+        from signal handler.
+        """
+        self.reloadRequested = True
+
+    def waitForRequest(self, period = 1, interrupted = None):
+        """!
+        Block until reload is requested.
+
+        @param period Polling period in seconds.
+        @param interrupted Callable returning True when waiting should end without
+            reload, e.g. on program shutdown.
+        @return True if reload was requested, False if waiting was interrupted.
+        """
+        while not self.reloadRequested:
+            if interrupted is not None and interrupted():
+                return False
+            time.sleep(period)
+        self.reloadRequested = False
+        return True
+
+    def reload(self):
+        """!
+        Re-parse configuration file and apply changes. If new configuration is
+        invalid, running configuration is kept.
+
+        @return True if new configuration was applied, False otherwise.
+        """
+        oldConfig = System.configCache
+        try:
+            newConfig = System.parseConfig(oldConfig)
+            diff = ConfigDiff(oldConfig, newConfig)
+            diff.checkApplicable()
+        except ConfigException as ex:
+            print("Configuration reload error: {}".format(ex), file=sys.stderr)
+            return False
+        if diff.globals.hasChanges():
+            print("Configuration reload: changes of section Global require restart, running values are kept",
+                file=sys.stderr)
+            newConfig.globals = oldConfig.globals
+            newConfig.signatures["global"] = oldConfig.getSignatures("global")
+        System.replaceConfigCache(newConfig)
+        with self.deviceRegistry.lock:
+            self.applyDevices(diff)
+            self.applyTemplates(diff, oldConfig)
+        self.applyReporters(diff, oldConfig, newConfig)
+        return True
+
+    def applyDevices(self, diff):
+        for deviceName in diff.devices.removed:
+            self.deviceRegistry.removeGuardedDevice(deviceName)
+            self.reportingManager.removeDevice(deviceName)
+            System.removeDeviceGuard(deviceName)
+        for deviceName in diff.devices.added:
+            deviceGuard = System.createDeviceGuard(*System.configCache.getDevice(deviceName))
+            self.deviceRegistry.addGuardedDevice(deviceName, deviceGuard)
+            self.reportingManager.addDevice(deviceName, deviceGuard)
+            System.addDeviceGuard(deviceName, deviceGuard)
+        for deviceName in diff.devices.changed:
+            keptGuards, keepPresence = diff.getDeviceChanges(deviceName)
+            keptDataIdentifiers = set(System.dataIdentifierFactory.build(brokerName, topic)
+                for brokerName, topic in keptGuards)
+            deviceGuard = System.createDeviceGuard(*System.configCache.getDevice(deviceName))
+            self.deviceRegistry.replaceGuardedDevice(deviceName, deviceGuard, keptDataIdentifiers, keepPresence)
+            self.reportingManager.removeDevice(deviceName)
+            self.reportingManager.addDevice(deviceName, deviceGuard)
+            System.replaceDeviceGuard(deviceName, deviceGuard)
+
+    def applyTemplates(self, diff, oldConfig):
+        if not diff.templates.hasChanges():
+            return
+        for template in list(self.deviceRegistry.deviceTemplates):
+            self.deviceRegistry.removeDeviceTemplate(template)
+        for template in System.getDeviceTemplates():
+            self.deviceRegistry.addDeviceTemplate(template)
+
+    def applyReporters(self, diff, oldConfig, newConfig):
+        for reporterName in diff.reporters.removed | diff.reporters.changed:
+            _, _, reporter = oldConfig.getReporter(reporterName)
+            self.reportingManager.removeReporter(reporter)
+            System.removeReporter(reporter)
+            # Old reporter must release its listening socket or spool directory
+            # before its replacement starts.
+            if not self.reportingManager.joinReporter(reporter, System.getShutdownTimeout()):
+                print("Configuration reload: reporter {} didn't stop in time".format(reporterName),
+                    file=sys.stderr)
+        for reporterName in diff.reporters.added | diff.reporters.changed:
+            _, _, reporter = newConfig.getReporter(reporterName)
+            reporter.injectSystemClass(System)
+            reporter.injectDeviceRegistry(self.deviceRegistry)
+            for device, guard in System.getDeviceGuards():
+                reporter.addDevice(device, guard)
+            self.reportingManager.addReporter(reporter)
+            self.reportingManager.startReporter(reporter)
+            System.addReporter(reporter)
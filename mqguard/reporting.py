@@ -18,6 +18,8 @@ Sending reports.
 """
 
 import threading
+import collections
+import time
 
 class ReportingManager:
     """!
@@ -29,14 +31,53 @@ class ReportingManager:
         Initialize report manager.
         """
         self.reporters = []
+        self.threads = []
 
     def addReporter(self, reporter):
         self.reporters.append(reporter)
 
+    def removeReporter(self, reporter):
+        """!
+        Stop reporter and remove it from manager.
+
+        @param reporter Reporter object.
+        """
+        self.reporters = [r for r in self.reporters if r is not reporter]
+        reporter.stop()
+
+    def joinReporter(self, reporter, timeout = None):
+        """!
+        Wait for thread of single stopped reporter.
+
+        @param reporter Reporter object.
+        @param timeout Maximum time to wait in seconds, None to wait until thread finishes.
+        @return True if reporter thread finished or wasn't started, False otherwise.
+        """
+        alive = []
+        for r, thread in self.threads:
+            if r is reporter:
+                thread.join(timeout)
+                if thread.is_alive():
+                    alive.append((r, thread))
+            else:
+                alive.append((r, thread))
+        finished = all(r is not reporter for r, thread in alive)
+        self.threads = alive
+        return finished
+
     def addDevice(self, device, guard):
         for reporter in self.reporters:
             reporter.addDevice(device, guard)
 
+    def removeDevice(self, device):
+        """!
+        Notify all reporters about removed device.
+
+        @param device Device identifier.
+        """
+        for reporter in self.reporters:
+            reporter.removeDevice(device)
+
     def addBroker(self, broker):
         """!
         Add broker object.
@@ -49,12 +90,31 @@ class ReportingManager:
         for reporter in self.reporters:
             reporter.report(deviceReport)
 
+    def reportStatistics(self, summary):
+        """!
+        Report periodic traffic summary.
+
+        @param summary Traffic summary, see IngestStatistics.takeSummary().
+        """
+        for reporter in self.reporters:
+            reporter.reportStatistics(summary)
+
     def start(self):
         """!
         Notify all reporters to start.
         """
         for reporter in self.reporters:
-            threading.Thread(target = reporter).start()
+            self.startReporter(reporter)
+
+    def startReporter(self, reporter):
+        """!
+        Start single reporter thread.
+
+        @param reporter Reporter object.
+        """
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        self.threads.append((reporter, thread))
 
     def stop(self):
         """
@@ -63,6 +123,20 @@ class ReportingManager:
         for reporter in self.reporters:
             reporter.stop()
 
+    def join(self, timeout = None):
+        """!
+        Wait for reporter threads. Threads of removed reporters are waited for too.
+
+        @param timeout Maximum time to wait in seconds, None to wait until all
+            threads finish.
+        @return List of reporters whose threads are still running.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for reporter, thread in self.threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        self.threads = [(reporter, thread) for reporter, thread in self.threads if thread.is_alive()]
+        return [reporter for reporter, thread in self.threads]
+
     def injectDeviceRegistry(self, deviceRegistry):
         """!
         Inject device registry to all registered reporters.
@@ -94,6 +168,13 @@ class BaseReporter:
         @param guard DeviceGuard object.
         """
 
+    def removeDevice(self, device):
+        """!
+        Remove device from reporter. Called when device is removed at runtime.
+
+        @param device Device identifier.
+        """
+
     def report(self, deviceReport):
         """!
         Report new event.
@@ -101,6 +182,13 @@ class BaseReporter:
         @param event Event object.
         """
 
+    def reportStatistics(self, summary):
+        """!
+        Report periodic traffic summary. Reporters ignore summary by default.
+
+        @param summary List of tuples (broker, total, delta, seconds).
+        """
+
     def __call__(self):
         """!
         Run reporter thread.
@@ -145,7 +233,100 @@ class BaseReporter:
         """
         return self.deviceRegistry is not None
 
-class DatabaseReporter(BaseReporter):
+class BatchQueue:
     """!
-    Report errors into database.
+    Queue of items processed in batches by single background thread. Producers
+    never block, items are dropped when queue is full.
     """
+
+    ## @var maxSize
+    # Maximum number of queued items. Zero means unlimited queue.
+
+    ## @var dropped
+    # Number of items dropped since last takeDropped() call.
+
+    def __init__(self, maxSize = 0):
+        """!
+        Initiate batch queue.
+
+        @param maxSize Maximum number of queued items. Zero means unlimited queue.
+        """
+        self.maxSize = maxSize
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item, force = False):
+        """!
+        Put item into queue. Never blocks.
+
+        @param item Queued item.
+        @param force Queue item even if queue is full. Used for rare control items
+            which must not be lost. Such item isn't counted as dropped when queue
+            is closed.
+        @return True if item was queued, False if it was dropped.
+        """
+        with self.condition:
+            if self.closed:
+                if not force:
+                    self.dropped += 1
+                return False
+            if not force and self.maxSize > 0 and len(self.items) >= self.maxSize:
+                self.dropped += 1
+                return False
+            self.items.append(item)
+            if len(self.items) == 1:
+                self.condition.notify()
+            return True
+
+    def getBatch(self, maxItems, timeout = None):
+        """!
+        Get batch of queued items. Wait for first item if queue is empty.
+
+        @param maxItems Maximum number of items in batch.
+        @param timeout Wait timeout in seconds. None to wait until some item is queued
+            or queue is closed.
+        @return List of items. Empty list on timeout or if queue is closed and empty.
+        """
+        with self.condition:
+            if len(self.items) == 0 and not self.closed:
+                self.condition.wait(timeout)
+            batch = []
+            while len(self.items) > 0 and len(batch) < maxItems:
+                batch.append(self.items.popleft())
+            return batch
+
+    def takeDropped(self):
+        """!
+        Get number of dropped items and reset the counter.
+
+        @return Number of items dropped since last call.
+        """
+        with self.condition:
+            dropped = self.dropped
+            self.dropped = 0
+            return dropped
+
+    def close(self):
+        """!
+        Close queue. Already queued items can be still taken, new items are dropped.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def isClosed(self):
+        return self.closed
+
+    def isDrained(self):
+        """!
+        Check if queue is closed and all items were taken.
+
+        @return True if queue is closed and empty.
+        """
+        with self.condition:
+            return self.closed and len(self.items) == 0
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,212 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Ingest accounting. Traffic counters per broker and per subscription.
+"""
+
+import threading
+import time
+
+from mqguard.topics import TopicTrie
+
+class TrafficCounter:
+    """!
+    Counters of received messages.
+    """
+
+    __slots__ = ("messages", "bytes", "unguarded", "decodeFailures", "lastMessageTime")
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.unguarded = 0
+        self.decodeFailures = 0
+        self.lastMessageTime = None
+
+    def addMessage(self, size, unguarded, now):
+        """!
+        Count received message.
+
+        @param size Message size in bytes.
+        @param unguarded No update guard checks the message topic.
+        @param now Current UNIX time.
+        """
+        self.messages += 1
+        self.bytes += size
+        if unguarded:
+            self.unguarded += 1
+        self.lastMessageTime = now
+
+    def snapshot(self):
+        """!
+        Get copy of counters.
+
+        @return TrafficCounter object.
+        """
+        counter = TrafficCounter()
+        for name in self.__slots__:
+            setattr(counter, name, getattr(self, name))
+        return counter
+
+class BrokerStatistics:
+    """!
+    Traffic counters of single broker and its subscriptions.
+    """
+
+    ## @var broker
+    # Broker object.
+
+    ## @var total
+    # TrafficCounter of all broker messages.
+
+    ## @var subscriptions
+    # Mapping subscription topic filter : TrafficCounter.
+
+    def __init__(self, broker, subscriptions):
+        """!
+        Initiate broker statistics.
+
+        @param broker Broker object.
+        @param subscriptions Iterable of subscription topic filters.
+        """
+        self.broker = broker
+        self.total = TrafficCounter()
+        self.subscriptions = {}
+        self.subscriptionTrie = TopicTrie()
+        for subscription in subscriptions:
+            counter = TrafficCounter()
+            self.subscriptions[subscription] = counter
+            self.subscriptionTrie.add(subscription, counter)
+
+    def addMessage(self, topic, size, unguarded, now):
+        """!
+        Count message in broker and in all subscriptions matching its topic.
+
+        @param topic Message topic.
+        @param size Message size in bytes.
+        @param unguarded No update guard checks the message topic.
+        @param now Current UNIX time.
+        """
+        self.total.addMessage(size, unguarded, now)
+        for counter in self.subscriptionTrie.match(topic):
+            counter.addMessage(size, unguarded, now)
+
+    def addDecodeFailure(self, topic):
+        """!
+        Count message which couldn't be decoded by its update guard.
+
+        @param topic Message topic.
+        """
+        self.total.decodeFailures += 1
+        for counter in self.subscriptionTrie.match(topic):
+            counter.decodeFailures += 1
+
+class IngestStatistics:
+    """!
+    Traffic counters of all brokers. Counters are updated by device registry under
+    its lock and read without locking, so readers may see slightly stale values.
+    """
+
+    ## @var brokers
+    # Mapping Broker : BrokerStatistics.
+
+    def __init__(self, listenDescriptors):
+        """!
+        Initiate statistics.
+
+        @param listenDescriptors Iterable of tuples (broker, subscriptions).
+        """
+        self.brokers = {}
+        for broker, subscriptions in listenDescriptors:
+            self.brokers[broker] = BrokerStatistics(broker, subscriptions)
+        self.previous = {}
+        self.previousTime = time.time()
+
+    def addMessage(self, dataIdentifier, size, unguarded):
+        brokerStatistics = self.getBroker(dataIdentifier.broker)
+        brokerStatistics.addMessage(dataIdentifier.topic, size, unguarded, time.time())
+
+    def addDecodeFailure(self, dataIdentifier):
+        self.getBroker(dataIdentifier.broker).addDecodeFailure(dataIdentifier.topic)
+
+    def getBroker(self, broker):
+        """!
+        Get statistics of broker. Statistics of unknown broker are created without
+        subscriptions.
+
+        @param broker Broker object.
+        @return BrokerStatistics object.
+        """
+        brokerStatistics = self.brokers.get(broker)
+        if brokerStatistics is None:
+            brokerStatistics = BrokerStatistics(broker, [])
+            self.brokers[broker] = brokerStatistics
+        return brokerStatistics
+
+    def takeSummary(self):
+        """!
+        Get traffic of all brokers since last call.
+
+        @return List of tuples (broker, total, delta, seconds).
+            @li total TrafficCounter with totals.
+            @li delta TrafficCounter with differences since last call.
+            @li seconds Length of summary period in seconds.
+        """
+        now = time.time()
+        seconds = now - self.previousTime
+        self.previousTime = now
+        summary = []
+        for broker, brokerStatistics in list(self.brokers.items()):
+            total = brokerStatistics.total.snapshot()
+            previous = self.previous.get(broker, TrafficCounter())
+            delta = TrafficCounter()
+            delta.messages = total.messages - previous.messages
+            delta.bytes = total.bytes - previous.bytes
+            delta.unguarded = total.unguarded - previous.unguarded
+            delta.decodeFailures = total.decodeFailures - previous.decodeFailures
+            delta.lastMessageTime = total.lastMessageTime
+            self.previous[broker] = total
+            summary.append((broker, total, delta, seconds))
+        return summary
+
+class StatisticsSummarizer:
+    """!
+    Thread periodically passing traffic summary to reporting manager.
+    """
+
+    def __init__(self, statistics, reportManager, period):
+        """!
+        Initiate summarizer.
+
+        @param statistics IngestStatistics object.
+        @param reportManager ReportingManager object.
+        @param period Summary period in seconds.
+        """
+        self.statistics = statistics
+        self.reportManager = reportManager
+        self.period = period
+        self.event = threading.Event()
+        # Set before thread starts, so early stop() isn't overwritten.
+        self.running = True
+
+    def __call__(self):
+        while self.running:
+            if not self.event.wait(self.period):
+                self.reportManager.reportStatistics(self.statistics.takeSummary())
+
+    def stop(self):
+        self.running = False
+        self.event.set()
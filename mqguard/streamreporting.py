@@ -13,27 +13,143 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import selectors
 import socket
+import sys
 import threading
-import queue
 import asyncio
+import collections
+import itertools
+import json
+import time
+import urllib.parse
+import uuid
+import zlib
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 
 from mqguard.reporting import BaseReporter
+from mqguard.formatting import JSONFormatter, SystemDataProvider
+from mqguard.config import ConfigException
+
+class ReplayBuffer:
+    """!
+    Bounded buffer of recently published device reports. Reports are numbered by
+    monotonic sequence number, so client which lost connection can get only
+    reports it missed.
+    """
+
+    ## @var entries
+    # Deque of tuples (sequence, formatted report).
+
+    ## @var lastSequence
+    # Sequence number of last published report, zero if nothing was published.
+
+    def __init__(self, maxSize):
+        """!
+        Initiate replay buffer.
+
+        @param maxSize Maximum number of kept reports.
+        """
+        self.entries = collections.deque(maxlen = maxSize)
+        self.lastSequence = 0
+
+    def append(self, sequence, text):
+        """!
+        Add published report.
+
+        @param sequence Report sequence number, it must follow last sequence number.
+        @param text Formatted report.
+        """
+        self.entries.append((sequence, text))
+        self.lastSequence = sequence
+
+    def getSince(self, sequence):
+        """!
+        Get reports published after given sequence number.
+
+        @param sequence Sequence number of last report client has.
+        @return List of tuples (sequence, formatted report), or None if some of
+            missed reports isn't in buffer any more.
+        """
+        if sequence > self.lastSequence or sequence < 0:
+            return None
+        if sequence == self.lastSequence:
+            return []
+        if len(self.entries) == 0 or self.entries[0][0] > sequence + 1:
+            return None
+        return list(itertools.islice(self.entries, sequence + 1 - self.entries[0][0], None))
+
+class ZlibStream:
+    """!
+    Session zlib stream. Compressor keeps its history for the whole session, so
+    repeated parts of reports are compressed well. Every write is ended by sync
+    flush, so client decompresses it immediately.
+    """
+
+    def __init__(self):
+        self.compressor = zlib.compressobj()
+
+    def encode(self, data):
+        """!
+        Get stream part carrying data.
+
+        @param data Uncompressed bytes.
+        @return Compressed bytes.
+        """
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """!
+        Get stream end.
+
+        @return Final block and checksum.
+        """
+        return self.compressor.flush(zlib.Z_FINISH)
 
 class StreamingReporter(BaseReporter):
     """!
-    Base class for reporters providing live diagnostic service.
+    Base class for reporters providing live diagnostic service. Device reports are
+    formatted once for all sessions and numbered by sequence number. Reconnecting
+    client may resume the stream by stream identifier and sequence number of last
+    received report.
     """
 
-    def __init__(self, synchronizer, outputFormatter):
+    ## @var stream
+    # Stream identifier, unique for every reporter instance. Sequence numbers of
+    # different streams aren't comparable.
+
+    ## @var replay
+    # ReplayBuffer object.
+
+    ## @var compression
+    # Flag if sessions may negotiate stream compression.
+
+    ## @var snapshot
+    # Tuple (key, initial data) shared by sessions starting while no report is
+    # published and no device is added or removed, or None.
+
+    def __init__(self, synchronizer, outputFormatter, replaySize = 1000, compression = True):
         """!
         Initialize streaming reporter.
 
         @param outputFormatter Formatter object for final report result
+        @param replaySize Number of recent reports kept for resuming sessions.
+        @param compression Allow sessions to negotiate stream compression.
         """
         BaseReporter.__init__(self, synchronizer)
         self.outputFormatter = outputFormatter
+        self.compression = compression
+        self.stream = uuid.uuid4().hex
+        self.replay = ReplayBuffer(replaySize)
+        self.replayLock = threading.Lock()
+        self.snapshot = None
+
+    def addDevice(self, device, guard):
+        self.snapshot = None
+
+    def removeDevice(self, device):
+        self.snapshot = None
 
     def updateSessions(self, deviceReport):
         """!
@@ -43,157 +159,821 @@ class StreamingReporter(BaseReporter):
     def injectSystemClass(self, systemClass):
         self.outputFormatter.injectSystemClass(systemClass)
 
+    def publish(self, deviceReport):
+        """!
+        Format device report and store it into replay buffer.
+
+        @param deviceReport DeviceReport object.
+        @return Tuple (sequence, formatted report).
+        """
+        with self.replayLock:
+            sequence = self.replay.lastSequence + 1
+            text = self.outputFormatter.formatDeviceReport(deviceReport, sequence)
+            self.replay.append(sequence, text)
+        return sequence, text
+
+    def getSessionStart(self, stream = None, sequence = None):
+        """!
+        Get data bringing new session to current state. Session resuming this
+        stream gets only reports it missed, if they are still in replay buffer.
+        Other sessions get initial data.
+
+        Session must be registered before, so it queues all reports published
+        after returned sequence number.
+
+        @param stream Stream identifier known by client, or None.
+        @param sequence Sequence number of last report received by client, or None.
+        @return Tuple (sequence, lines) with sequence number of last report included
+            in lines.
+        """
+        # Reports are published under registry lock, so device reports and sequence
+        # number match.
+        with self.deviceRegistry.lock:
+            with self.replayLock:
+                lastSequence = self.replay.lastSequence
+                if stream == self.stream and sequence is not None:
+                    entries = self.replay.getSince(sequence)
+                    if entries is not None:
+                        return lastSequence, [text for _, text in entries]
+            deviceReports = self.deviceRegistry.getDeviceReports()
+        key = lastSequence, frozenset(deviceReports)
+        snapshot = self.snapshot
+        if snapshot is None or snapshot[0] != key:
+            snapshot = key, self.outputFormatter.formatInitialData(deviceReports, lastSequence, self.stream)
+            self.snapshot = snapshot
+        return lastSequence, [snapshot[1]]
+
+    def parseSessionRequest(self, request):
+        """!
+        Parse request opening session.
+
+        @li {"request": "start", "compression": method}
+        @li {"request": "resume", "stream": id, "seq": number, "compression": method}
+
+        Compression is optional.
+
+        @param request Request string.
+        @return Tuple (stream, sequence, compression), or None if request doesn't
+            open session. Stream and sequence are None for start request,
+            compression is None if client didn't ask for it.
+        """
+        try:
+            request = json.loads(request)
+            if request.get("request") == "resume":
+                stream, sequence = str(request["stream"]), int(request["seq"])
+            elif request.get("request") == "start":
+                stream, sequence = None, None
+            else:
+                return None
+            compression = request.get("compression")
+            return stream, sequence, str(compression) if compression is not None else None
+        except (ValueError, KeyError, TypeError, AttributeError) as ex:
+            return None
+
+    def getSessionStatistics(self):
+        """!
+        Override in sub-class.
+
+        @return List of tuples (address, compression, raw bytes, sent bytes).
+        """
+        return []
+
+    def handleRequest(self, request):
+        """!
+        Handle client request. Requests are JSON objects with "request" member.
+
+        @li {"request": "history", "device": name, "since": timestamp, "until": timestamp}
+        @li {"request": "values", "device": name, "broker": name, "topic": topic,
+            "since": timestamp, "until": timestamp}
+        @li {"request": "sessions"}
+
+        Time bounds are optional UNIX timestamps.
+
+        @param request Request string.
+        @return Formatted response.
+        """
+        try:
+            request = json.loads(request)
+            requestType = request["request"]
+            if requestType == "sessions":
+                return self.outputFormatter.formatSessions(self.getSessionStatistics())
+            device = request["device"]
+            since = request.get("since")
+            until = request.get("until")
+            if requestType == "history":
+                transitions = self.deviceRegistry.getDeviceHistory(device, since, until)
+                return self.outputFormatter.formatHistory(device, transitions)
+            elif requestType == "values":
+                dataIdentifier = self.deviceRegistry.findDataIdentifier(device, request["broker"], request["topic"])
+                if dataIdentifier is None:
+                    return self.outputFormatter.formatError("Unknown guard: {} {}".format(request["broker"], request["topic"]))
+                values = self.deviceRegistry.getValueHistory(device, dataIdentifier, since, until)
+                return self.outputFormatter.formatValues(device, dataIdentifier, values)
+            else:
+                return self.outputFormatter.formatError("Unknown request: {}".format(requestType))
+        except ValueError as ex:
+            return self.outputFormatter.formatError("Invalid request: {}".format(ex))
+        except (KeyError, TypeError) as ex:
+            return self.outputFormatter.formatError("Invalid request, missing or unknown value: {}".format(ex))
+
 class SocketReporter(StreamingReporter):
     """!
-    Sending reports over TCP/IP socket.
+    Sending reports over TCP/IP socket. All sessions are served by reporter thread
+    through selector. Sockets are non-blocking, every session has its own output
+    buffer, so slow client doesn't delay others. Sessions whose connection failed
+    are closed and removed.
     """
 
-    def __init__(self, synchronizer, outputFormatter, bindAddress):
+    ## @var resumeTimeout
+    # Time in seconds new session waits for session request before initial data
+    # is sent. Zero sends initial data immediately.
+
+    ## @var outputLimit
+    # Maximum number of bytes waiting in session output buffer, session which
+    # exceeds it is closed. Zero is unlimited.
+
+    ## @var inbox
+    # Deque of tuples (sequence, encoded report line) published by reporting thread and not
+    # yet passed to sessions.
+
+    def __init__(self, synchronizer, outputFormatter, bindAddress, replaySize = 1000, resumeTimeout = 0,
+            compression = True, outputLimit = 0):
         """!
         Initialize socket reporter.
 
         @param outputFormatter Formatter object for final report result
+        @param bindAddress Tuple (address, port).
+        @param replaySize Number of recent reports kept for resuming sessions.
+        @param resumeTimeout Time in seconds new session waits for session request.
+        @param compression Allow sessions to negotiate zlib compression.
+        @param outputLimit Maximum size of session output buffer in bytes, 0 is unlimited.
         """
-        StreamingReporter.__init__(self, synchronizer, outputFormatter)
+        StreamingReporter.__init__(self, synchronizer, outputFormatter, replaySize, compression)
         self.bindAddress = bindAddress
-        self.server = socket.socket()
+        self.resumeTimeout = resumeTimeout
+        self.outputLimit = outputLimit
+        self.server = None
         self.sessions = set()
+        self.selector = None
+        self.inbox = collections.deque()
+        self.wakeupReader = None
+        self.wakeupWriter = None
+        self.stopRequested = False
 
     def __call__(self):
+        # Sockets are created by reporter thread, so reporter which is never started,
+        # e.g. built by rejected configuration reload, holds no socket.
         try:
+            self.wakeupReader, self.wakeupWriter = socket.socketpair()
+            self.wakeupWriter.setblocking(False)
+            self.server = socket.socket()
             self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server.bind(self.bindAddress)
             self.server.listen(127)
+            self.server.setblocking(False)
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.server, selectors.EVENT_READ)
+            self.selector.register(self.wakeupReader, selectors.EVENT_READ)
             self.running = True
-            while self.running:
-                client, address = self.server.accept()
-                session = SocketReporterSession(self, self.outputFormatter, client, address)
-                self.sessions.add(session)
-                threading.Thread(target = session).start()
+            accepting = True
+            while accepting or len(self.sessions) > 0:
+                if accepting and self.stopRequested:
+                    # Stop accepting, sessions send queued reports and end.
+                    accepting = False
+                    self.running = False
+                    self.selector.unregister(self.server)
+                    self.server.close()
+                    self.processInbox()
+                    for session in list(self.sessions):
+                        session.close()
+                    continue
+                for key, events in self.selector.select(self.getSelectTimeout()):
+                    if key.fileobj is self.server:
+                        self.acceptClients()
+                    elif key.fileobj is self.wakeupReader:
+                        self.wakeupReader.recv(4096)
+                    else:
+                        key.data.onEvents(events)
+                self.processInbox()
+                now = time.monotonic()
+                for session in list(self.sessions):
+                    if session.deadline is not None and session.deadline <= now:
+                        session.start()
         finally:
             self.running = False
+            for session in list(self.sessions):
+                session.abort()
+            if self.selector is not None:
+                self.selector.close()
+            for sock in (self.server, self.wakeupReader, self.wakeupWriter):
+                if sock is not None:
+                    sock.close()
 
     def stop(self):
-        if self.running:
-            for session in self.sessions:
-                session.stop()
-        # TODO: block until all runnin sessions will be terminated
+        """!
+        Stop accepting clients. Reporter thread ends when all sessions sent their
+        queued reports. Stop requested before reporter thread started is kept.
+        """
+        self.stopRequested = True
         self.running = False
+        self.wakeup()
+
+    def wakeup(self):
+        """!
+        Wake up reporter thread waiting in selector.
+        """
+        try:
+            self.wakeupWriter.send(b"\0")
+        except (OSError, AttributeError):
+            # Wake up is already pending, or reporter thread didn't create sockets yet.
+            pass
+
+    def getSelectTimeout(self):
+        """!
+        Get time until nearest session request deadline.
+
+        @return Time in seconds, or None if no session waits for session request.
+        """
+        deadlines = [session.deadline for session in self.sessions if session.deadline is not None]
+        if len(deadlines) == 0:
+            return None
+        return max(0, min(deadlines) - time.monotonic())
+
+    def acceptClients(self):
+        while True:
+            try:
+                client, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client.setblocking(False)
+            session = SocketReporterSession(self, self.outputFormatter, client, address)
+            self.sessions.add(session)
+            self.selector.register(client, session.events, session)
+            if self.resumeTimeout > 0:
+                session.deadline = time.monotonic() + self.resumeTimeout
+            else:
+                session.start()
+
+    def processInbox(self):
+        """!
+        Pass published reports to sessions.
+        """
+        while True:
+            try:
+                sequence, data = self.inbox.popleft()
+            except IndexError:
+                return
+            for session in list(self.sessions):
+                session.update(sequence, data)
+
+    def setEvents(self, session, events):
+        """!
+        Change selector events watched for session.
+
+        @param session SocketReporterSession object.
+        @param events Selector event mask.
+        """
+        self.selector.modify(session.client, events, session)
 
     def sessionEnd(self, session):
-        self.sessions.remove(session)
+        if session in self.sessions:
+            self.sessions.discard(session)
+            self.selector.unregister(session.client)
+
+    def getSessionStatistics(self):
+        return [session.getStatistics() for session in list(self.sessions)]
 
     def report(self, deviceReport):
         if deviceReport.hasAlarmChanges() or deviceReport.hasPresenceUpdate():
-            for session in self.sessions:
-                session.update(deviceReport)
+            sequence, text = self.publish(deviceReport)
+            if self.running:
+                # Report line is encoded once for all sessions.
+                self.inbox.append((sequence, "{}\n".format(text).encode("utf-8")))
+                self.wakeup()
 
 class SocketReporterSession:
     """!
-    Single SocketReporter client session.
+    Single SocketReporter client session, served by reporter thread. Client may
+    send session request as its first line, within resume timeout of reporter,
+    to resume stream or to ask for compression. Accepted compression is confirmed
+    by uncompressed line, rest of the session is single zlib stream.
     """
 
+    ## @var sequence
+    # Sequence number of last report sent to client, None before session start.
+
+    ## @var deadline
+    # Monotonic time when session starts without session request, None if
+    # session doesn't wait for it.
+
+    ## @var events
+    # Selector events watched for client socket.
+
+    ## @var backlog
+    # List of tuples (sequence, encoded report line) published before session start.
+
+    ## @var zlibStream
+    # ZlibStream object of compressed session, None if session isn't compressed.
+
+    ## @var rawBytes
+    # Number of bytes sent before compression.
+
+    ## @var sentBytes
+    # Number of bytes sent to client.
+
     def __init__(self, sessionManager, formatter, client, address):
         self.sessionManager = sessionManager
         self.formatter = formatter
         self.client = client
         self.address = address
-        self.reportQueue = queue.Queue()
-        self.running = False
+        self.sequence = None
+        self.deadline = None
+        self.events = selectors.EVENT_READ
+        self.inputBuffer = b""
+        self.outputBuffer = bytearray()
+        self.backlog = []
+        self.closing = False
+        self.closed = False
+        self.zlibStream = None
+        self.rawBytes = 0
+        self.sentBytes = 0
+
+    def onEvents(self, events):
+        """!
+        Handle selector events of client socket.
 
-    def __call__(self):
-        self.running = True
-        toSend = "{}\n".format(self.formatter.formatInitialData())
-        self.client.send(toSend.encode("utf-8"))
-        while self.running:
-            deviceReport = self.reportQueue.get()
-            if deviceReport is not None:
-                toSend = "{}\n".format(self.formatter.formatDeviceReport(deviceReport))
-                self.client.send(toSend.encode("utf-8"))
-        self.client.close()
+        @param events Selector event mask.
+        """
+        if events & selectors.EVENT_READ:
+            self.onReadable()
+        if events & selectors.EVENT_WRITE and not self.closed:
+            self.flush()
+
+    def onReadable(self):
+        try:
+            data = self.client.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as ex:
+            self.abort()
+            return
+        if len(data) == 0:
+            # Client closed connection, queued data are still sent.
+            self.close()
+            return
+        self.inputBuffer += data
+        if self.sequence is None:
+            line, separator, rest = self.inputBuffer.partition(b"\n")
+            if not separator:
+                return
+            sessionRequest = self.sessionManager.parseSessionRequest(line.decode("utf-8", "replace"))
+            if sessionRequest is not None:
+                self.inputBuffer = rest
+                self.start(*sessionRequest)
+            else:
+                self.start()
+        self.handleRequests()
+
+    def start(self, stream = None, sequence = None, compression = None):
+        """!
+        Send session start data and reports published meanwhile.
+
+        @param stream Stream identifier known by client, or None.
+        @param sequence Sequence number of last report received by client, or None.
+        @param compression Compression method requested by client, or None.
+        """
+        self.deadline = None
+        if compression is not None:
+            self.startCompression(compression)
+        self.sequence, lines = self.sessionManager.getSessionStart(stream, sequence)
+        for line in lines:
+            self.send("{}\n".format(line).encode("utf-8"))
+        backlog, self.backlog = self.backlog, []
+        for sequence, data in backlog:
+            self.update(sequence, data)
+
+    def handleRequests(self):
+        """!
+        Answer complete request lines received from client.
+        """
+        while not self.closed:
+            line, separator, rest = self.inputBuffer.partition(b"\n")
+            if not separator:
+                return
+            self.inputBuffer = rest
+            if line.strip():
+                self.send("{}\n".format(self.sessionManager.handleRequest(line.decode("utf-8", "replace"))).encode("utf-8"))
+
+    def startCompression(self, compression):
+        """!
+        Answer compression request and start zlib stream if it is accepted.
+
+        @param compression Compression method requested by client.
+        """
+        accepted = compression == "zlib" and self.sessionManager.compression
+        self.send("{}\n".format(self.formatter.formatCompression(
+            compression if accepted else "none")).encode("utf-8"))
+        if accepted:
+            self.zlibStream = ZlibStream()
+
+    def send(self, data):
+        """!
+        Send data, compressed if session is compressed.
+
+        @param data Uncompressed bytes.
+        """
+        self.rawBytes += len(data)
+        if self.zlibStream is not None:
+            data = self.zlibStream.encode(data)
+        self.sendRaw(data)
+
+    def sendRaw(self, data):
+        """!
+        Queue data into output buffer and write as much as socket accepts.
+
+        @param data Bytes to send.
+        """
+        if self.closed:
+            return
+        self.outputBuffer += data
+        self.sentBytes += len(data)
+        limit = self.sessionManager.outputLimit
+        if limit > 0 and len(self.outputBuffer) > limit:
+            print("{}: client {} doesn't read, output buffer exceeded {} bytes".format(
+                self.__class__.__name__, self.address, limit), file=sys.stderr)
+            self.abort()
+            return
+        self.flush()
+
+    def flush(self):
+        """!
+        Write output buffer without blocking. Rest of buffer is written when
+        socket becomes writable.
+        """
+        try:
+            while len(self.outputBuffer) > 0:
+                written = self.client.send(self.outputBuffer)
+                del self.outputBuffer[:written]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as ex:
+            self.abort()
+            return
+        if self.closing and len(self.outputBuffer) == 0:
+            self.abort()
+            return
+        events = 0 if self.closing else selectors.EVENT_READ
+        if len(self.outputBuffer) > 0:
+            events |= selectors.EVENT_WRITE
+        if events != self.events:
+            self.events = events
+            self.sessionManager.setEvents(self, events)
+
+    def close(self):
+        """!
+        Stop session. Data queued before close are still sent.
+        """
+        if self.closing or self.closed:
+            return
+        if self.sequence is None:
+            self.start()
+        if self.zlibStream is not None:
+            self.sendRaw(self.zlibStream.finish())
+        self.closing = True
+        self.flush()
+
+    def abort(self):
+        """!
+        Close client connection immediately and remove session.
+        """
+        if self.closed:
+            return
+        self.closed = True
         self.sessionManager.sessionEnd(self)
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client.close()
 
-    def getInitialData(self):
+    def getStatistics(self):
         """!
-        Get initial data.
+        Get session traffic.
+
+        @return Tuple (address, compression, raw bytes, sent bytes).
         """
+        return self.address, "zlib" if self.zlibStream is not None else "none", self.rawBytes, self.sentBytes
 
-    def stop(self):
-        self.running = False
-        # Put None into message queue to wake up consumer thread.
-        self.reportQueue.put(None)
+    def update(self, sequence, data):
+        """!
+        Send published report.
 
-    def isRunning(self):
-        return self.running
+        @param sequence Report sequence number.
+        @param data Encoded report line.
+        """
+        if self.closing or self.closed:
+            return
+        if self.sequence is None:
+            self.backlog.append((sequence, data))
+            return
+        if sequence <= self.sequence:
+            # Report was part of session start data.
+            return
+        self.sequence = sequence
+        self.send(data)
+
+class MeteredExtension:
+    """!
+    Websocket extension wrapper counting payload bytes of outgoing frames before
+    and after encoding by wrapped extension.
+    """
+
+    ## @var rawBytes
+    # Number of payload bytes before encoding.
 
-    def update(self, deviceReport):
-        self.reportQueue.put(deviceReport)
+    ## @var sentBytes
+    # Number of payload bytes after encoding.
+
+    def __init__(self, extension):
+        """!
+        Initiate wrapper.
+
+        @param extension Wrapped extension object.
+        """
+        self.extension = extension
+        self.name = extension.name
+        self.rawBytes = 0
+        self.sentBytes = 0
+
+    def decode(self, frame, *args, **kwargs):
+        return self.extension.decode(frame, *args, **kwargs)
+
+    def encode(self, frame):
+        encoded = self.extension.encode(frame)
+        self.rawBytes += len(frame.data)
+        self.sentBytes += len(encoded.data)
+        return encoded
+
+class MeteredDeflateFactory(ServerPerMessageDeflateFactory):
+    """!
+    Permessage-deflate extension factory, negotiated extensions are metered.
+    """
+
+    def process_request_params(self, params, accepted_extensions):
+        response, extension = ServerPerMessageDeflateFactory.process_request_params(self, params, accepted_extensions)
+        return response, MeteredExtension(extension)
 
 class WebsocketReporter(StreamingReporter):
     """!
-    Sending reports over websockets.
+    Sending reports over websockets. Client resumes stream by query parameters of
+    request path, e.g. /?stream=id&seq=number. Compression is negotiated by
+    permessage-deflate extension.
     """
 
-    def __init__(self, synchronizer, outputFormatter, bindAddress):
+    def __init__(self, synchronizer, outputFormatter, bindAddress, replaySize = 1000, compression = True):
         """!
         Initialize websocket reporter.
 
         @param outputFormatter Formatter object for final report result
+        @param bindAddress Tuple (address, port).
+        @param replaySize Number of recent reports kept for resuming sessions.
+        @param compression Allow sessions to negotiate permessage-deflate.
         """
-        StreamingReporter.__init__(self, synchronizer, outputFormatter)
+        StreamingReporter.__init__(self, synchronizer, outputFormatter, replaySize, compression)
         self.bindAddress = bindAddress
         self.sessions = set()
-        self.server = websockets.serve(self.handleClient, 'localhost', 8765)
+        self.server = None
+        self.loop = None
 
     def __call__(self):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
-        self.loop.set_debug(True)
-        self.loop.create_task(self.server)
-        self.loop.run_forever()
+        self.loop.run_until_complete(self.startServer())
+        self.running = True
+        try:
+            self.loop.run_forever()
+        finally:
+            self.running = False
+            self.loop.close()
+
+    async def startServer(self):
+        listenAddress, listenPort = self.bindAddress
+        extensions = None
+        if self.compression:
+            # Same settings as default permessage-deflate of websockets.
+            extensions = [MeteredDeflateFactory(server_max_window_bits = 12, client_max_window_bits = 12,
+                compress_settings = {"memLevel": 5})]
+        self.server = await websockets.serve(self.handleClient, listenAddress, listenPort,
+            compression = None, extensions = extensions)
 
     def stop(self):
+        """!
+        Stop reporter. Event loop ends when all sessions sent their queued reports.
+        """
+        if self.running:
+            self.running = False
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+
+    async def shutdown(self):
+        """!
+        Stop sessions, close server and stop event loop.
+        """
+        sessions = list(self.sessions)
+        for session in sessions:
+            session.stop()
+        await asyncio.gather(*[session.finished.wait() for session in sessions])
         self.server.close()
+        await self.server.wait_closed()
+        self.loop.stop()
 
     def report(self, deviceReport):
+        if not self.running:
+            return
         if deviceReport.hasAlarmChanges() or deviceReport.hasPresenceUpdate():
-            for session in self.sessions:
-                self.loop.call_soon_threadsafe(self.addUpdate, session, deviceReport)
-
-    def addUpdate(self, session, deviceReport):
-        self.loop.create_task(session.update(deviceReport))
-
-    @asyncio.coroutine
-    def handleClient(self, websocket, path):
+            sequence, text = self.publish(deviceReport)
+            for session in list(self.sessions):
+                self.loop.call_soon_threadsafe(session.update, sequence, text)
+
+    def getSessionStatistics(self):
+        return [session.getStatistics() for session in list(self.sessions)]
+
+    async def handleClient(self, websocket, path = None):
+        if path is None:
+            # Newer websockets versions pass only connection to handler.
+            request = getattr(websocket, "request", None)
+            path = request.path if request is not None else None
         session = WebsocketReporterSession(self, self.outputFormatter, websocket, path)
         self.sessions.add(session)
-        yield from session.handleSession()
+        try:
+            await session.handleSession()
+        finally:
+            self.sessions.discard(session)
 
 class WebsocketReporterSession:
     """!
     Single websocket session.
     """
 
+    ## @var sequence
+    # Sequence number of last report sent to client.
+
+    ## @var sentBytes
+    # Number of message bytes sent to client, before compression.
+
     def __init__(self, sessionManager, formatter, websocket, path):
         self.sessionManager = sessionManager
         self.formatter = formatter
         self.websocket = websocket
         self.path = path
         self.reportQueue = asyncio.Queue()
+        self.finished = asyncio.Event()
         self.running = False
+        self.sequence = 0
+        self.sentBytes = 0
+
+    def getExtension(self):
+        """!
+        Get negotiated compression extension.
+
+        @return MeteredExtension object, or None if session isn't compressed.
+        """
+        # Newer websockets versions keep extensions in protocol object.
+        protocol = getattr(self.websocket, "protocol", self.websocket)
+        for extension in getattr(protocol, "extensions", None) or []:
+            if isinstance(extension, MeteredExtension):
+                return extension
+        return None
+
+    def getStatistics(self):
+        """!
+        Get session traffic. Sizes are message payload sizes, without framing.
 
-    @asyncio.coroutine
-    def handleSession(self):
+        @return Tuple (address, compression, raw bytes, sent bytes).
+        """
+        address = getattr(self.websocket, "remote_address", None)
+        extension = self.getExtension()
+        if extension is None:
+            return address, "none", self.sentBytes, self.sentBytes
+        return address, "deflate", extension.rawBytes, extension.sentBytes
+
+    def getResumePosition(self):
+        """!
+        Get stream position requested by query parameters of request path.
+
+        @return Tuple (stream, sequence), both None if client doesn't resume.
+        """
+        if self.path is None:
+            return None, None
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            return query["stream"][0], int(query["seq"][0])
+        except (KeyError, ValueError) as ex:
+            return None, None
+
+    async def handleSession(self):
         self.running = True
-        # TODO: Really need to fix this!!
-        toSend = "{}\n".format(self.formatter.formatInitialData(self.sessionManager.deviceRegistry.getDeviceReports()))
-        yield from self.websocket.send(toSend)
-        while self.running:
-            deviceReport = yield from self.reportQueue.get()
-            if deviceReport is not None:
-                toSend = "{}\n".format(self.formatter.formatDeviceReport(deviceReport))
-                yield from self.websocket.send(toSend)
-
-    @asyncio.coroutine
-    def update(self, deviceReport):
-        yield from self.reportQueue.put(deviceReport)
+        reader = asyncio.ensure_future(self.readRequests())
+        try:
+            self.sequence, lines = self.sessionManager.getSessionStart(*self.getResumePosition())
+            for line in lines:
+                await self.send("{}\n".format(line))
+            while True:
+                item = await self.reportQueue.get()
+                if item is None:
+                    # Session was stopped, everything queued before was sent.
+                    break
+                if isinstance(item, str):
+                    # Already formatted response to client request.
+                    toSend = "{}\n".format(item)
+                else:
+                    sequence, text = item
+                    if sequence <= self.sequence:
+                        # Report was part of session start data.
+                        continue
+                    self.sequence = sequence
+                    toSend = "{}\n".format(text)
+                await self.send(toSend)
+        except websockets.ConnectionClosed as ex:
+            pass
+        finally:
+            self.running = False
+            reader.cancel()
+            self.finished.set()
+
+    async def send(self, message):
+        await self.websocket.send(message)
+        # JSON output is ASCII, so number of characters is number of bytes.
+        self.sentBytes += len(message)
+
+    async def readRequests(self):
+        """!
+        Read client requests. Responses are sent by session loop.
+        """
+        try:
+            async for request in self.websocket:
+                self.reportQueue.put_nowait(self.sessionManager.handleRequest(request))
+        except websockets.ConnectionClosed as ex:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """!
+        Stop session. Reports queued before stop are still sent.
+        """
+        self.running = False
+        # Put None into message queue to wake up session loop.
+        self.reportQueue.put_nowait(None)
+
+    def update(self, sequence, text):
+        """!
+        Queue published report.
+
+        @param sequence Report sequence number.
+        @param text Formatted report.
+        """
+        self.reportQueue.put_nowait((sequence, text))
+
+def getCompression(config, reporterSection):
+    """!
+    Get compression flag of streaming reporter.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return True if sessions may negotiate compression.
+    @throws ConfigException If value isn't boolean.
+    """
+    try:
+        return config.parser.getboolean(reporterSection, "Compression", fallback = True)
+    except ValueError as ex:
+        raise ConfigException("Section {}: {}".format(reporterSection, ex))
+
+def createSocketReporter(config, reporterSection):
+    """!
+    Create SocketReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return SocketReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    listenAddress = config.getListenAddress(reporterSection)
+    return SocketReporter(None, JSONFormatter(SystemDataProvider()), listenAddress,
+        config.getNonNegativeInt(reporterSection, "ReplaySize", 1000),
+        config.getNonNegativeInt(reporterSection, "ResumeTimeout", 0),
+        getCompression(config, reporterSection),
+        config.getNonNegativeInt(reporterSection, "OutputLimit", 0))
+
+def createWebsocketReporter(config, reporterSection):
+    """!
+    Create WebsocketReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return WebsocketReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    listenAddress = config.getListenAddress(reporterSection)
+    return WebsocketReporter(None, JSONFormatter(SystemDataProvider()), listenAddress,
+        config.getNonNegativeInt(reporterSection, "ReplaySize", 1000),
+        getCompression(config, reporterSection))
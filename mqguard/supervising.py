@@ -20,10 +20,13 @@ Supervising at endividual MQTT endpoints.
 import threading
 import datetime
 import copy
+import time
+import json
 
 from mqreceive.data import DataIdentifier
-from mqguard.alarms import AlarmType
+from mqguard.alarms import AlarmType, TimeoutAlarm
 from mqguard.common import DeviceReport
+from mqguard.topics import TopicTrie, isWildcardTopic, topicMatches
 
 class DeviceRegistry:
     """!
@@ -40,6 +43,48 @@ class DeviceRegistry:
     ## @var presenceMapping
     # Mapping device : presenceTrack
 
+    ## @var topicTries
+    # Mapping broker : TopicTrie. Trie values are tuples (device, UpdateGuard).
+
+    ## @var deviceTemplates
+    # List of registered DeviceTemplate objects.
+
+    ## @var discoveryTries
+    # Mapping broker : TopicTrie. Trie values are DeviceTemplate objects.
+
+    ## @var discoveredPresence
+    # Mapping presence DataIdentifier : device. Contains already handled presence
+    # topics of device templates.
+
+    ## @var discoveryListeners
+    # List of callables notified about discovered devices.
+
+    ## @var history
+    # AlarmHistory object or None if history isn't recorded.
+
+    ## @var statistics
+    # IngestStatistics object or None if traffic isn't counted.
+
+    ## @var flapDetector
+    # FlapDetector object or None if alarm flapping isn't detected.
+
+    ## @var timeoutTable
+    # TimeoutTable object evaluating timeout alarms, or None if periodic alarms are
+    # checked one by one.
+
+    ## @var periodicDevices
+    # Set of devices with periodic alarms not evaluated by timeout table. Only these
+    # devices are checked one by one when timeout table is used.
+
+    ## @var restoredStates
+    # Mapping device : {(broker name, topic, alarm name) : (active, message)} of
+    # alarm states loaded from state checkpoint. State is taken over when alarm
+    # track is created.
+
+    ## @var lock
+    # Lock guarding registry state. Messages, periodic checks and runtime changes
+    # of registry come from different threads.
+
     def __init__(self, reportManager):
         """!
         Initiate DeviceRegistry object.
@@ -51,6 +96,19 @@ class DeviceRegistry:
         self.guardedDevices = {}
         self.alarmMapping = {}
         self.presenceMapping = {}
+        self.topicTries = {}
+        self.deviceTemplates = []
+        self.discoveryTries = {}
+        self.discoveredPresence = {}
+        self.discoveryListeners = []
+        self.history = None
+        self.timeoutTable = None
+        self.periodicDevices = set()
+        self.statistics = None
+        self.flapDetector = None
+        self.restoredStates = {}
+        self.periodicThread = None
+        self.lock = threading.RLock()
 
         # Inject device registry to all reporters.
         self.reportManager.injectDeviceRegistry(self)
@@ -62,8 +120,236 @@ class DeviceRegistry:
         @param device Device identifier.
         @param guard DeviceGuard object.
         """
-        self.guardedDevices[device] = guard
-        self.addAlarmTrack(device, guard)
+        with self.lock:
+            self.guardedDevices[device] = guard
+            self.addAlarmTrack(device, guard)
+            if guard.hasPresence():
+                self.registerUpdateGuard(device, guard.presenceGuard)
+            for updateGuard in guard.getConfiguredGuards():
+                self.registerUpdateGuard(device, updateGuard)
+            if guard.hasPeriodicChecks():
+                self.periodicDevices.add(device)
+
+    def removeGuardedDevice(self, device, forgetHistory = True):
+        """!
+        Remove guarded device together with its alarm state.
+
+        @param device Device identifier.
+        @param forgetHistory Remove device alarm history too.
+        """
+        with self.lock:
+            self.releaseTimeoutAlarms(self.alarmMapping[device], {})
+            self.dropGuardedDevice(device, forgetHistory)
+
+    def dropGuardedDevice(self, device, forgetHistory):
+        """!
+        Remove guarded device without releasing its timeout alarms.
+
+        @param device Device identifier.
+        @param forgetHistory Remove device alarm history too.
+        """
+        with self.lock:
+            if forgetHistory and self.history is not None:
+                self.history.removeDevice(device)
+            if self.flapDetector is not None:
+                self.flapDetector.forgetDevice(device)
+            guard = self.guardedDevices.pop(device)
+            self.periodicDevices.discard(device)
+            if guard.hasPresence():
+                self.unregisterUpdateGuard(device, guard.presenceGuard)
+            for updateGuard in guard.getConfiguredGuards():
+                self.unregisterUpdateGuard(device, updateGuard)
+            del self.alarmMapping[device]
+            del self.presenceMapping[device]
+            for dataIdentifier in [di for di, d in self.discoveredPresence.items() if d == device]:
+                del self.discoveredPresence[dataIdentifier]
+
+    def replaceGuardedDevice(self, device, guard, keptDataIdentifiers, keepPresence):
+        """!
+        Replace guard of registered device. Update guards of kept data identifiers
+        are taken over from current device guard together with their alarm state.
+
+        @param device Device identifier.
+        @param guard New DeviceGuard object.
+        @param keptDataIdentifiers Set of DataIdentifier objects of unchanged update guards.
+        @param keepPresence Keep current presence guard and its state.
+        """
+        with self.lock:
+            currentGuard = self.guardedDevices[device]
+            alarmMapping = self.alarmMapping[device]
+            presence = self.presenceMapping[device]
+            guard.adoptUpdateGuards(currentGuard, keptDataIdentifiers)
+            if keepPresence:
+                guard.addPresenceGuard(currentGuard.presence, currentGuard.presenceGuard)
+            discovered = [di for di, d in self.discoveredPresence.items() if d == device]
+            # Timeout alarms of kept guards stay in timeout table with their state.
+            self.dropGuardedDevice(device, False)
+            self.addGuardedDevice(device, guard)
+            self.releaseTimeoutAlarms(alarmMapping, self.alarmMapping[device])
+            for dataIdentifier in discovered:
+                self.discoveredPresence[dataIdentifier] = device
+            for dataIdentifier, alarmTracks in self.alarmMapping[device].items():
+                currentTracks = alarmMapping.get(dataIdentifier, {})
+                for alarm in alarmTracks:
+                    if alarm in currentTracks:
+                        alarmTracks[alarm] = currentTracks[alarm]
+            if keepPresence:
+                self.presenceMapping[device] = presence
+
+    def removeDeviceTemplate(self, template):
+        """!
+        Remove device template. Already discovered devices are kept.
+
+        @param template DeviceTemplate object.
+        """
+        with self.lock:
+            self.deviceTemplates.remove(template)
+            dataIdentifier = template.presenceDataIdentifier
+            self.discoveryTries[dataIdentifier.broker].remove(dataIdentifier.topic, template)
+
+    def registerUpdateGuard(self, device, updateGuard):
+        """!
+        Insert update guard into topic trie of its broker.
+
+        @param device Device identifier.
+        @param updateGuard UpdateGuard object.
+        """
+        dataIdentifier = updateGuard.dataIdentifier
+        if dataIdentifier.broker not in self.topicTries:
+            self.topicTries[dataIdentifier.broker] = TopicTrie()
+        self.topicTries[dataIdentifier.broker].add(dataIdentifier.topic, (device, updateGuard))
+
+    def unregisterUpdateGuard(self, device, updateGuard):
+        """!
+        Remove update guard from topic trie of its broker.
+
+        @param device Device identifier.
+        @param updateGuard UpdateGuard object.
+        """
+        dataIdentifier = updateGuard.dataIdentifier
+        self.topicTries[dataIdentifier.broker].remove(dataIdentifier.topic, (device, updateGuard))
+
+    def setHistory(self, history):
+        """!
+        Enable recording of alarm transitions.
+
+        @param history AlarmHistory object.
+        """
+        self.history = history
+
+    def setTimeoutTable(self, timeoutTable):
+        """!
+        Evaluate timeout alarms by timeout table. Must be set before devices are added.
+
+        @param timeoutTable TimeoutTable object or None.
+        """
+        self.timeoutTable = timeoutTable
+
+    def setStatistics(self, statistics):
+        """!
+        Enable counting of received traffic.
+
+        @param statistics IngestStatistics object.
+        """
+        self.statistics = statistics
+
+    def setFlapDetector(self, flapDetector):
+        """!
+        Enable flap damping of alarm state changes.
+
+        @param flapDetector FlapDetector object.
+        """
+        self.flapDetector = flapDetector
+
+    def getDeviceHistory(self, device, since = None, until = None):
+        """!
+        Get alarm and presence transitions of device from time range.
+
+        @param device Device identifier.
+        @param since Lower time bound as UNIX timestamp. None for no bound.
+        @param until Upper time bound as UNIX timestamp. None for no bound.
+        @return List of tuples (timestamp, dataIdentifier, alarmName, active, message).
+        @throws KeyError If device isn't registered.
+        """
+        with self.lock:
+            if device not in self.guardedDevices:
+                raise KeyError(device)
+            if self.history is None:
+                return []
+            return self.history.getTransitions(device, since, until)
+
+    def getValueHistory(self, device, dataIdentifier, since = None, until = None):
+        """!
+        Get recent numeric values of device data identifier.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param since Lower time bound as UNIX timestamp. None for no bound.
+        @param until Upper time bound as UNIX timestamp. None for no bound.
+        @return List of tuples (timestamp, value).
+        """
+        with self.lock:
+            if self.history is None:
+                return []
+            return self.history.getValues(device, dataIdentifier, since, until)
+
+    def findDataIdentifier(self, device, brokerName, topic):
+        """!
+        Find guarded data identifier of device.
+
+        @param device Device identifier.
+        @param brokerName Broker name.
+        @param topic Concrete topic.
+        @return DataIdentifier object or None if device doesn't guard the topic.
+        """
+        with self.lock:
+            for dataIdentifier in self.alarmMapping.get(device, {}):
+                if dataIdentifier.broker.name == brokerName and dataIdentifier.topic == topic:
+                    return dataIdentifier
+            return None
+
+    def addDeviceTemplate(self, template):
+        """!
+        Register device template for automatic device discovery.
+
+        @param template DeviceTemplate object.
+        """
+        with self.lock:
+            self.deviceTemplates.append(template)
+            dataIdentifier = template.presenceDataIdentifier
+            if dataIdentifier.broker not in self.discoveryTries:
+                self.discoveryTries[dataIdentifier.broker] = TopicTrie()
+            self.discoveryTries[dataIdentifier.broker].add(dataIdentifier.topic, template)
+
+    def addDiscoveryListener(self, listener):
+        """!
+        Register callable notified about every discovered device.
+
+        @param listener Callable accepting device identifier and DeviceGuard object.
+        """
+        self.discoveryListeners.append(listener)
+
+    def discoverDevice(self, templates, dataIdentifier):
+        """!
+        Create device from first matching template and register it. New device is
+        announced to report manager and discovery listeners.
+
+        @param templates Iterable of matching DeviceTemplate objects.
+        @param dataIdentifier Presence DataIdentifier object.
+        """
+        if dataIdentifier in self.discoveredPresence:
+            return
+        for template in templates:
+            device, deviceGuard = template.build(dataIdentifier)
+            self.discoveredPresence[dataIdentifier] = device
+            if device in self.guardedDevices:
+                # Name collision with already guarded device. Keep the existing one.
+                return
+            self.addGuardedDevice(device, deviceGuard)
+            self.reportManager.addDevice(device, deviceGuard)
+            for listener in self.discoveryListeners:
+                listener(device, deviceGuard)
+            return
 
     def addAlarmTrack(self, device, guard):
         """!
@@ -75,10 +361,93 @@ class DeviceRegistry:
         self.alarmMapping[device] = {}
         guardAlarms = guard.getGuardAlarms()
         for dataIdentifier in guardAlarms:
-            self.alarmMapping[device][dataIdentifier] = {}
-            for alarm in guardAlarms[dataIdentifier]:
-                self.alarmMapping[device][dataIdentifier][alarm] = self.createAlarmTrack()
-        self.presenceMapping[device] = self.createPresence(guard)
+            self.addUpdateAlarmTrack(device, dataIdentifier, guardAlarms[dataIdentifier])
+        devicePresence, track = self.createPresence(guard)
+        if guard.hasPresence():
+            restored = self.takeRestoredState(device, devicePresence.getDataIdentifier(), "Presence")
+            if restored is not None:
+                track = restored[0], False, False, restored[1]
+        self.presenceMapping[device] = devicePresence, track
+
+    def takeRestoredState(self, device, dataIdentifier, name):
+        """!
+        Take alarm state loaded from state checkpoint.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param name Alarm name, 'Presence' for presence track.
+        @return Tuple (active, message), or None if no state was restored.
+        """
+        deviceStates = self.restoredStates.get(device)
+        if deviceStates is None:
+            return None
+        return deviceStates.pop((dataIdentifier.broker.name, dataIdentifier.topic, name), None)
+
+    def restoreAlarmStates(self, states):
+        """!
+        Set alarm states loaded from state checkpoint. States are applied to alarm
+        tracks created later, so they must be set before devices are added. States
+        of wildcard guard instances are applied when topic is seen first time.
+
+        @param states Iterable of tuples (device, broker name, topic, alarm name, active, message).
+        """
+        with self.lock:
+            for device, brokerName, topic, name, active, message in states:
+                self.restoredStates.setdefault(device, {})[(brokerName, topic, name)] = active, message
+
+    def getAlarmStates(self):
+        """!
+        Get current state of all alarms and presence tracks.
+
+        @return List of tuples (device, broker name, topic, alarm name, active, message).
+        """
+        states = []
+        with self.lock:
+            for device, alarmMapping in self.alarmMapping.items():
+                for dataIdentifier, alarmTracks in alarmMapping.items():
+                    for alarm, track in alarmTracks.items():
+                        states.append((device, dataIdentifier.broker.name, dataIdentifier.topic,
+                            alarm.getName(), track[0], track[3]))
+                devicePresence, track = self.presenceMapping[device]
+                if devicePresence is not None and devicePresence.getDataIdentifier() is not None:
+                    dataIdentifier = devicePresence.getDataIdentifier()
+                    states.append((device, dataIdentifier.broker.name, dataIdentifier.topic,
+                        "Presence", track[0], track[3]))
+        return states
+
+    def addUpdateAlarmTrack(self, device, dataIdentifier, alarms):
+        """!
+        Add alarm tracks of single data identifier.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param alarms Iterable of alarms.
+        """
+        alarmTracks = self.alarmMapping[device].setdefault(dataIdentifier, {})
+        for alarm in alarms:
+            alarmTracks[alarm] = self.createAlarmTrack()
+            restored = self.takeRestoredState(device, dataIdentifier, alarm.getName())
+            if restored is not None:
+                alarmTracks[alarm] = restored[0], False, False, restored[1]
+            if self.timeoutTable is not None and isinstance(alarm, TimeoutAlarm):
+                self.timeoutTable.register(alarm, (device, dataIdentifier, alarm),
+                    alarm.period.total_seconds(), time.monotonic(), alarmTracks[alarm][0])
+
+    def releaseTimeoutAlarms(self, alarmMapping, keptAlarmMapping):
+        """!
+        Remove timeout alarms from timeout table.
+
+        @param alarmMapping Mapping DataIdentifier : alarm tracks of released alarms.
+        @param keptAlarmMapping Mapping DataIdentifier : alarm tracks of alarms which
+            are kept in the table.
+        """
+        if self.timeoutTable is None:
+            return
+        for dataIdentifier, alarmTracks in alarmMapping.items():
+            keptTracks = keptAlarmMapping.get(dataIdentifier, {})
+            for alarm in alarmTracks:
+                if alarm not in keptTracks and alarm.isTableChecked():
+                    self.timeoutTable.release(alarm)
 
     def createAlarmTrack(self):
         """!
@@ -125,23 +494,150 @@ class DeviceRegistry:
         @param dataIdentifier Message data identifier object.
         @param data Message bytes.
         """
-        for device, deviceGuard in self.guardedDevices.items():
-            result = deviceGuard.messageReceived(dataIdentifier, data)
-            for di, alarms in result.updateGuardMapping.items():
-                self.setChanges(device, di, alarms)
-            if result.hasPresenceUpdate():
-                self.updateDevicePresence(device, result.presenceAlarms)
-            self.makeReport(device)
+        with self.lock:
+            # Tries change when templates or devices are reloaded, so they are matched under lock.
+            discoveryTrie = self.discoveryTries.get(dataIdentifier.broker)
+            if discoveryTrie is not None and dataIdentifier not in self.discoveredPresence:
+                templates = discoveryTrie.match(dataIdentifier.topic)
+                if len(templates) > 0:
+                    self.discoverDevice(templates, dataIdentifier)
+            topicTrie = self.topicTries.get(dataIdentifier.broker)
+            matches = topicTrie.match(dataIdentifier.topic) if topicTrie is not None else []
+            if self.statistics is not None:
+                self.statistics.addMessage(dataIdentifier, len(data), len(matches) == 0)
+            decodeFailed = False
+            matchingGuards = self.groupByDevice(matches)
+            for device, updateGuards in matchingGuards.items():
+                deviceGuard = self.guardedDevices[device]
+                for updateGuard in updateGuards:
+                    if self.checkUpdateGuard(device, deviceGuard, updateGuard, dataIdentifier, data):
+                        decodeFailed = True
+                self.makeReport(device)
+            if decodeFailed and self.statistics is not None:
+                self.statistics.addDecodeFailure(dataIdentifier)
+
+    def onNewDataBatch(self, messages):
+        """!
+        Batch of messages received by ingest backend. Registry lock is taken once
+        for whole batch. Every message is still reported separately.
+
+        @param messages Iterable of tuples (dataIdentifier, data).
+        """
+        with self.lock:
+            for dataIdentifier, data in messages:
+                self.onNewData(dataIdentifier, data)
+
+    def groupByDevice(self, matches):
+        """!
+        Group topic trie matches by device.
+
+        @param matches Iterable of tuples (device, UpdateGuard).
+        @return Mapping device : list of UpdateGuard objects.
+        """
+        matchingGuards = {}
+        for device, updateGuard in matches:
+            matchingGuards.setdefault(device, []).append(updateGuard)
+        return matchingGuards
+
+    def checkUpdateGuard(self, device, deviceGuard, updateGuard, dataIdentifier, data):
+        """!
+        Check message against single matching update guard.
+
+        @param device Device identifier.
+        @param deviceGuard DeviceGuard object.
+        @param updateGuard Matching UpdateGuard object.
+        @param dataIdentifier Message data identifier object.
+        @param data Message bytes.
+        @return True if update guard couldn't decode the message, False otherwise.
+        """
+        if updateGuard is deviceGuard.presenceGuard:
+            self.updateDevicePresence(device, updateGuard.getUpdateCheck(dataIdentifier, data))
+            return False
+        if updateGuard.isWildcard():
+            updateGuard = self.getWildcardInstance(device, deviceGuard, updateGuard, dataIdentifier)
+        # Aggregated guards keep their state under topic filter.
+        self.setChanges(device, updateGuard.dataIdentifier, updateGuard.getUpdateCheck(dataIdentifier, data))
+        if self.history is not None and self.history.hasValueHistory() and updateGuard.lastValue is not None:
+            self.addValueHistory(device, dataIdentifier, updateGuard.lastValue)
+        return updateGuard.decodeFailed
+
+    def addValueHistory(self, device, dataIdentifier, value):
+        """!
+        Store numeric message value into history.
+
+        @param device Device identifier.
+        @param dataIdentifier Message data identifier object.
+        @param value Message value already parsed by update guard.
+        """
+        self.history.addValue(device, dataIdentifier, time.time(), value)
+
+    def getWildcardInstance(self, device, deviceGuard, wildcardGuard, dataIdentifier):
+        """!
+        Get update guard instance of wildcard guard for concrete data identifier.
+        Instance and its alarm tracks are created when the topic is seen first time.
+
+        @param device Device identifier.
+        @param deviceGuard DeviceGuard object.
+        @param wildcardGuard Wildcard UpdateGuard object.
+        @param dataIdentifier Concrete DataIdentifier object.
+        @return UpdateGuard object.
+        """
+        updateGuard = deviceGuard.getWildcardInstance(wildcardGuard, dataIdentifier)
+        if updateGuard is None:
+            updateGuard = deviceGuard.addWildcardInstance(wildcardGuard, dataIdentifier)
+            self.addUpdateAlarmTrack(device, dataIdentifier, updateGuard.getAlarms())
+            if updateGuard.hasPeriodicChecks():
+                self.periodicDevices.add(device)
+        return updateGuard
 
     def onPeriodic(self):
         """!
         Periodic alarm check.
         """
-        for device, deviceGuard in self.guardedDevices.items():
-            result = deviceGuard.onPeriodic();
-            for di, alarms in result.updateGuardMapping.items():
-                self.setChanges(device, di, alarms)
-            self.makeReport(device)
+        if self.timeoutTable is not None:
+            self.checkTimeoutTable()
+        with self.lock:
+            if self.timeoutTable is None:
+                devices = self.guardedDevices
+            else:
+                # Periodic alarms of other devices are evaluated by timeout table.
+                devices = self.periodicDevices
+            for device in devices:
+                result = self.guardedDevices[device].onPeriodic();
+                for di, alarms in result.updateGuardMapping.items():
+                    self.setChanges(device, di, alarms)
+                self.makeReport(device)
+        if self.flapDetector is not None:
+            self.checkSettledAlarms()
+
+    def checkTimeoutTable(self):
+        """!
+        Periodic check of timeout table. Only devices with newly expired or recovered
+        alarms are reported. Other periodic alarms are checked by update guards.
+        """
+        with self.lock:
+            expired, recovered = self.timeoutTable.check(time.monotonic())
+            devices = set()
+            for (device, dataIdentifier, alarm), elapsed in expired:
+                self.setChanges(device, dataIdentifier, {alarm: (True, alarm.getTimeoutMessage(elapsed))})
+                devices.add(device)
+            for device, dataIdentifier, alarm in recovered:
+                self.setChanges(device, dataIdentifier, {alarm: (False, None)})
+                devices.add(device)
+            for device in devices:
+                self.makeReport(device)
+
+    def checkSettledAlarms(self):
+        """!
+        Report real state of alarms which stopped flapping.
+        """
+        with self.lock:
+            devices = set()
+            for device, dataIdentifier, alarm, active, message in self.flapDetector.getSettled(time.monotonic()):
+                self.setAlarmState(device, dataIdentifier, alarm, active, message)
+                devices.add(device)
+            for device in devices:
+                self.makeReport(device)
 
     def makeReport(self, device):
         """!
@@ -156,12 +652,43 @@ class DeviceRegistry:
     def setChanges(self, device, dataIdentifier, alarms):
         for alarm in alarms:
             active, message = alarms[alarm]
-            wasActive, changed, updated, previousMessage = self.alarmMapping[device][dataIdentifier][alarm]
-            _changed = False
-            if active != wasActive:
-                _changed = True
-            _updated = True
-            self.alarmMapping[device][dataIdentifier][alarm] = (active, _changed, _updated, message)
+            if self.flapDetector is not None:
+                wasActive = self.alarmMapping[device][dataIdentifier][alarm][0]
+                active, message = self.flapDetector.update(device, dataIdentifier, alarm,
+                    wasActive, active, message, time.monotonic())
+            self.setAlarmState(device, dataIdentifier, alarm, active, message)
+
+    def setAlarmState(self, device, dataIdentifier, alarm, active, message):
+        """!
+        Store alarm state into alarm track. State change is recorded into history.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param alarm Alarm object.
+        @param active Is alarm active flag.
+        @param message Alarm message.
+        """
+        alarmTracks = self.alarmMapping[device][dataIdentifier]
+        wasActive, changed, updated, previousMessage = alarmTracks[alarm]
+        _changed = False
+        if active != wasActive:
+            _changed = True
+            self.addHistory(device, dataIdentifier, alarm, active, message)
+        _updated = True
+        alarmTracks[alarm] = (active, _changed, _updated, message)
+
+    def addHistory(self, device, dataIdentifier, alarm, active, message):
+        """!
+        Store alarm transition into history.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param alarm Alarm object.
+        @param active Is alarm active flag.
+        @param message Alarm message.
+        """
+        if self.history is not None:
+            self.history.addTransition(device, dataIdentifier, time.time(), alarm.getName(), active, message)
 
     def updateDevicePresence(self, device, presenceAlarms):
         devicePresence, track = self.presenceMapping[device]
@@ -171,6 +698,7 @@ class DeviceRegistry:
             _changed = False
             if isActive != wasActive:
                 _changed = True
+                self.addHistory(device, devicePresence.getDataIdentifier(), alarm, isActive, message)
             _updated = True
             track = isActive, _changed, _updated, message
             self.presenceMapping[device] = devicePresence, track
@@ -188,18 +716,25 @@ class DeviceRegistry:
 
     def start(self):
         """!
+        Start periodic checker thread.
         """
-        threading.Thread(target = self.periodicChecker).start()
+        self.periodicThread = threading.Thread(target = self.periodicChecker)
+        self.periodicThread.start()
 
     def stop(self):
         """!
+        Stop periodic checker thread. Returns after running periodic check finishes.
         """
         self.periodicChecker.stop()
+        if self.periodicThread is not None:
+            self.periodicThread.join()
+            self.periodicThread = None
 
     def getDeviceReports(self):
         reports = {}
-        for device in self.alarmMapping:
-            reports[device] = self.getReport(device)
+        with self.lock:
+            for device in self.alarmMapping:
+                reports[device] = self.getReport(device)
         return reports
 
     def getReport(self, device):
@@ -222,6 +757,13 @@ class DeviceGuard:
     ## @var updateGuards
     # List of update guards objects.
 
+    ## @var wildcardGuards
+    # List of update guards with wildcard topic. They are used as templates for
+    # update guards of concrete topics.
+
+    ## @var wildcardInstances
+    # Mapping (wildcard UpdateGuard, DataIdentifier) : UpdateGuard.
+
     def __init__(self):
         """!
         Initiate guarded device.
@@ -229,6 +771,8 @@ class DeviceGuard:
         @param name Device name.
         """
         self.updateGuards = []
+        self.wildcardGuards = []
+        self.wildcardInstances = {}
         self.presenceGuard = None
         self.presence = None
 
@@ -249,7 +793,66 @@ class DeviceGuard:
         """"!
         Add update guard object.
         """
+        if updateGuard.isWildcard():
+            self.wildcardGuards.append(updateGuard)
+        else:
+            self.updateGuards.append(updateGuard)
+
+    def getConfiguredGuards(self):
+        """!
+        Get update guards added by addUpdateGuard(). Instances of wildcard update
+        guards are not included.
+
+        @return Iterable of UpdateGuard objects.
+        """
+        instances = set(self.wildcardInstances.values())
+        for updateGuard in self.updateGuards:
+            if updateGuard not in instances:
+                yield updateGuard
+        for updateGuard in self.wildcardGuards:
+            yield updateGuard
+
+    def adoptUpdateGuards(self, deviceGuard, dataIdentifiers):
+        """!
+        Replace update guards of given data identifiers with update guards of other
+        device guard. Instances of adopted wildcard update guards are taken too.
+
+        @param deviceGuard DeviceGuard object.
+        @param dataIdentifiers Set of DataIdentifier objects.
+        """
+        adopted = {}
+        for updateGuard in deviceGuard.getConfiguredGuards():
+            if updateGuard.dataIdentifier in dataIdentifiers:
+                adopted[updateGuard.dataIdentifier] = updateGuard
+        self.updateGuards = [adopted.get(g.dataIdentifier, g) for g in self.updateGuards]
+        self.wildcardGuards = [adopted.get(g.dataIdentifier, g) for g in self.wildcardGuards]
+        for (wildcardGuard, dataIdentifier), updateGuard in deviceGuard.wildcardInstances.items():
+            if adopted.get(wildcardGuard.dataIdentifier) is wildcardGuard:
+                self.wildcardInstances[(wildcardGuard, dataIdentifier)] = updateGuard
+                self.updateGuards.append(updateGuard)
+
+    def getWildcardInstance(self, wildcardGuard, dataIdentifier):
+        """!
+        Get existing instance of wildcard update guard.
+
+        @param wildcardGuard Wildcard UpdateGuard object.
+        @param dataIdentifier Concrete DataIdentifier object.
+        @return UpdateGuard object or None if topic wasn't seen yet.
+        """
+        return self.wildcardInstances.get((wildcardGuard, dataIdentifier))
+
+    def addWildcardInstance(self, wildcardGuard, dataIdentifier):
+        """!
+        Create update guard for concrete topic matching wildcard update guard.
+
+        @param wildcardGuard Wildcard UpdateGuard object.
+        @param dataIdentifier Concrete DataIdentifier object.
+        @return New UpdateGuard object.
+        """
+        updateGuard = wildcardGuard.createInstance(dataIdentifier)
+        self.wildcardInstances[(wildcardGuard, dataIdentifier)] = updateGuard
         self.updateGuards.append(updateGuard)
+        return updateGuard
 
     def messageReceived(self, dataIdentifier, data):
         """!
@@ -261,10 +864,14 @@ class DeviceGuard:
         presenceAlarms = None
         if self.presenceGuard is not None and self.presenceGuard.isUpdateRelevant(dataIdentifier):
             presenceAlarms = self.presenceGuard.getUpdateCheck(dataIdentifier, data)
+        for wildcardGuard in self.wildcardGuards:
+            if wildcardGuard.isUpdateRelevant(dataIdentifier) and \
+                    self.getWildcardInstance(wildcardGuard, dataIdentifier) is None:
+                self.addWildcardInstance(wildcardGuard, dataIdentifier)
         for updateGuard in self.updateGuards:
             if updateGuard.isUpdateRelevant(dataIdentifier):
                 alarms = updateGuard.getUpdateCheck(dataIdentifier, data)
-                updateGuardMapping[dataIdentifier] = alarms
+                updateGuardMapping[updateGuard.dataIdentifier] = alarms
         return DeviceGuardResult(presenceAlarms, updateGuardMapping)
 
     def onPeriodic(self):
@@ -274,9 +881,18 @@ class DeviceGuard:
         updateGuardMapping = {}
         for updateGuard in self.updateGuards:
             alarms = updateGuard.getPeriodicCheck()
-            updateGuardMapping[updateGuard.dataIdentifier] = alarms
+            if len(alarms) > 0:
+                updateGuardMapping[updateGuard.dataIdentifier] = alarms
         return DeviceGuardResult(None, updateGuardMapping)
 
+    def hasPeriodicChecks(self):
+        """!
+        Check if some update guard has periodic alarm checked by onPeriodic().
+
+        @return True if some periodic alarm isn't evaluated by timeout table.
+        """
+        return any(updateGuard.hasPeriodicChecks() for updateGuard in self.updateGuards)
+
     def getGuardAlarms(self):
         """!
         Get mapping of DataIdentifier: Alarm iterable.
@@ -311,6 +927,15 @@ class UpdateGuard:
     ## @var periodicAlarms
     # List of periodic alarms.
 
+    ## @var lastValue
+    # Numeric value of last message, or None if it isn't known.
+
+    ## @var documentSize
+    # Size limit of JSON messages, or None if no alarm checks JSON document.
+
+    ## @var decodeFailed
+    # Last message couldn't be parsed as number or JSON document.
+
     def __init__(self, name, dataIdentifier):
         """!
         Initiate update guard object.
@@ -320,13 +945,63 @@ class UpdateGuard:
         """
         self.name = name
         self.dataIdentifier = dataIdentifier
+        self.wildcard = dataIdentifier is not None and isWildcardTopic(dataIdentifier.topic)
+        self.numeric = False
+        self.aggregate = False
+        self.lastValue = None
+        self.documentSize = None
+        self.decodeFailed = False
         self.messageAlarms = []
         self.periodicAlarms = []
 
+    def isNumeric(self):
+        """!
+        Check if update guard expects numeric messages.
+
+        @return True if some alarm expects numeric messages, False otherwise.
+        """
+        return self.numeric
+
+    def isWildcard(self):
+        """!
+        Check if update guard is instantiated for every concrete topic matching its
+        topic filter.
+
+        @return True if topic is a wildcard topic filter and guard isn't aggregated,
+            False otherwise.
+        """
+        return self.wildcard and not self.aggregate
+
+    def isAggregate(self):
+        """!
+        Check if update guard checks all matching topics together. Aggregated guard
+        keeps single alarm state under its topic filter.
+
+        @return True if some alarm aggregates topics, False otherwise.
+        """
+        return self.aggregate
+
+    def createInstance(self, dataIdentifier):
+        """!
+        Create update guard for concrete topic. New guard gets copies of all alarms,
+        so every concrete topic keeps its own alarm state.
+
+        @param dataIdentifier Concrete DataIdentifier object.
+        @return New UpdateGuard object.
+        """
+        updateGuard = UpdateGuard(self.name, dataIdentifier)
+        for alarm in self.getAlarms():
+            updateGuard.addAlarm(alarm.clone())
+        return updateGuard
+
     def addAlarm(self, alarm):
         """!
         Add alarm check object.
         """
+        self.numeric = self.numeric or alarm.numeric
+        self.aggregate = self.aggregate or alarm.aggregate
+        if alarm.document:
+            self.documentSize = alarm.maxSize if self.documentSize is None else min(self.documentSize, alarm.maxSize)
         if alarm.alarmType is AlarmType.messageDriven:
             self.messageAlarms.append(alarm)
         else:
@@ -347,22 +1022,72 @@ class UpdateGuard:
             deactivated = alarm.notifyMessage(dataIdentifier, payload)
             if deactivated:
                 alarms[alarm] = (False, None)
+        self.lastValue = self.parseValue(payload) if self.numeric else None
+        document, documentError = self.parseDocument(payload) if self.documentSize is not None else (None, None)
+        self.decodeFailed = (self.numeric and self.lastValue is None) or documentError is not None
         for alarm in self.messageAlarms:
-            alarms[alarm] = alarm.checkMessage(dataIdentifier, payload)
+            if alarm.document:
+                if documentError is not None:
+                    alarms[alarm] = (True, documentError)
+                else:
+                    alarms[alarm] = alarm.checkDocument(dataIdentifier, document)
+            elif alarm.numeric and self.lastValue is not None:
+                alarms[alarm] = alarm.checkValue(dataIdentifier, self.lastValue)
+            else:
+                alarms[alarm] = alarm.checkMessage(dataIdentifier, payload)
         return alarms
 
+    def parseDocument(self, payload):
+        """!
+        Parse JSON message. Message is parsed once for all document alarms. Messages
+        larger than the smallest size limit of document alarms are rejected without parsing,
+        too deeply nested messages are rejected by parser.
+
+        @param payload MQTT data.
+        @return Tuple (document, errorMessage). Error message is None if message was parsed.
+        """
+        if len(payload) > self.documentSize:
+            return None, "Message size {} exceeds limit {}".format(len(payload), self.documentSize)
+        try:
+            return json.loads(payload), None
+        except (ValueError, RecursionError) as ex:
+            return None, "Can't decode message as JSON: {}".format(ex)
+
+    def parseValue(self, payload):
+        """!
+        Parse numeric message value. Value is parsed once for all numeric alarms.
+
+        @param payload MQTT data.
+        @return Float value or None if message isn't a number. Numeric alarms report
+            error of unparsable message themselves.
+        """
+        try:
+            return float(payload)
+        except ValueError:
+            return None
+
     def getPeriodicCheck(self):
         """!
-        Periodic checking for update timeouts.
+        Periodic checking for update timeouts. Alarms evaluated by timeout table
+        are skipped.
 
         @return Tuple with check report. If check is OK: (False, None). If error
             is detected: (False, errorMessage).
         """
         alarms = {}
         for alarm in self.periodicAlarms:
-            alarms[alarm] = alarm.checkPeriodic()
+            if not alarm.isTableChecked():
+                alarms[alarm] = alarm.checkPeriodic()
         return alarms
 
+    def hasPeriodicChecks(self):
+        """!
+        Check if getPeriodicCheck() evaluates some alarm.
+
+        @return True if some periodic alarm isn't evaluated by timeout table.
+        """
+        return any(not alarm.isTableChecked() for alarm in self.periodicAlarms)
+
     def isUpdateRelevant(self, updateDataIdentifier):
         """!
         Check if update is relevant to this update guard.
@@ -370,6 +1095,9 @@ class UpdateGuard:
         @param updateDataIdentifier Update DataIdentifier object.
         @return True if relevant, False otherwise.
         """
+        if self.wildcard:
+            return updateDataIdentifier.broker == self.dataIdentifier.broker and \
+                topicMatches(self.dataIdentifier.topic, updateDataIdentifier.topic)
         return updateDataIdentifier == self.dataIdentifier
 
     def getAlarms(self):
@@ -415,7 +1143,8 @@ class PeriodicChecker:
         self.registry = registry
         self.period = period
         self.event = threading.Event()
-        self.running = False
+        # Set before thread starts, so early stop() isn't overwritten.
+        self.running = True
 
     @classmethod
     def secondCheck(cls, registry, seconds):
@@ -425,7 +1154,6 @@ class PeriodicChecker:
         """!
         Periodically invoke check logic.
         """
-        self.running = True
         while self.running:
             scheduleExpires = not self.event.wait(self.period.total_seconds())
             if scheduleExpires:
@@ -21,6 +21,13 @@ from mqguard import args
 from mqguard.config import ProgramConfig, ConfigException
 from mqguard.supervising import DeviceGuard, UpdateGuard
 from mqguard.alarms import PresenceAlarm
+from mqguard.discovery import DeviceTemplate
+from mqguard.history import AlarmHistory
+from mqguard.timeouts import createTimeoutTable, isNumpyAvailable
+from mqguard.ingest import createIngestBackend
+from mqguard.flapping import FlapDetector
+from mqguard.statistics import IngestStatistics, StatisticsSummarizer
+from mqguard.lifecycle import StateCheckpoint
 
 class System:
     """!
@@ -34,10 +41,9 @@ class System:
         Initiate system configuration.
         """
         cls.cliArgs = args.parse_args()
-        config = ProgramConfig(cls.cliArgs.config)
         # TODO: handle config exceptions
         try:
-            cls.configCache = config.parse()
+            cls.configCache = cls.parseConfig()
             cls.dataIdentifierFactory = DataIdentifierFactory(cls.configCache)
         except ConfigException as ex:
             print("Configuration error: {}".format(ex), file=sys.stderr)
@@ -45,7 +51,34 @@ class System:
         cls.verbose = cls.cliArgs.verbose
         cls._brokerListenDescriptors = None
         cls._deviceGuards = None
+        cls._deviceTemplates = None
         cls._reporters = None
+        cls._ingestStatistics = None
+
+    @classmethod
+    def parseConfig(cls, runningConfig = None):
+        """!
+        Parse configuration file given by command line arguments.
+
+        @param runningConfig Running ConfigCache object, whose unchanged reporters
+            are reused.
+        @return ConfigCache object.
+        @throws ConfigException If configuration file is invalid.
+        """
+        return ProgramConfig(cls.cliArgs.config).parse(runningConfig)
+
+    @classmethod
+    def replaceConfigCache(cls, configCache):
+        """!
+        Replace running configuration. Used by configuration reload. Already
+        created device guards and reporters are kept, caller is responsible for
+        updating them.
+
+        @param configCache New ConfigCache object.
+        """
+        cls.configCache = configCache
+        cls.dataIdentifierFactory = DataIdentifierFactory(configCache)
+        cls._deviceTemplates = None
 
     @classmethod
     def getBrokerListenDescriptors(cls):
@@ -73,6 +106,140 @@ class System:
                 cls._deviceGuards.append(i)
         return cls._deviceGuards
 
+    @classmethod
+    def getHistory(cls):
+        """!
+        Create alarm history object according to configuration.
+
+        @return AlarmHistory object or None if history is disabled.
+        """
+        historySize = cls.configCache.getGlobal("HistorySize")
+        if historySize == 0:
+            return None
+        return AlarmHistory(historySize, cls.configCache.getGlobal("ValueHistorySize"))
+
+    @classmethod
+    def getTimeoutTable(cls):
+        """!
+        Create timeout table according to configuration.
+
+        @return TimeoutTable object or None if timeout alarms are checked one by one.
+        """
+        timeoutTable = cls.configCache.getGlobal("TimeoutTable")
+        if timeoutTable == "no":
+            return None
+        return createTimeoutTable(timeoutTable == "numpy" or isNumpyAvailable())
+
+    @classmethod
+    def getFlapDetector(cls):
+        """!
+        Create flap detector according to configuration.
+
+        @return FlapDetector object or None if flap damping is disabled.
+        """
+        threshold = cls.configCache.getGlobal("FlapThreshold")
+        if threshold == 0:
+            return None
+        return FlapDetector(threshold, cls.configCache.getGlobal("FlapWindow"))
+
+    @classmethod
+    def getIngestBackend(cls, dataHandler):
+        """!
+        Create ingest backend receiving messages of all configured brokers.
+
+        @param dataHandler Object receiving messages.
+        @return IngestBackend object.
+        """
+        return createIngestBackend(
+            cls.configCache.getGlobal("Ingest"), cls.getBrokerListenDescriptors(), dataHandler)
+
+    @classmethod
+    def getIngestStatistics(cls):
+        """!
+        Get traffic counters of configured brokers.
+
+        @return IngestStatistics object.
+        """
+        if cls._ingestStatistics is None:
+            cls._ingestStatistics = IngestStatistics(cls.getBrokerListenDescriptors())
+        return cls._ingestStatistics
+
+    @classmethod
+    def getStatisticsSummarizer(cls, reportManager):
+        """!
+        Create thread reporting periodic traffic summary.
+
+        @param reportManager ReportingManager object.
+        @return StatisticsSummarizer object or None if summary is disabled.
+        """
+        period = cls.configCache.getGlobal("StatisticsInterval")
+        if period == 0:
+            return None
+        return StatisticsSummarizer(cls.getIngestStatistics(), reportManager, period)
+
+    @classmethod
+    def getShutdownTimeout(cls):
+        """!
+        Get maximum time reporters may take to flush their queues on shutdown.
+
+        @return Seconds.
+        """
+        return cls.configCache.getGlobal("ShutdownTimeout")
+
+    @classmethod
+    def getStateCheckpoint(cls):
+        """!
+        Create state checkpoint according to configuration.
+
+        @return StateCheckpoint object or None if state isn't kept between runs.
+        """
+        stateFile = cls.configCache.getGlobal("StateFile")
+        if stateFile is None:
+            return None
+        return StateCheckpoint(stateFile)
+
+    @classmethod
+    def addDeviceGuard(cls, device, guard):
+        """!
+        Add device created at runtime, e.g. by device discovery.
+
+        @param device Device identifier.
+        @param guard DeviceGuard object.
+        """
+        cls.getDeviceGuards().append((device, guard))
+
+    @classmethod
+    def replaceDeviceGuard(cls, device, guard):
+        """!
+        Replace guard of already known device.
+
+        @param device Device identifier.
+        @param guard New DeviceGuard object.
+        """
+        cls._deviceGuards = [(d, guard) if d == device else (d, g) for d, g in cls.getDeviceGuards()]
+
+    @classmethod
+    def removeDeviceGuard(cls, device):
+        """!
+        Remove device.
+
+        @param device Device identifier.
+        """
+        cls._deviceGuards = [(d, g) for d, g in cls.getDeviceGuards() if d != device]
+
+    @classmethod
+    def getDeviceTemplates(cls):
+        """!
+        Get device templates for automatic device discovery.
+
+        @return List of DeviceTemplate objects.
+        """
+        if cls._deviceTemplates is None:
+            cls._deviceTemplates = []
+            for i in cls._createDeviceTemplates():
+                cls._deviceTemplates.append(i)
+        return cls._deviceTemplates
+
     @classmethod
     def getReporters(cls):
         """!
@@ -84,6 +251,24 @@ class System:
                 cls._reporters.append(i)
         return cls._reporters
 
+    @classmethod
+    def addReporter(cls, reporter):
+        """!
+        Add reporter created at runtime.
+
+        @param reporter Reporter object.
+        """
+        cls.getReporters().append(reporter)
+
+    @classmethod
+    def removeReporter(cls, reporter):
+        """!
+        Remove reporter.
+
+        @param reporter Reporter object.
+        """
+        cls._reporters = [r for r in cls.getReporters() if r is not reporter]
+
     @classmethod
     def _createBrokerListenDescriptors(cls):
         for broker, subscriptions in cls.configCache.brokers:
@@ -97,22 +282,52 @@ class System:
         @return Tuple of (Device, DeviceGuard)
         """
         for deviceName, presenceFactory, guards in cls.configCache.devices:
-            deviceGuard = DeviceGuard()
-            devicePresence = presenceFactory.build(cls.configCache)
-            deviceGuard.addPresenceGuard(
-                devicePresence,
-                cls.createDevicePresenceGuard(deviceName, devicePresence))
+            yield deviceName, cls.createDeviceGuard(deviceName, presenceFactory, guards)
+
+    @classmethod
+    def createDeviceGuard(cls, deviceName, presenceFactory, guards):
+        """!
+        Create guard object of single device.
+
+        @param deviceName Device name.
+        @param presenceFactory Device presence factory.
+        @param guards Iterable of tuples (guardName, (brokerName, topic), alarms).
+        @return DeviceGuard object.
+        """
+        deviceGuard = DeviceGuard()
+        devicePresence = presenceFactory.build(cls.configCache)
+        deviceGuard.addPresenceGuard(
+            devicePresence,
+            cls.createDevicePresenceGuard(deviceName, devicePresence))
+        for guardName, dataIdentificationPrototype, alarms in guards:
+            brokerName, topic = dataIdentificationPrototype
+            dataIdentifier = cls.dataIdentifierFactory.build(brokerName, topic)
+            updateGuard = UpdateGuard(guardName, dataIdentifier)
+            for alarm in alarms:
+                updateGuard.addAlarm(alarm)
+            deviceGuard.addUpdateGuard(updateGuard)
+        return deviceGuard
+
+    @classmethod
+    def _createDeviceTemplates(cls):
+        """!
+        Get iterable of device templates.
+
+        @return Iterable of DeviceTemplate objects.
+        """
+        for templateName, presenceFactory, nameFormat, guards in cls.configCache.templates:
+            presence = presenceFactory.build(cls.configCache)
+            templateGuards = []
             for guardName, dataIdentificationPrototype, alarms in guards:
                 brokerName, topic = dataIdentificationPrototype
-                dataIdentifier = cls.dataIdentifierFactory.build(brokerName, topic)
-                updateGuard = UpdateGuard(guardName, dataIdentifier)
-                for alarm in alarms:
-                    updateGuard.addAlarm(alarm)
-                deviceGuard.addUpdateGuard(updateGuard)
-            yield deviceName, deviceGuard
+                broker = cls.configCache.getBrokerByName(brokerName)
+                templateGuards.append((guardName, broker, topic, alarms))
+            yield DeviceTemplate(templateName, presence.dataIdentifier, presence.values, nameFormat, templateGuards)
 
     @classmethod
     def createDevicePresenceGuard(cls, device, presence):
+        if not presence.hasPresence():
+            return None
         presenceUpdateGuard = UpdateGuard(device, presence.dataIdentifier)
         alarm = PresenceAlarm(presence.values)
         presenceUpdateGuard.addAlarm(alarm)
@@ -0,0 +1,49 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Stubs shared by tests.
+"""
+
+import threading
+
+class ReportCollector:
+    """!
+    Reporting manager collecting device reports.
+    """
+    def __init__(self):
+        self.reports = []
+    def injectDeviceRegistry(self, deviceRegistry):
+        pass
+    def report(self, deviceReport):
+        self.reports.append(deviceReport)
+
+class RegistryStub:
+    """!
+    Device registry without devices.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+    def getDeviceReports(self):
+        return {}
+
+class ReportStub:
+    """!
+    Device report with alarm changes.
+    """
+    def __init__(self, device):
+        self.device = device
+    def hasAlarmChanges(self):
+        return True
@@ -15,7 +15,7 @@
 
 import unittest
 from mqguard.alarms import *
-from mqguard.alarms import BaseAlarm, AlarmType, AlarmPriority
+from mqguard.alarms import BaseAlarm, AlarmType, AlarmPriority, FieldAccessor
 from mqreceive.data import DataIdentifier
 from mqreceive.broker import Broker
 
@@ -85,3 +85,143 @@ class TestUpperLimitRangeAlarm(BaseTestRangeAlarm, unittest.TestCase):
     def test_upperLimitFail(self):
         result, _ = self.alarm.checkDecodedMessage(self.dataIdentifier, 2)
         self.assertTrue(result)
+class TestHysteresisRangeAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = RangeAlarm.upperLimit(50, 2)
+    def test_hysteresis(self):
+        self.assertFalse(self.alarm.checkDecodedMessage(self.dataIdentifier, 50)[0])
+        self.assertTrue(self.alarm.checkDecodedMessage(self.dataIdentifier, 50.5)[0])
+        self.assertTrue(self.alarm.checkDecodedMessage(self.dataIdentifier, 49)[0])
+        self.assertFalse(self.alarm.checkDecodedMessage(self.dataIdentifier, 48)[0])
+        self.assertFalse(self.alarm.checkDecodedMessage(self.dataIdentifier, 49)[0])
+    def test_cloneState(self):
+        self.alarm.checkDecodedMessage(self.dataIdentifier, 51)
+        self.assertFalse(self.alarm.clone().checkDecodedMessage(self.dataIdentifier, 49)[0])
+class TestAnomalyAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = AnomalyAlarm.cumulative(3, warmup = 4)
+    def feed(self, values):
+        return [self.alarm.checkDecodedMessage(self.dataIdentifier, value)[0] for value in values]
+    def test_warmup(self):
+        self.assertEqual([False] * 4, self.feed(["10", "11", "10", "1000"]))
+    def test_statistics(self):
+        self.feed(["2", "4", "4", "4", "5", "5", "7", "9"])
+        self.assertAlmostEqual(5, self.alarm.mean)
+        self.assertAlmostEqual(4, self.alarm.variance)
+    def test_anomaly(self):
+        self.feed(["10", "11", "10", "11"])
+        self.assertEqual([False, True], self.feed(["10.5", "100"]))
+    def test_notNumber(self):
+        result, _ = self.alarm.checkDecodedMessage(self.dataIdentifier, "abc")
+        self.assertTrue(result)
+    def test_clone(self):
+        self.feed(["10", "11", "10", "11"])
+        alarm = self.alarm.clone()
+        self.assertEqual((0, 0.0), (alarm.count, alarm.mean))
+        self.assertEqual(4, self.alarm.count)
+class TestExponentialAnomalyAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = AnomalyAlarm.exponential(3, 0.5, warmup = 4)
+    def test_followsDrift(self):
+        for value in range(100):
+            result, _ = self.alarm.checkDecodedMessage(self.dataIdentifier, str(value + value % 2))
+            self.assertFalse(result)
+        self.assertGreater(self.alarm.mean, 90)
+class TestRateAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = RateAlarm.fromSeconds(3, 60)
+    def feed(self, count):
+        return [self.alarm.checkMessage(self.dataIdentifier, b"1")[0] for i in range(count)]
+    def test_burstWithinLimit(self):
+        self.assertEqual([False] * 3, self.feed(3))
+    def test_rateExceeded(self):
+        self.assertEqual([False, False, False, True, True], self.feed(5))
+    def test_windowExpired(self):
+        self.feed(3)
+        self.alarm.timestamps[0] -= 61
+        self.assertEqual([False, True], self.feed(2))
+    def test_clone(self):
+        self.feed(3)
+        self.assertEqual(0, len(self.alarm.clone().timestamps))
+        self.assertEqual(3, len(self.alarm.timestamps))
+class TestRegexAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = RegexAlarm([r"\d+", r"E_[A-Z]+"])
+    def test_match(self):
+        self.assertFalse(self.alarm.checkMessage(self.dataIdentifier, b"123")[0])
+        self.assertFalse(self.alarm.checkMessage(self.dataIdentifier, b"E_TIMEOUT")[0])
+    def test_wholeMessage(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b"123abc")[0])
+    def test_sharedPattern(self):
+        self.assertIs(self.alarm.regex, RegexAlarm([r"\d+", r"E_[A-Z]+"]).regex)
+class TestEnumerationAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = EnumerationAlarm(["open", "closed"])
+    def test_allowed(self):
+        self.assertFalse(self.alarm.checkMessage(self.dataIdentifier, b"open")[0])
+        self.assertFalse(self.alarm.checkDecodedMessage(self.dataIdentifier, "closed")[0])
+    def test_unexpected(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b"ajar")[0])
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b"\xff")[0])
+    def test_sharedValues(self):
+        self.assertIs(self.alarm.allowedValues, EnumerationAlarm(["open", "closed"]).allowedValues)
+class TestDerivativeAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = DerivativeAlarm(1)
+    def test_firstValue(self):
+        self.assertFalse(self.alarm.checkValue(self.dataIdentifier, 1000)[0])
+    def test_slowChange(self):
+        self.alarm.checkValue(self.dataIdentifier, 10)
+        self.alarm.lastTime -= 10
+        self.assertFalse(self.alarm.checkValue(self.dataIdentifier, 15)[0])
+    def test_fastChange(self):
+        self.alarm.checkValue(self.dataIdentifier, 10)
+        self.alarm.lastTime -= 10
+        self.assertTrue(self.alarm.checkValue(self.dataIdentifier, -10)[0])
+    def test_message(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b"abc")[0])
+        self.assertFalse(self.alarm.checkMessage(self.dataIdentifier, b"1")[0])
+    def test_clone(self):
+        self.alarm.checkValue(self.dataIdentifier, 10)
+        self.assertIsNone(self.alarm.clone().lastValue)
+class TestJSONFieldAlarm(BaseTestRangeAlarm, unittest.TestCase):
+    def setUp(self):
+        self.createDataIdentifier()
+        self.alarm = JSONFieldAlarm("sensors.0.temperature", RangeAlarm.atInterval(0, 50), 1024)
+    def test_inRange(self):
+        self.assertFalse(self.alarm.checkMessage(self.dataIdentifier, b'{"sensors": [{"temperature": 21.5}]}')[0])
+    def test_outOfRange(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b'{"sensors": [{"temperature": 80}]}')[0])
+    def test_stringValue(self):
+        self.assertFalse(self.alarm.checkDocument(self.dataIdentifier, {"sensors": [{"temperature": "21"}]})[0])
+    def test_missingField(self):
+        self.assertTrue(self.alarm.checkDocument(self.dataIdentifier, {"sensors": []})[0])
+        self.assertTrue(self.alarm.checkDocument(self.dataIdentifier, {"sensors": 1})[0])
+    def test_invalidDocument(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b'{"sensors"')[0])
+    def test_sizeLimit(self):
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b" " * 2048)[0])
+    def test_sharedAccessor(self):
+        other = JSONFieldAlarm("sensors.0.temperature", NumericAlarm(), 1024)
+        self.assertIs(self.alarm.accessor, other.accessor)
+    def test_name(self):
+        self.assertEqual("RangeAlarm(sensors.0.temperature)", self.alarm.getName())
+    def test_hugeNumber(self):
+        active, message = self.alarm.checkMessage(self.dataIdentifier,
+            b'{"sensors": [{"temperature": 1' + b"0" * 400 + b'}]}')
+        self.assertTrue(active)
+        self.assertIn("too large", message)
+    def test_deeplyNested(self):
+        self.alarm.maxSize = 1000000
+        self.assertTrue(self.alarm.checkMessage(self.dataIdentifier, b"[" * 200000 + b"]" * 200000)[0])
+    def test_invalidPath(self):
+        self.assertEqual(("\u00b2", None), FieldAccessor("a.\u00b2").keys[1])
+        with self.assertRaises(ValueError):
+            FieldAccessor("a..b")
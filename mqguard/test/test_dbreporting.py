@@ -0,0 +1,88 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import contextlib
+import io
+import unittest
+import threading
+import tempfile
+import sqlite3
+import os
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.alarms import NumericAlarm
+from mqguard.common import DeviceReport
+from mqguard.dbreporting import DatabaseReporter
+from mqguard.device import DevicePresence
+
+class TestDatabaseReporter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, "mqguard.db")
+        self.reporter = DatabaseReporter(None, self.database)
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.dataIdentifier = DataIdentifier(self.broker, "test/topic")
+        self.presence = DevicePresence(DataIdentifier(self.broker, "presence/device"), ("online", "offline"))
+    def tearDown(self):
+        self.directory.cleanup()
+    def createReport(self, changed, presenceChanged):
+        alarmMapping = {self.dataIdentifier: {NumericAlarm(): (True, changed, True, "error")}}
+        presence = (self.presence, (False, presenceChanged, presenceChanged, None))
+        return DeviceReport("device", presence, alarmMapping)
+    def runReporter(self, reports):
+        thread = threading.Thread(target = self.reporter)
+        thread.start()
+        for report in reports:
+            self.reporter.report(report)
+        self.reporter.stop()
+        thread.join()
+    def test_insert(self):
+        self.runReporter([self.createReport(True, True), self.createReport(False, False)])
+        connection = sqlite3.connect(self.database)
+        rows = connection.execute("SELECT device, broker, topic, alarm, active, message FROM alarm_transitions").fetchall()
+        self.assertEqual([("device", "test-broker", "test/topic", "NumericAlarm", 1, "error")], rows)
+        rows = connection.execute("SELECT device, topic, active FROM presence_changes").fetchall()
+        self.assertEqual([("device", "presence/device", 0)], rows)
+        connection.close()
+    def test_walMode(self):
+        self.runReporter([])
+        connection = sqlite3.connect(self.database)
+        self.assertEqual("wal", connection.execute("PRAGMA journal_mode").fetchone()[0])
+        connection.close()
+    def test_databaseError(self):
+        os.mkdir(self.database)
+        self.reporter = DatabaseReporter(None, self.database, retryCount = 1, retryDelay = 0)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.runReporter([self.createReport(True, False)])
+        self.assertIn("1 reports dropped, database is not writable", stderr.getvalue())
+    def test_recoveredError(self):
+        os.mkdir(self.database)
+        self.reporter = DatabaseReporter(None, self.database, retryCount = 1, retryDelay = 0.5)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            thread = threading.Thread(target = self.reporter)
+            thread.start()
+            self.reporter.report(self.createReport(True, False))
+            self.reporter.stop()
+            while "insert of 1 reports failed" not in stderr.getvalue():
+                thread.join(0.01)
+            os.rmdir(self.database)
+            thread.join()
+        self.assertNotIn("dropped", stderr.getvalue())
+        connection = sqlite3.connect(self.database)
+        self.assertEqual(1, connection.execute("SELECT COUNT(*) FROM alarm_transitions").fetchone()[0])
+        connection.close()
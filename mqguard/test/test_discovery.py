@@ -0,0 +1,154 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.alarms import NumericAlarm
+from mqguard.config import ProgramConfig, ConfigException
+from mqguard.discovery import DeviceTemplate
+from mqguard.supervising import DeviceRegistry
+
+class DeviceCollector:
+    def __init__(self):
+        self.devices = []
+        self.reports = []
+    def injectDeviceRegistry(self, deviceRegistry):
+        pass
+    def addDevice(self, device, guard):
+        self.devices.append(device)
+    def report(self, deviceReport):
+        self.reports.append(deviceReport)
+
+class TestDeviceTemplate(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.numericAlarm = NumericAlarm()
+        self.template = DeviceTemplate(
+            "template",
+            DataIdentifier(self.broker, "presence/+/+"),
+            ("online", "offline"),
+            None,
+            [("guard", self.broker, "{0}/{1}/temperature", [self.numericAlarm])])
+    def test_build(self):
+        device, deviceGuard = self.template.build(DataIdentifier(self.broker, "presence/hsp/hq"))
+        self.assertEqual("hsp-hq", device)
+        self.assertTrue(deviceGuard.hasPresence())
+        updateGuard, = deviceGuard.updateGuards
+        self.assertEqual(DataIdentifier(self.broker, "hsp/hq/temperature"), updateGuard.dataIdentifier)
+        alarm, = updateGuard.getAlarms()
+        self.assertIsNot(self.numericAlarm, alarm)
+    def test_nameFormat(self):
+        self.template.nameFormat = "{1}@{0}"
+        device, _ = self.template.build(DataIdentifier(self.broker, "presence/hsp/hq"))
+        self.assertEqual("hq@hsp", device)
+
+class TestDeviceDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.collector = DeviceCollector()
+        self.registry = DeviceRegistry(self.collector)
+        self.registry.addDeviceTemplate(DeviceTemplate(
+            "template",
+            DataIdentifier(self.broker, "presence/+"),
+            ("online", "offline"),
+            None,
+            [("guard", self.broker, "{0}/temperature", [NumericAlarm()])]))
+        self.discovered = []
+        self.registry.addDiscoveryListener(lambda device, guard: self.discovered.append(device))
+    def test_discovery(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "presence/sensor"), b"online")
+        self.assertEqual(["sensor"], self.collector.devices)
+        self.assertEqual(["sensor"], self.discovered)
+        report = self.collector.reports[-1]
+        self.assertTrue(report.hasPresenceChange())
+        self.assertFalse(report.hasFailures())
+    def test_discoveredOnce(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "presence/sensor"), b"online")
+        self.registry.onNewData(DataIdentifier(self.broker, "presence/sensor"), b"offline")
+        self.assertEqual(["sensor"], self.collector.devices)
+        self.assertTrue(self.collector.reports[-1].hasPresenceFailure())
+    def test_discoveredGuard(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "presence/sensor"), b"online")
+        self.registry.onNewData(DataIdentifier(self.broker, "sensor/temperature"), b"nan?")
+        self.assertTrue(self.collector.reports[-1].hasAlarmFailures())
+    def test_matchedUnderLock(self):
+        trie = self.registry.discoveryTries[self.broker]
+        lockOwned = []
+        def match(topic, match = trie.match):
+            lockOwned.append(self.registry.lock._is_owned())
+            return match(topic)
+        trie.match = match
+        self.registry.onNewData(DataIdentifier(self.broker, "presence/sensor"), b"online")
+        self.assertEqual([True], lockOwned)
+
+TEMPLATE_CONFIG = """
+[Brokers]
+Enabled = test-broker
+
+[test-broker]
+Host = localhost
+Port = 1883
+Topic = #
+
+[Devices]
+Enabled =
+Templates = sensor
+
+[sensor]
+Name = {name}
+PresenceTopic = test-broker presence/+/+
+PresenceOnline = online
+PresenceOffline = offline
+Guard = sensor-guard
+
+[sensor-guard]
+test-broker {topic} = sensor-update
+
+[sensor-update]
+PeriodMax = 60
+
+[Reporters]
+Enabled =
+"""
+
+class TestDeviceTemplateConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.configFile = os.path.join(self.directory.name, "mqguard.conf")
+    def tearDown(self):
+        self.directory.cleanup()
+    def parse(self, name, topic):
+        with open(self.configFile, "w") as f:
+            f.write(TEMPLATE_CONFIG.format(name = name, topic = topic))
+        return ProgramConfig(self.configFile).parse()
+    def test_validFormat(self):
+        configCache = self.parse("{1}@{0}", "{0}/{1}/temperature")
+        templateName, presence, nameFormat, guards = configCache.templates[0]
+        self.assertEqual("{1}@{0}", nameFormat)
+    def test_missingNameLevel(self):
+        with self.assertRaisesRegex(ConfigException, "template format"):
+            self.parse("sensor-{2}", "{0}/{1}/temperature")
+    def test_missingTopicLevel(self):
+        with self.assertRaisesRegex(ConfigException, "template format"):
+            self.parse("sensor-{0}", "{0}/{2}/temperature")
+    def test_namedField(self):
+        with self.assertRaisesRegex(ConfigException, "template format"):
+            self.parse("sensor-{name}", "{0}/{1}/temperature")
@@ -0,0 +1,83 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.flapping import FlapDetector
+from mqguard.supervising import UpdateGuard, DeviceGuard, DeviceRegistry
+from mqguard.alarms import RangeAlarm
+from mqguard.test.stubs import ReportCollector
+
+class TestFlapDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = FlapDetector(4, 10)
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        self.alarm = RangeAlarm.upperLimit(1)
+        self.active = False
+        self.reported = False
+    def flip(self, now):
+        self.active = not self.active
+        result = self.detector.update("device", self.dataIdentifier, self.alarm, self.reported, self.active, "message", now)
+        self.reported = result[0]
+        return result
+    def test_stableAlarm(self):
+        self.assertEqual((False, None), self.detector.update("device", self.dataIdentifier, self.alarm, False, False, None, 0))
+        self.assertEqual({}, self.detector.states)
+    def test_flapping(self):
+        for now in range(3):
+            self.assertEqual(not self.active, self.flip(now)[0])
+        active, message = self.flip(3)
+        self.assertTrue(active)
+        self.assertEqual(self.detector.getFlappingMessage(), message)
+        self.assertEqual((True, self.detector.getFlappingMessage()), self.flip(4))
+    def test_settle(self):
+        for now in range(5):
+            self.flip(now)
+        self.assertEqual([], self.detector.getSettled(5))
+        self.assertEqual([], self.detector.getSettled(13))
+        self.assertEqual([("device", self.dataIdentifier, self.alarm, True, "message")], self.detector.getSettled(14))
+        self.assertEqual([], self.detector.getSettled(15))
+        self.assertEqual([], self.detector.getSettled(20))
+        self.assertEqual({}, self.detector.states)
+    def test_slowChanges(self):
+        for now in range(0, 100, 10):
+            self.assertEqual(not self.active, self.flip(now)[0])
+
+class TestRegistryFlapDamping(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.reportCollector = ReportCollector()
+        self.registry = DeviceRegistry(self.reportCollector)
+        self.registry.setFlapDetector(FlapDetector(4, 3600))
+        updateGuard = UpdateGuard("guard", DataIdentifier(self.broker, "test/topic"))
+        updateGuard.addAlarm(RangeAlarm.upperLimit(1))
+        deviceGuard = DeviceGuard()
+        deviceGuard.addUpdateGuard(updateGuard)
+        self.registry.addGuardedDevice("device", deviceGuard)
+    def test_suppressedChanges(self):
+        for i in range(10):
+            self.registry.onNewData(DataIdentifier(self.broker, "test/topic"), b"2" if i % 2 == 0 else b"0")
+        changes = [report.hasAlarmChanges() for report in self.reportCollector.reports]
+        self.assertEqual([True, True, True, False, False, False, False, False, False, False], changes)
+        self.assertTrue(self.reportCollector.reports[-1].hasAlarmFailures())
+    def test_removeDevice(self):
+        for i in range(5):
+            self.registry.onNewData(DataIdentifier(self.broker, "test/topic"), b"2" if i % 2 == 0 else b"0")
+        self.registry.removeGuardedDevice("device")
+        self.assertEqual({}, self.registry.flapDetector.states)
@@ -0,0 +1,91 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.alarms import NumericAlarm
+from mqguard.history import RingBuffer, AlarmHistory
+from mqguard.supervising import DeviceGuard, DeviceRegistry, UpdateGuard
+from mqguard.test.stubs import ReportCollector
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer(3)
+    def test_empty(self):
+        self.assertEqual([], self.buffer.query())
+    def test_append(self):
+        self.buffer.append(1, "a")
+        self.buffer.append(2, "b")
+        self.assertEqual([(1, "a"), (2, "b")], self.buffer.query())
+    def test_overwrite(self):
+        for i in range(5):
+            self.buffer.append(i, i)
+        self.assertEqual(3, len(self.buffer))
+        self.assertEqual([(2, 2), (3, 3), (4, 4)], self.buffer.query())
+    def test_timeRange(self):
+        for i in range(5):
+            self.buffer.append(i, i)
+        self.assertEqual([(3, 3)], self.buffer.query(3, 3))
+        self.assertEqual([(2, 2), (3, 3)], self.buffer.query(until = 3))
+        self.assertEqual([(4, 4)], self.buffer.query(since = 3.5))
+    def test_floatRecords(self):
+        buffer = RingBuffer(2, 'd')
+        buffer.append(1, 0.5)
+        self.assertEqual([(1, 0.5)], buffer.query())
+
+class TestAlarmHistory(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.history = AlarmHistory(2, 2)
+    def test_mergeDataIdentifiers(self):
+        first = DataIdentifier(self.broker, "first")
+        second = DataIdentifier(self.broker, "second")
+        self.history.addTransition("device", first, 1, "Alarm", True, "error")
+        self.history.addTransition("device", second, 2, "Alarm", True, "error")
+        self.history.addTransition("device", first, 3, "Alarm", False, None)
+        transitions = self.history.getTransitions("device")
+        self.assertEqual([1, 2, 3], [t[0] for t in transitions])
+        self.assertEqual([first, second, first], [t[1] for t in transitions])
+    def test_unknownDevice(self):
+        self.assertEqual([], self.history.getTransitions("device"))
+
+class TestRegistryHistory(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.dataIdentifier = DataIdentifier(self.broker, "test/topic")
+        self.registry = DeviceRegistry(ReportCollector())
+        self.registry.setHistory(AlarmHistory(8, 8))
+        updateGuard = UpdateGuard("guard", self.dataIdentifier)
+        updateGuard.addAlarm(NumericAlarm())
+        deviceGuard = DeviceGuard()
+        deviceGuard.addUpdateGuard(updateGuard)
+        self.registry.addGuardedDevice("device", deviceGuard)
+    def test_transitions(self):
+        for data in [b"1", b"x", b"y", b"2"]:
+            self.registry.onNewData(self.dataIdentifier, data)
+        transitions = self.registry.getDeviceHistory("device")
+        self.assertEqual([True, False], [t[3] for t in transitions])
+    def test_values(self):
+        for data in [b"1", b"x", b"2"]:
+            self.registry.onNewData(self.dataIdentifier, data)
+        values = self.registry.getValueHistory("device", self.dataIdentifier)
+        self.assertEqual([1.0, 2.0], [value for _, value in values])
+    def test_unknownDevice(self):
+        with self.assertRaises(KeyError):
+            self.registry.getDeviceHistory("unknown")
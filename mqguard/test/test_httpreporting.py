@@ -0,0 +1,121 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import threading
+import json
+import http.client
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.alarms import NumericAlarm
+from mqguard.common import DeviceReport
+from mqguard.formatting import FormatDataProvider
+from mqguard.httpreporting import HTTPReporter
+from mqguard.supervising import DeviceGuard, UpdateGuard
+
+class StaticDataProvider(FormatDataProvider):
+    def __init__(self, broker, devices):
+        self.broker = broker
+        self.devices = devices
+    def getBrokerListenDescriptors(self):
+        return [(self.broker, ["#"])]
+    def getDevices(self):
+        return self.devices
+
+class ReportsRegistry:
+    def __init__(self):
+        self.reports = {}
+    def getDeviceReports(self):
+        return dict(self.reports)
+
+class TestHTTPReporter(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.dataIdentifier = DataIdentifier(self.broker, "test/topic")
+        self.alarm = NumericAlarm()
+        updateGuard = UpdateGuard("guard", self.dataIdentifier)
+        updateGuard.addAlarm(self.alarm)
+        guard = DeviceGuard()
+        guard.addUpdateGuard(updateGuard)
+        self.registry = ReportsRegistry()
+        self.reporter = HTTPReporter(None, StaticDataProvider(self.broker, [("device", guard)]), ("localhost", 0))
+        self.reporter.injectDeviceRegistry(self.registry)
+        self.setReport(False, False)
+        self.reporter.addDevice("device", guard)
+        self.thread = threading.Thread(target = self.reporter)
+        self.thread.start()
+        while self.reporter.server is None or not self.reporter.running:
+            pass
+    def tearDown(self):
+        self.reporter.stop()
+        self.thread.join()
+    def setReport(self, active, changed):
+        alarmMapping = {self.dataIdentifier: {self.alarm: (active, changed, True, "error" if active else None)}}
+        report = DeviceReport("device", (None, (False, False, False, None)), alarmMapping)
+        self.registry.reports["device"] = report
+        return report
+    def request(self, path, etag = None):
+        connection = http.client.HTTPConnection("localhost", self.reporter.server.server_address[1])
+        headers = {} if etag is None else {"If-None-Match": etag}
+        connection.request("GET", path, headers = headers)
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response.status, response.getheader("ETag"), body
+    def test_summary(self):
+        status, etag, body = self.request("/summary")
+        self.assertEqual(200, status)
+        summary = json.loads(body.decode("utf-8"))
+        self.assertEqual((1, 1, 0), (summary["devices"], summary["ok"], summary["error"]))
+        self.assertEqual(["test-broker"], summary["brokers"])
+        self.assertEqual((304, etag, b""), self.request("/summary", etag))
+    def test_failures(self):
+        _, etag, body = self.request("/failures")
+        self.assertEqual([], json.loads(body.decode("utf-8")))
+        self.reporter.report(self.setReport(True, True))
+        status, newEtag, body = self.request("/failures", etag)
+        self.assertEqual(200, status)
+        self.assertNotEqual(etag, newEtag)
+        self.assertEqual(["device"], [device["name"] for device in json.loads(body.decode("utf-8"))])
+    def test_deviceVersion(self):
+        _, etag, _ = self.request("/devices/device")
+        # Updates without change don't invalidate cached rendering.
+        self.reporter.report(self.setReport(False, False))
+        self.assertEqual(304, self.request("/devices/device", etag)[0])
+    def test_otherInstance(self):
+        _, etag, _ = self.request("/summary")
+        # Reporter of restarted process starts counting versions again.
+        otherReporter = HTTPReporter(None, self.reporter.dataProvider, ("localhost", 0))
+        self.assertNotEqual(etag, otherReporter.getETag("/summary"))
+    def test_nonAsciiDevice(self):
+        guard = self.reporter.dataProvider.devices[0][1]
+        self.reporter.dataProvider.devices.append(("čidlo \"1\"", guard))
+        report = self.setReport(False, False)
+        self.registry.reports["čidlo \"1\""] = DeviceReport("čidlo \"1\"", report.getPresence(), {})
+        status, etag, body = self.request("/devices/%C4%8Didlo%20%221%22")
+        self.assertEqual(200, status)
+        self.assertEqual(2, etag.count('"'))
+        self.assertEqual(304, self.request("/devices/%C4%8Didlo%20%221%22", etag)[0])
+    def test_broker(self):
+        status, _, body = self.request("/brokers/test-broker")
+        self.assertEqual(200, status)
+        self.assertEqual(["device"], [device["name"] for device in json.loads(body.decode("utf-8"))["devices"]])
+    def test_notFound(self):
+        self.assertEqual(404, self.request("/devices/unknown")[0])
+        self.assertEqual(404, self.request("/brokers/unknown")[0])
+        self.assertEqual(404, self.request("/unknown")[0])
@@ -0,0 +1,79 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import socket
+import threading
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.ingest import FakeIngestBackend, ThreadedIngestBackend, AsyncioIngestBackend, createIngestBackend
+
+class BatchCollector:
+    def __init__(self):
+        self.batches = []
+    def onNewData(self, dataIdentifier, data):
+        self.batches.append([(dataIdentifier, data)])
+    def onNewDataBatch(self, messages):
+        self.batches.append(list(messages))
+
+class TestFakeIngestBackend(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.collector = BatchCollector()
+        self.backend = FakeIngestBackend([(self.broker, ["sensors/#"])], self.collector, batchSize = 2)
+    def test_subscriptionFilter(self):
+        self.assertTrue(self.backend.publish("test-broker", "sensors/a", b"1"))
+        self.assertFalse(self.backend.publish("test-broker", "other/a", b"1"))
+        self.backend.flush()
+        self.assertEqual([[(DataIdentifier(self.broker, "sensors/a"), b"1")]], self.collector.batches)
+    def test_batches(self):
+        for i in range(5):
+            self.backend.publish("test-broker", "sensors/a", str(i).encode())
+        self.backend.flush()
+        self.assertEqual([2, 2, 1], [len(batch) for batch in self.collector.batches])
+    def test_thread(self):
+        self.backend.start()
+        for i in range(5):
+            self.backend.publish("test-broker", "sensors/a", str(i).encode())
+        self.backend.stop()
+        messages = [data for batch in self.collector.batches for _, data in batch]
+        self.assertEqual([b"0", b"1", b"2", b"3", b"4"], messages)
+
+class TestThreadedIngestBackend(unittest.TestCase):
+    def test_stopJoinsReceivers(self):
+        # Broker accepts connection but never answers.
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen()
+            broker = Broker("test-broker", "127.0.0.1", server.getsockname()[1])
+            backend = ThreadedIngestBackend([(broker, ["#"])], BatchCollector())
+            backend.start()
+            connection, address = server.accept()
+            backend.stop()
+            connection.close()
+        self.assertFalse(any(thread.is_alive() for thread in backend.threads))
+
+class TestAsyncioIngestBackend(unittest.TestCase):
+    def test_startStop(self):
+        # Nothing listens on port 1, backend keeps reconnecting until stopped.
+        backend = AsyncioIngestBackend([(Broker("test-broker", "localhost", 1), ["#"])], BatchCollector())
+        backend.start()
+        backend.stop()
+        self.assertFalse(backend.thread.is_alive())
+    def test_unknownBackend(self):
+        self.assertRaises(ValueError, createIngestBackend, "unknown", [], BatchCollector())
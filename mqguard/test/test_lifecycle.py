@@ -0,0 +1,221 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.lifecycle import StateCheckpoint, Lifecycle
+from mqguard.reporting import BaseReporter, ReportingManager
+from mqguard.streamreporting import SocketReporter
+from mqguard.statistics import IngestStatistics, StatisticsSummarizer
+from mqguard.supervising import UpdateGuard, DeviceGuard, DeviceRegistry, PeriodicChecker
+from mqguard.device import DevicePresence
+from mqguard.alarms import RangeAlarm, PresenceAlarm, TimeoutAlarm
+from mqguard.timeouts import TimeoutTable
+from mqguard.test.stubs import ReportCollector, RegistryStub, ReportStub
+
+class SlowReporter(BaseReporter):
+    def __init__(self):
+        BaseReporter.__init__(self, None)
+        self.release = threading.Event()
+    def __call__(self):
+        self.release.wait()
+
+class StepRecorder:
+    def __init__(self, steps, name):
+        self.steps = steps
+        self.name = name
+    def __call__(self):
+        pass
+    def stop(self):
+        self.steps.append(self.name)
+
+class LineFormatter:
+    def formatInitialData(self, deviceReports, sequence = None, stream = None):
+        return "init"
+    def formatDeviceReport(self, deviceReport, sequence = None):
+        return deviceReport.device
+
+def createRegistry(reportCollector):
+    broker = Broker("test-broker", "localhost", 1883)
+    registry = DeviceRegistry(reportCollector)
+    updateGuard = UpdateGuard("guard", DataIdentifier(broker, "test/topic"))
+    updateGuard.addAlarm(RangeAlarm.upperLimit(1))
+    presence = DevicePresence(DataIdentifier(broker, "presence/device"), ("online", "offline"))
+    presenceGuard = UpdateGuard("device", presence.dataIdentifier)
+    presenceGuard.addAlarm(PresenceAlarm(presence.values))
+    deviceGuard = DeviceGuard()
+    deviceGuard.addPresenceGuard(presence, presenceGuard)
+    deviceGuard.addUpdateGuard(updateGuard)
+    return registry, deviceGuard, DataIdentifier(broker, "test/topic"), DataIdentifier(broker, "presence/device")
+
+class TestStateCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = StateCheckpoint(os.path.join(self.directory.name, "state.json"))
+    def tearDown(self):
+        self.directory.cleanup()
+    def test_roundTrip(self):
+        states = [("device", "test-broker", "test/topic", "RangeAlarm", True, "too high")]
+        self.checkpoint.save(states)
+        self.assertEqual(states, self.checkpoint.load())
+        self.assertEqual(["state.json"], os.listdir(self.directory.name))
+    def test_missingFile(self):
+        self.assertEqual([], self.checkpoint.load())
+    def test_corruptedFile(self):
+        with open(self.checkpoint.path, "w") as f:
+            f.write("{\"version\": 1, \"alarms\": [")
+        self.assertEqual([], self.checkpoint.load())
+
+class TestRestoredStates(unittest.TestCase):
+    def setUp(self):
+        self.reportCollector = ReportCollector()
+        self.registry, self.deviceGuard, self.dataIdentifier, self.presenceIdentifier = createRegistry(self.reportCollector)
+    def test_getAlarmStates(self):
+        self.registry.addGuardedDevice("device", self.deviceGuard)
+        self.assertEqual(sorted([
+            ("device", "test-broker", "presence/device", "Presence", True, "Presence message not received yet"),
+            ("device", "test-broker", "test/topic", "RangeAlarm", False, None)]),
+            sorted(self.registry.getAlarmStates()))
+    def test_restore(self):
+        self.registry.restoreAlarmStates([
+            ("device", "test-broker", "test/topic", "RangeAlarm", True, "too high"),
+            ("device", "test-broker", "presence/device", "Presence", False, None),
+            ("removed", "test-broker", "test/topic", "RangeAlarm", True, "too high")])
+        self.registry.addGuardedDevice("device", self.deviceGuard)
+        alarm = next(iter(self.registry.alarmMapping["device"][self.dataIdentifier]))
+        self.assertEqual((True, False, False, "too high"), self.registry.alarmMapping["device"][self.dataIdentifier][alarm])
+        self.assertEqual((False, False, False, None), self.registry.presenceMapping["device"][1])
+    def test_recoveryAfterRestore(self):
+        self.registry.restoreAlarmStates([("device", "test-broker", "test/topic", "RangeAlarm", True, "too high")])
+        self.registry.addGuardedDevice("device", self.deviceGuard)
+        self.registry.onNewData(self.dataIdentifier, b"0")
+        changes = list(self.reportCollector.reports[-1].getAlarmChanges())
+        self.assertEqual(1, len(changes))
+        self.assertFalse(changes[0][2][0])
+
+class TestRestoredTimeoutTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = StateCheckpoint(os.path.join(self.directory.name, "state.json"))
+    def tearDown(self):
+        self.directory.cleanup()
+    def test_recovery(self):
+        self.checkpoint.save([("device", "test-broker", "test/topic", "TimeoutAlarm", True, "Update timeouted")])
+        reportCollector = ReportCollector()
+        registry = DeviceRegistry(reportCollector)
+        registry.setTimeoutTable(TimeoutTable())
+        registry.restoreAlarmStates(self.checkpoint.load())
+        dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        updateGuard = UpdateGuard("guard", dataIdentifier)
+        updateGuard.addAlarm(TimeoutAlarm.fromSeconds(10))
+        deviceGuard = DeviceGuard()
+        deviceGuard.addUpdateGuard(updateGuard)
+        registry.addGuardedDevice("device", deviceGuard)
+        registry.onPeriodic()
+        self.assertEqual([], reportCollector.reports)
+        registry.onNewData(dataIdentifier, b"1")
+        for i in range(3):
+            registry.onPeriodic()
+        self.assertEqual([("device", "test-broker", "test/topic", "TimeoutAlarm", False, None)],
+            registry.getAlarmStates())
+
+class TestReportingManagerJoin(unittest.TestCase):
+    def test_deadline(self):
+        manager = ReportingManager()
+        reporter = SlowReporter()
+        manager.addReporter(reporter)
+        manager.start()
+        manager.stop()
+        self.assertEqual([reporter], manager.join(0.05))
+        reporter.release.set()
+        self.assertEqual([], manager.join(5))
+
+class TestLifecycle(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.steps = []
+        self.reportCollector = ReportCollector()
+        self.registry, deviceGuard, _, _ = createRegistry(self.reportCollector)
+        self.registry.addGuardedDevice("device", deviceGuard)
+        self.registry.start()
+        self.manager = ReportingManager()
+        self.checkpoint = StateCheckpoint(os.path.join(self.directory.name, "state.json"))
+        self.lifecycle = Lifecycle(StepRecorder(self.steps, "ingest"), self.registry, self.manager, 5, self.checkpoint)
+    def tearDown(self):
+        self.directory.cleanup()
+    def test_shutdown(self):
+        self.lifecycle.startService(StepRecorder(self.steps, "service"))
+        self.manager.addReporter(StepRecorder(self.steps, "reporter"))
+        self.manager.start()
+        self.assertFalse(self.lifecycle.isShutdownRequested())
+        self.lifecycle.requestShutdown()
+        self.assertTrue(self.lifecycle.isShutdownRequested())
+        self.assertTrue(self.lifecycle.shutdown())
+        self.assertEqual(["ingest", "service", "reporter"], self.steps)
+        self.assertIsNone(self.registry.periodicThread)
+        self.assertEqual(sorted(self.registry.getAlarmStates()), sorted(self.checkpoint.load()))
+    def test_timeout(self):
+        self.lifecycle.timeout = 0.05
+        reporter = SlowReporter()
+        self.manager.addReporter(reporter)
+        self.manager.start()
+        self.assertFalse(self.lifecycle.shutdown())
+        self.assertTrue(os.path.exists(self.checkpoint.path))
+        reporter.release.set()
+        self.manager.join()
+
+class TestEarlyStop(unittest.TestCase):
+    def test_periodicChecker(self):
+        checker = PeriodicChecker.secondCheck(DeviceRegistry(ReportCollector()), 3600)
+        checker.stop()
+        # Stop requested before thread started must end the thread immediately.
+        checker()
+        self.assertFalse(checker.running)
+    def test_statisticsSummarizer(self):
+        summarizer = StatisticsSummarizer(IngestStatistics([]), ReportingManager(), 3600)
+        summarizer.stop()
+        summarizer()
+        self.assertFalse(summarizer.running)
+
+class TestSocketReporterStop(unittest.TestCase):
+    def test_queuedReportsSent(self):
+        reporter = SocketReporter(None, LineFormatter(), ("127.0.0.1", 0))
+        reporter.injectDeviceRegistry(RegistryStub())
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        while not reporter.running:
+            threading.Event().wait(0.01)
+        client = socket.create_connection(reporter.server.getsockname())
+        lines = client.makefile("r", encoding = "utf-8")
+        self.assertEqual("init\n", lines.readline())
+        for device in ("first", "second"):
+            reporter.report(ReportStub(device))
+        reporter.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(["first\n", "second\n"], lines.readlines())
+        lines.close()
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import contextlib
+import io
+import unittest
+import threading
+import tempfile
+import os
+
+from mqguard.linereporting import FileLineWriter
+from mqguard.reporting import BatchQueue
+
+class TestBatchQueue(unittest.TestCase):
+    def test_batch(self):
+        queue = BatchQueue()
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual([0, 1, 2], queue.getBatch(3))
+        self.assertEqual([3, 4], queue.getBatch(3))
+    def test_timeout(self):
+        self.assertEqual([], BatchQueue().getBatch(3, 0.01))
+    def test_dropWhenFull(self):
+        queue = BatchQueue(2)
+        self.assertTrue(queue.put(1))
+        self.assertTrue(queue.put(2))
+        self.assertFalse(queue.put(3))
+        self.assertEqual(1, queue.takeDropped())
+        self.assertEqual(0, queue.takeDropped())
+    def test_forcedItem(self):
+        queue = BatchQueue(1)
+        self.assertTrue(queue.put(1))
+        self.assertTrue(queue.put(2, force = True))
+        self.assertEqual(0, queue.takeDropped())
+        queue.close()
+        self.assertFalse(queue.put(3, force = True))
+        self.assertEqual(0, queue.takeDropped())
+        self.assertEqual([1, 2], queue.getBatch(10))
+    def test_close(self):
+        queue = BatchQueue()
+        queue.put(1)
+        queue.close()
+        self.assertFalse(queue.put(2))
+        self.assertFalse(queue.isDrained())
+        self.assertEqual([1], queue.getBatch(10))
+        self.assertTrue(queue.isDrained())
+
+class TestFileLineWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "mqguard.log")
+    def tearDown(self):
+        self.directory.cleanup()
+    def runWriter(self, writer, lines):
+        thread = threading.Thread(target = writer.run)
+        thread.start()
+        for line in lines:
+            writer.write(line)
+        writer.stop()
+        thread.join()
+    def test_write(self):
+        self.runWriter(FileLineWriter(self.filename), ["a\n", "b\n"])
+        with open(self.filename) as f:
+            self.assertEqual("a\nb\n", f.read())
+    def test_sizeRotation(self):
+        writer = FileLineWriter(self.filename, maxBytes = 10, daily = False, batchSize = 1)
+        self.runWriter(writer, ["123456\n", "123456\n", "123456\n"])
+        files = os.listdir(self.directory.name)
+        self.assertEqual(3, len(files))
+        with open(self.filename) as f:
+            self.assertEqual("123456\n", f.read())
+    def test_sizeInBytes(self):
+        writer = FileLineWriter(self.filename, maxBytes = 10, daily = False, batchSize = 1)
+        self.runWriter(writer, ["\u011b\u011b\u011b\u011b\n", "\u011b\u011b\u011b\u011b\n"])
+        files = os.listdir(self.directory.name)
+        self.assertEqual(2, len(files))
+        for filename in files:
+            self.assertEqual(9, os.path.getsize(os.path.join(self.directory.name, filename)))
+    def test_writeError(self):
+        self.filename = os.path.join(self.directory.name, "missing", "mqguard.log")
+        writer = FileLineWriter(self.filename, batchSize = 1)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            thread = threading.Thread(target = writer.run)
+            thread.start()
+            writer.write("a\n")
+            while "2 bytes dropped" not in stderr.getvalue():
+                thread.join(0.01)
+            os.mkdir(os.path.dirname(self.filename))
+            writer.write("b\n")
+            writer.stop()
+            thread.join()
+        self.assertIn("can't be opened", stderr.getvalue())
+        with open(self.filename) as f:
+            self.assertEqual("b\n", f.read())
+    def test_backupCount(self):
+        writer = FileLineWriter(self.filename, maxBytes = 1, daily = False, backupCount = 1, batchSize = 1)
+        self.runWriter(writer, ["a\n", "b\n", "c\n"])
+        self.assertEqual(2, len(os.listdir(self.directory.name)))
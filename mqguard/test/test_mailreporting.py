@@ -0,0 +1,118 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import contextlib
+import email
+import io
+import socketserver
+import threading
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.mailreporting import MailReporter, SMTPConnection
+from mqguard.throttling import Notification, NotificationThrottle
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """!
+    Minimal SMTP server storing received mails.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            command = line[:4].upper()
+            if command in ("HELO", "EHLO"):
+                self.reply("250 sink")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(line.split(":", 1)[1].strip("<> "))
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with .")
+                lines = []
+                while True:
+                    dataLine = self.rfile.readline()
+                    if dataLine in (b".\r\n", b""):
+                        break
+                    lines.append(dataLine)
+                self.server.mails.append((recipients, email.message_from_bytes(b"".join(lines))))
+                self.reply("250 OK")
+            elif command == "QUIT" or command == "":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0), SMTPSinkHandler)
+        self.mails = []
+        self.connections = 0
+
+class TestMailReporter(unittest.TestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        threading.Thread(target = self.sink.serve_forever).start()
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+    def tearDown(self):
+        self.sink.shutdown()
+        self.sink.server_close()
+    def createReporter(self, port):
+        connection = SMTPConnection("127.0.0.1", port)
+        return MailReporter(None, NotificationThrottle(), connection, "mqguard@example.com",
+            ["a@example.com", "b@example.com"], flushInterval = 60)
+    def createNotification(self, name, active):
+        return Notification("device", self.dataIdentifier, name, active, "message", 0)
+    def test_digestPerRecipient(self):
+        reporter = self.createReporter(self.sink.server_address[1])
+        reporter.onFlush(0, False)
+        reporter.sendNotification(self.createNotification("first", True))
+        reporter.sendNotification(self.createNotification("second", False))
+        self.assertEqual(60, reporter.getWaitTime(0))
+        reporter.onFlush(10, False)
+        self.assertEqual([], self.sink.mails)
+        reporter.onFlush(60, True)
+        self.assertEqual([["a@example.com"], ["b@example.com"]], [recipients for recipients, _ in self.sink.mails])
+        _, message = self.sink.mails[0]
+        self.assertIn("2 alarm transitions", message["Subject"])
+        self.assertIn("first", message.get_payload())
+        self.assertEqual(1, self.sink.connections)
+    def test_backoff(self):
+        # Nothing listens on port 1.
+        reporter = self.createReporter(1)
+        reporter.onFlush(0, False)
+        reporter.sendNotification(self.createNotification("first", True))
+        with contextlib.redirect_stderr(io.StringIO()):
+            reporter.onFlush(60, False)
+            self.assertEqual(2, len(reporter.outbox))
+            self.assertEqual(1, reporter.getWaitTime(60))
+            reporter.connection.port = self.sink.server_address[1]
+            reporter.onFlush(60.5, False)
+            self.assertEqual(2, len(reporter.outbox))
+            reporter.onFlush(61, False)
+        self.assertEqual(0, len(reporter.outbox))
+        self.assertEqual(2, len(self.sink.mails))
+        reporter.connection.close()
@@ -0,0 +1,134 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from mqguard.plugins import PluginRegistry, PluginException
+from mqguard.config import ProgramConfig, ConfigException, alarmRegistry
+from mqguard.alarms import EnumerationAlarm
+
+CONFIG = """
+[Brokers]
+Enabled = test-broker
+
+[test-broker]
+Host = localhost
+Port = 1883
+Topic = test/#
+
+[Devices]
+Enabled = device
+
+[device]
+Guard = device-guard
+
+[device-guard]
+test-broker test/topic = topic-update
+
+[topic-update]
+Alarms = {alarms}
+
+[Reporters]
+Enabled = printer
+
+[printer]
+Type = {reporterType}
+"""
+
+def createOnOffAlarm(config, updateGuardSection):
+    return EnumerationAlarm(config.parser.get(updateGuardSection, "Values").split())
+
+class TestPluginRegistry(unittest.TestCase):
+    def test_lazyReference(self):
+        registry = PluginRegistry("mqguard.test", {"dumps": "json:dumps"})
+        self.assertEqual({}, registry.factories)
+        import json
+        self.assertIs(json.dumps, registry.load("dumps"))
+        self.assertIs(json.dumps, registry.factories["dumps"])
+    def test_registerFactory(self):
+        registry = PluginRegistry("mqguard.test")
+        registry.register("alarm", createOnOffAlarm)
+        self.assertIs(createOnOffAlarm, registry.load("alarm"))
+        self.assertEqual({"alarm"}, registry.getNames())
+    def test_unknownPlugin(self):
+        registry = PluginRegistry("mqguard.test")
+        with self.assertRaises(PluginException):
+            registry.load("missing")
+    def test_brokenReference(self):
+        registry = PluginRegistry("mqguard.test", {"broken": "mqguard.nonexistent:factory"})
+        with self.assertRaises(PluginException):
+            registry.load("broken")
+
+class TestConfigPlugins(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.configFile = os.path.join(self.directory.name, "mqguard.conf")
+        alarmRegistry.register("onoff", createOnOffAlarm)
+    def tearDown(self):
+        alarmRegistry.factories.pop("onoff", None)
+        self.directory.cleanup()
+    def writeConfig(self, alarms, reporterType = "print"):
+        with open(self.configFile, "w") as f:
+            f.write(CONFIG.format(alarms = alarms, reporterType = reporterType))
+    def test_pluginAlarm(self):
+        self.writeConfig("onoff\nValues = on off")
+        configCache = ProgramConfig(self.configFile).parse()
+        deviceName, presence, guards = configCache.devices[0]
+        alarms = guards[0][2]
+        self.assertEqual(1, len(alarms))
+        self.assertIsInstance(alarms[0], EnumerationAlarm)
+    def test_unknownAlarm(self):
+        self.writeConfig("missing")
+        with self.assertRaises(ConfigException):
+            ProgramConfig(self.configFile).parse()
+    def test_invalidField(self):
+        self.writeConfig("onoff\nValues = on off\nField = a..b")
+        with self.assertRaisesRegex(ConfigException, "topic-update"):
+            ProgramConfig(self.configFile).parse()
+    def test_aggregatedRate(self):
+        self.writeConfig("\nRateMax = 5\nRateAggregate = yes")
+        configCache = ProgramConfig(self.configFile).parse()
+        self.assertTrue(configCache.devices[0][2][0][2][0].aggregate)
+    def test_aggregatedRateWithOtherAlarms(self):
+        self.writeConfig("onoff\nValues = on off\nRateMax = 5\nRateAggregate = yes")
+        with self.assertRaisesRegex(ConfigException, "RateAggregate"):
+            ProgramConfig(self.configFile).parse()
+    def test_unknownReporter(self):
+        self.writeConfig("onoff\nValues = on off", "missing")
+        with self.assertRaises(ConfigException):
+            ProgramConfig(self.configFile).parse()
+    def test_unusedReportersNotImported(self):
+        self.writeConfig("onoff\nValues = on off")
+        script = "\n".join([
+            "import sys",
+            "from mqguard.config import ProgramConfig, alarmRegistry",
+            "from mqguard.test.test_plugins import createOnOffAlarm",
+            "alarmRegistry.register('onoff', createOnOffAlarm)",
+            "ProgramConfig(sys.argv[1]).parse()",
+            "print(' '.join(sorted(m for m in sys.modules if m.startswith('mqguard.') or m == 'websockets')))"])
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run([sys.executable, "-c", script, self.configFile], cwd = root,
+            stdout = subprocess.PIPE, check = True).stdout.decode().split()
+        self.assertIn("mqguard.linereporting", output)
+        for module in ("mqguard.streamreporting", "mqguard.mailreporting", "mqguard.webhookreporting", "websockets"):
+            self.assertNotIn(module, output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import contextlib
+import io
+import os
+import socket
+import tempfile
+import time
+import types
+import unittest
+
+from mqguard.config import ProgramConfig, ConfigException, reporterRegistry
+from mqguard.reloading import ConfigDiff, ConfigReloader
+from mqguard.reporting import BaseReporter, ReportingManager
+from mqguard.supervising import DeviceRegistry
+from mqguard.system import System, DataIdentifierFactory
+
+CONFIG = """
+[Global]
+HistorySize = {historySize}
+
+[Brokers]
+Enabled = test-broker
+
+[test-broker]
+Host = {host}
+Port = 1883
+Topic = test/#
+
+[Devices]
+Enabled = {devices}
+
+[device-a]
+Guard = guard-a
+
+[guard-a]
+test-broker test/a = update-a
+
+[update-a]
+PeriodMax = {timeout}
+
+[device-b]
+Guard = guard-b
+
+[guard-b]
+test-broker test/b = update-b
+
+[update-b]
+PeriodMax = 60
+
+[Reporters]
+Enabled = first second {extra}
+
+[first]
+Type = recording
+Label = first
+
+[second]
+Type = recording
+Label = {label}
+
+[socket]
+Type = socket
+ListenAddress = 127.0.0.1
+ListenPort = {port}
+ReplaySize = {replaySize}
+"""
+
+class RecordingReporter(BaseReporter):
+    """!
+    Reporter counting its instances and devices. Its thread ends immediately.
+    """
+    created = 0
+    def __init__(self, label):
+        super().__init__(None)
+        RecordingReporter.created += 1
+        self.label = label
+        self.devices = set()
+        self.stopped = False
+    def addDevice(self, device, guard):
+        self.devices.add(device)
+    def removeDevice(self, device):
+        self.devices.discard(device)
+    def __call__(self):
+        pass
+    def stop(self):
+        self.stopped = True
+
+def createRecordingReporter(config, reporterSection):
+    return RecordingReporter(config.parser.get(reporterSection, "Label"))
+
+class ConfigFile:
+    """!
+    Temporary configuration file with default values of CONFIG fields.
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "mqguard.conf")
+    def write(self, **fields):
+        values = dict(historySize = 32, host = "localhost", devices = "device-a device-b",
+            timeout = 60, label = "second", extra = "", port = 0, replaySize = 1000)
+        values.update(fields)
+        with open(self.path, "w") as f:
+            f.write(CONFIG.format(**values))
+    def parse(self, runningConfig = None):
+        return ProgramConfig(self.path).parse(runningConfig)
+
+class TestConfigDiff(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.configFile = ConfigFile(self.directory.name)
+        reporterRegistry.register("recording", createRecordingReporter)
+    def tearDown(self):
+        reporterRegistry.factories.pop("recording", None)
+        self.directory.cleanup()
+    def compare(self, **fields):
+        self.configFile.write()
+        oldConfig = self.configFile.parse()
+        self.configFile.write(**fields)
+        return ConfigDiff(oldConfig, self.configFile.parse(oldConfig))
+    def test_noChanges(self):
+        diff = self.compare()
+        for sectionDiff in (diff.globals, diff.brokers, diff.devices, diff.templates, diff.reporters):
+            self.assertFalse(sectionDiff.hasChanges())
+        diff.checkApplicable()
+    def test_deviceChanges(self):
+        diff = self.compare(devices = "device-a", timeout = 30)
+        self.assertEqual({"device-a"}, diff.devices.changed)
+        self.assertEqual({"device-b"}, diff.devices.removed)
+        self.assertEqual(set(), diff.devices.added)
+        keptGuards, keepPresence = diff.getDeviceChanges("device-a")
+        self.assertEqual(set(), keptGuards)
+        self.assertTrue(keepPresence)
+    def test_reporterChanges(self):
+        diff = self.compare(label = "changed")
+        self.assertEqual({"second"}, diff.reporters.changed)
+        self.assertEqual({"first"}, diff.reporters.unchanged)
+    def test_globalChanges(self):
+        diff = self.compare(historySize = 8)
+        self.assertTrue(diff.globals.hasChanges())
+        diff.checkApplicable()
+    def test_brokerChanges(self):
+        diff = self.compare(host = "example.com")
+        with self.assertRaises(ConfigException):
+            diff.checkApplicable()
+    def test_unchangedReportersReused(self):
+        self.configFile.write()
+        oldConfig = self.configFile.parse()
+        created = RecordingReporter.created
+        self.configFile.write(label = "changed")
+        newConfig = self.configFile.parse(oldConfig)
+        self.assertEqual(created + 1, RecordingReporter.created)
+        self.assertIs(oldConfig.getReporter("first")[2], newConfig.getReporter("first")[2])
+        self.assertEqual("changed", newConfig.getReporter("second")[2].label)
+
+SYSTEM_STATE = ("cliArgs", "configCache", "dataIdentifierFactory", "verbose", "_brokerListenDescriptors",
+    "_deviceGuards", "_deviceTemplates", "_reporters", "_ingestStatistics")
+
+def getFreePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class TestConfigReloader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.configFile = ConfigFile(self.directory.name)
+        reporterRegistry.register("recording", createRecordingReporter)
+        self.configFile.write()
+        self.systemState = {name: getattr(System, name, None) for name in SYSTEM_STATE}
+        System.cliArgs = types.SimpleNamespace(config = self.configFile.path)
+        System.configCache = System.parseConfig()
+        System.dataIdentifierFactory = DataIdentifierFactory(System.configCache)
+        System.verbose = False
+        System._deviceGuards = None
+        System._deviceTemplates = None
+        System._reporters = None
+        self.reportingManager = ReportingManager()
+        for reporter in System.getReporters():
+            self.reportingManager.addReporter(reporter)
+        self.deviceRegistry = DeviceRegistry(self.reportingManager)
+        for device, guard in System.getDeviceGuards():
+            self.deviceRegistry.addGuardedDevice(device, guard)
+            self.reportingManager.addDevice(device, guard)
+        self.reloader = ConfigReloader(self.deviceRegistry, self.reportingManager)
+    def tearDown(self):
+        self.reportingManager.stop()
+        self.reportingManager.join(5)
+        for name, value in self.systemState.items():
+            setattr(System, name, value)
+        reporterRegistry.factories.pop("recording", None)
+        self.directory.cleanup()
+    def getReporters(self):
+        return {reporter.label: reporter for reporter in self.reportingManager.reporters
+            if isinstance(reporter, RecordingReporter)}
+    def getSocketReporter(self):
+        reporter = System.configCache.getReporter("socket")[2]
+        deadline = time.monotonic() + 5
+        while not reporter.running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(reporter.running)
+        return reporter
+    def test_reload(self):
+        oldReporters = self.getReporters()
+        created = RecordingReporter.created
+        self.configFile.write(devices = "device-a", label = "changed")
+        self.assertTrue(self.reloader.reload())
+        self.assertEqual(created + 1, RecordingReporter.created)
+        reporters = self.getReporters()
+        self.assertEqual({"first", "changed"}, set(reporters))
+        self.assertIs(oldReporters["first"], reporters["first"])
+        self.assertTrue(oldReporters["second"].stopped)
+        self.assertEqual({"device-a"}, reporters["first"].devices)
+        self.assertEqual({"device-a"}, reporters["changed"].devices)
+        self.assertEqual({"device-a"}, set(self.deviceRegistry.guardedDevices))
+    def test_brokerChangeRefused(self):
+        runningConfig = System.configCache
+        self.configFile.write(host = "example.com")
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertFalse(self.reloader.reload())
+        self.assertIn("restart", stderr.getvalue())
+        self.assertIs(runningConfig, System.configCache)
+    def test_globalChangeKept(self):
+        self.configFile.write(historySize = 8, devices = "device-a")
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertTrue(self.reloader.reload())
+        self.assertIn("Global", stderr.getvalue())
+        self.assertEqual(32, System.configCache.getGlobal("HistorySize"))
+        self.assertEqual({"device-a"}, set(self.deviceRegistry.guardedDevices))
+    def test_changedListeningReporter(self):
+        port = getFreePort()
+        self.configFile.write(extra = "socket", port = port)
+        self.assertTrue(self.reloader.reload())
+        oldReporter = self.getSocketReporter()
+        self.configFile.write(extra = "socket", port = port, replaySize = 10)
+        self.assertTrue(self.reloader.reload())
+        reporter = self.getSocketReporter()
+        self.assertIsNot(oldReporter, reporter)
+        self.assertEqual([], [r for r, thread in self.reportingManager.threads if r is oldReporter])
+        socket.create_connection(("127.0.0.1", port)).close()
+    def test_rejectedReloadOpensNoSocket(self):
+        self.configFile.write(host = "example.com", extra = "socket", port = getFreePort())
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertFalse(self.reloader.reload())
+        newReporter = System.parseConfig().getReporter("socket")[2]
+        self.assertIsNone(newReporter.server)
@@ -0,0 +1,78 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.statistics import IngestStatistics
+from mqguard.supervising import UpdateGuard, DeviceGuard, DeviceRegistry
+from mqguard.alarms import NumericAlarm
+from mqguard.test.stubs import ReportCollector
+
+class TestIngestStatistics(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.statistics = IngestStatistics([(self.broker, ["sensors/#", "sensors/+/temperature", "other/#"])])
+    def test_subscriptions(self):
+        self.statistics.addMessage(DataIdentifier(self.broker, "sensors/a/temperature"), 4, False)
+        self.statistics.addMessage(DataIdentifier(self.broker, "sensors/a/humidity"), 2, True)
+        brokerStatistics = self.statistics.getBroker(self.broker)
+        self.assertEqual(2, brokerStatistics.total.messages)
+        self.assertEqual(6, brokerStatistics.total.bytes)
+        self.assertEqual(1, brokerStatistics.total.unguarded)
+        self.assertEqual(2, brokerStatistics.subscriptions["sensors/#"].messages)
+        self.assertEqual(1, brokerStatistics.subscriptions["sensors/+/temperature"].messages)
+        self.assertEqual(0, brokerStatistics.subscriptions["other/#"].messages)
+        self.assertIsNone(brokerStatistics.subscriptions["other/#"].lastMessageTime)
+    def test_unknownBroker(self):
+        broker = Broker("unknown-broker", "localhost", 1884)
+        self.statistics.addMessage(DataIdentifier(broker, "a"), 1, True)
+        self.assertEqual(1, self.statistics.getBroker(broker).total.messages)
+    def test_summary(self):
+        di = DataIdentifier(self.broker, "sensors/a/temperature")
+        self.statistics.addMessage(di, 1, False)
+        self.statistics.takeSummary()
+        self.statistics.addMessage(di, 1, False)
+        self.statistics.addMessage(di, 1, False)
+        [(broker, total, delta, seconds)] = self.statistics.takeSummary()
+        self.assertIs(self.broker, broker)
+        self.assertEqual(3, total.messages)
+        self.assertEqual(2, delta.messages)
+        self.assertGreaterEqual(seconds, 0)
+
+class TestRegistryStatistics(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.statistics = IngestStatistics([(self.broker, ["sensors/#"])])
+        self.registry = DeviceRegistry(ReportCollector())
+        self.registry.setStatistics(self.statistics)
+        updateGuard = UpdateGuard("guard", DataIdentifier(self.broker, "sensors/+/temperature"))
+        updateGuard.addAlarm(NumericAlarm())
+        deviceGuard = DeviceGuard()
+        deviceGuard.addUpdateGuard(updateGuard)
+        self.registry.addGuardedDevice("device", deviceGuard)
+    def test_counters(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/temperature"), b"21.5")
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/temperature"), b"x")
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/humidity"), b"40")
+        total = self.statistics.getBroker(self.broker).total
+        self.assertEqual(3, total.messages)
+        self.assertEqual(7, total.bytes)
+        self.assertEqual(1, total.unguarded)
+        self.assertEqual(1, total.decodeFailures)
+        self.assertEqual(1, self.statistics.getBroker(self.broker).subscriptions["sensors/#"].decodeFailures)
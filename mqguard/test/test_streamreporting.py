@@ -0,0 +1,321 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import socket
+import struct
+import threading
+import unittest
+import zlib
+
+from mqguard.streamreporting import ReplayBuffer, StreamingReporter, SocketReporter, WebsocketReporterSession, \
+    WebsocketReporter, ZlibStream
+from mqguard.test.stubs import RegistryStub, ReportStub
+
+class SequenceFormatter:
+    def formatInitialData(self, deviceReports, sequence = None, stream = None):
+        return "init:{}".format(sequence)
+    def formatDeviceReport(self, deviceReport, sequence = None):
+        return "{}:{}".format(deviceReport.device, sequence)
+    def formatError(self, message):
+        return "error:{}".format(message)
+    def formatCompression(self, compression):
+        return "compression:{}".format(compression)
+    def formatSessions(self, sessions):
+        return json.dumps([[compression, rawBytes, sentBytes] for address, compression, rawBytes, sentBytes in sessions])
+
+class CountingFormatter(SequenceFormatter):
+    def __init__(self):
+        self.initialData = 0
+    def formatInitialData(self, deviceReports, sequence = None, stream = None):
+        self.initialData += 1
+        return SequenceFormatter.formatInitialData(self, deviceReports, sequence, stream)
+
+class TestReplayBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReplayBuffer(3)
+        for sequence in range(1, 6):
+            self.buffer.append(sequence, "report {}".format(sequence))
+    def test_getSince(self):
+        self.assertEqual([(4, "report 4"), (5, "report 5")], self.buffer.getSince(3))
+        self.assertEqual([(3, "report 3"), (4, "report 4"), (5, "report 5")], self.buffer.getSince(2))
+        self.assertEqual([], self.buffer.getSince(5))
+    def test_outOfBuffer(self):
+        self.assertIsNone(self.buffer.getSince(1))
+        self.assertIsNone(self.buffer.getSince(6))
+    def test_disabled(self):
+        buffer = ReplayBuffer(0)
+        buffer.append(1, "report")
+        self.assertEqual([], buffer.getSince(1))
+        self.assertIsNone(buffer.getSince(0))
+
+class TestSessionStart(unittest.TestCase):
+    def setUp(self):
+        self.reporter = StreamingReporter(None, SequenceFormatter(), 2)
+        self.reporter.injectDeviceRegistry(RegistryStub())
+        for device in ("a", "b", "c"):
+            self.reporter.publish(ReportStub(device))
+    def test_newSession(self):
+        self.assertEqual((3, ["init:3"]), self.reporter.getSessionStart())
+    def test_resume(self):
+        self.assertEqual((3, ["c:3"]), self.reporter.getSessionStart(self.reporter.stream, 2))
+        self.assertEqual((3, []), self.reporter.getSessionStart(self.reporter.stream, 3))
+    def test_resumeOutOfBuffer(self):
+        self.assertEqual((3, ["init:3"]), self.reporter.getSessionStart(self.reporter.stream, 0))
+    def test_resumeOtherStream(self):
+        self.assertEqual((3, ["init:3"]), self.reporter.getSessionStart("other", 2))
+    def test_sharedSnapshot(self):
+        self.reporter.outputFormatter = CountingFormatter()
+        self.assertEqual(self.reporter.getSessionStart(), self.reporter.getSessionStart())
+        self.assertEqual(1, self.reporter.outputFormatter.initialData)
+        self.reporter.publish(ReportStub("d"))
+        self.assertEqual((4, ["init:4"]), self.reporter.getSessionStart())
+        self.reporter.removeDevice("a")
+        self.reporter.getSessionStart()
+        self.assertEqual(3, self.reporter.outputFormatter.initialData)
+    def test_parseSessionRequest(self):
+        self.assertEqual(("s", 7, None), self.reporter.parseSessionRequest('{"request": "resume", "stream": "s", "seq": 7}'))
+        self.assertEqual((None, None, "zlib"), self.reporter.parseSessionRequest('{"request": "start", "compression": "zlib"}'))
+        self.assertIsNone(self.reporter.parseSessionRequest('{"request": "history", "device": "a"}'))
+        self.assertIsNone(self.reporter.parseSessionRequest('not json'))
+
+class TestSocketReporterDefaultTimeout(unittest.TestCase):
+    def setUp(self):
+        self.reporter = SocketReporter(None, SequenceFormatter(), ("127.0.0.1", 0))
+        self.reporter.injectDeviceRegistry(RegistryStub())
+        self.thread = threading.Thread(target = self.reporter)
+        self.thread.start()
+        while not self.reporter.running:
+            threading.Event().wait(0.01)
+    def tearDown(self):
+        self.reporter.stop()
+        self.thread.join(5)
+    def test_sessionRequestIgnored(self):
+        self.reporter.report(ReportStub("a"))
+        client = socket.create_connection(self.reporter.server.getsockname())
+        lines = client.makefile("r", encoding = "utf-8")
+        self.assertEqual("init:1\n", lines.readline())
+        # Without resume timeout, session request is answered as ordinary request.
+        request = {"request": "resume", "stream": self.reporter.stream, "seq": 1, "compression": "zlib"}
+        client.sendall(json.dumps(request).encode() + b"\n")
+        self.assertTrue(lines.readline().startswith("error:"))
+        lines.close()
+        client.close()
+
+class TestZlibStream(unittest.TestCase):
+    def test_persistentHistory(self):
+        stream = ZlibStream()
+        decompressor = zlib.decompressobj()
+        lines = [json.dumps({"feed": "update", "seq": i, "devices": [{"name": "device {}".format(i % 10),
+            "status": "ok", "reasons": {"presence": None, "guards": []}}]}).encode() + b"\n" for i in range(100)]
+        compressed = 0
+        for line in lines:
+            data = stream.encode(line)
+            compressed += len(data)
+            # Every write is readable immediately.
+            self.assertEqual(line, decompressor.decompress(data))
+        decompressor.decompress(stream.finish())
+        self.assertTrue(decompressor.eof)
+        self.assertGreater(sum(len(line) for line in lines) / compressed, 5)
+
+class TestWebsocketResumePosition(unittest.TestCase):
+    def test_query(self):
+        session = WebsocketReporterSession(None, None, None, "/?stream=abc&seq=12")
+        self.assertEqual(("abc", 12), session.getResumePosition())
+    def test_noQuery(self):
+        for path in (None, "/", "/?stream=abc&seq=x"):
+            session = WebsocketReporterSession(None, None, None, path)
+            self.assertEqual((None, None), session.getResumePosition())
+
+class TestSocketReporterResume(unittest.TestCase):
+    def setUp(self):
+        self.reporter = SocketReporter(None, SequenceFormatter(), ("127.0.0.1", 0), 10, 5)
+        self.reporter.injectDeviceRegistry(RegistryStub())
+        self.thread = threading.Thread(target = self.reporter)
+        self.thread.start()
+        while not self.reporter.running:
+            threading.Event().wait(0.01)
+    def tearDown(self):
+        self.reporter.stop()
+        self.thread.join(5)
+    def connect(self, request):
+        client = socket.create_connection(self.reporter.server.getsockname())
+        client.sendall(request.encode() + b"\n")
+        return client, client.makefile("r", encoding = "utf-8")
+    def test_resume(self):
+        for device in ("a", "b", "c"):
+            self.reporter.report(ReportStub(device))
+        request = json.dumps({"request": "resume", "stream": self.reporter.stream, "seq": 1})
+        client, lines = self.connect(request)
+        self.assertEqual(["b:2\n", "c:3\n"], [lines.readline(), lines.readline()])
+        self.reporter.report(ReportStub("d"))
+        self.assertEqual("d:4\n", lines.readline())
+        lines.close()
+        client.close()
+    def test_snapshotWithoutResume(self):
+        self.reporter.report(ReportStub("a"))
+        client, lines = self.connect(json.dumps({"request": "unknown", "device": "a"}))
+        self.assertEqual("init:1\n", lines.readline())
+        # First line wasn't resume request, it is handled as ordinary request.
+        self.assertIn("Unknown request", lines.readline())
+        lines.close()
+        client.close()
+
+class TestSocketReporterCompression(unittest.TestCase):
+    def setUp(self):
+        self.reporter = SocketReporter(None, SequenceFormatter(), ("127.0.0.1", 0), 10, 5)
+        self.reporter.injectDeviceRegistry(RegistryStub())
+        self.thread = threading.Thread(target = self.reporter)
+        self.thread.start()
+        while not self.reporter.running:
+            threading.Event().wait(0.01)
+    def connect(self, request):
+        client = socket.create_connection(self.reporter.server.getsockname())
+        client.sendall(request.encode() + b"\n")
+        data = b""
+        while b"\n" not in data:
+            data += client.recv(4096)
+        line, _, data = data.partition(b"\n")
+        return client, line.decode(), data
+    def readAll(self, client, data):
+        while True:
+            chunk = client.recv(4096)
+            if len(chunk) == 0:
+                return data
+            data += chunk
+    def test_compressedSession(self):
+        client, line, data = self.connect(json.dumps({"request": "start", "compression": "zlib"}))
+        self.assertEqual("compression:zlib", line)
+        decompressor = zlib.decompressobj()
+        received = decompressor.decompress(data)
+        while not received.endswith(b"\n"):
+            received += decompressor.decompress(client.recv(4096))
+        self.assertEqual(b"init:0\n", received)
+        for device in ("a", "b"):
+            self.reporter.report(ReportStub(device))
+        # Wait for reports, so they are counted in session statistics.
+        while received.count(b"\n") < 3:
+            received += decompressor.decompress(client.recv(4096))
+        client.sendall(json.dumps({"request": "sessions"}).encode() + b"\n")
+        while received.count(b"\n") < 4:
+            received += decompressor.decompress(client.recv(4096))
+        self.reporter.stop()
+        self.thread.join(5)
+        received += decompressor.decompress(self.readAll(client, b""))
+        self.assertTrue(decompressor.eof)
+        lines = received.decode().splitlines()
+        self.assertEqual(["init:0", "a:1", "b:2"], lines[:3])
+        compression, rawBytes, sentBytes = json.loads(lines[3])[0]
+        self.assertEqual("zlib", compression)
+        self.assertEqual(len("compression:zlib\ninit:0\na:1\nb:2\n"), rawBytes)
+        self.assertGreater(sentBytes, 0)
+        client.close()
+    def test_compressionDisabled(self):
+        self.reporter.compression = False
+        client, line, data = self.connect(json.dumps({"request": "start", "compression": "zlib"}))
+        self.assertEqual("compression:none", line)
+        self.reporter.stop()
+        self.thread.join(5)
+        self.assertEqual(b"init:0\n", self.readAll(client, data))
+        client.close()
+
+class TestWebsocketReporterCompression(unittest.TestCase):
+    def test_statistics(self):
+        from websockets.sync.client import connect
+        reporter = WebsocketReporter(None, SequenceFormatter(), ("127.0.0.1", 0))
+        reporter.injectDeviceRegistry(RegistryStub())
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        while not reporter.running:
+            threading.Event().wait(0.01)
+        port = next(iter(reporter.server.sockets)).getsockname()[1]
+        try:
+            with connect("ws://127.0.0.1:{}/".format(port)) as websocket:
+                self.assertEqual("init:0\n", websocket.recv(5))
+                websocket.send(json.dumps({"request": "sessions"}))
+                compression, rawBytes, sentBytes = json.loads(websocket.recv(5))[0]
+                self.assertEqual("deflate", compression)
+                self.assertEqual(len("init:0\n"), rawBytes)
+            with connect("ws://127.0.0.1:{}/".format(port), compression = None) as websocket:
+                websocket.recv(5)
+                websocket.send(json.dumps({"request": "sessions"}))
+                self.assertIn(["none", 7, 7], json.loads(websocket.recv(5)))
+        finally:
+            reporter.stop()
+            thread.join(5)
+
+class LongReportStub(ReportStub):
+    def __init__(self, device):
+        ReportStub.__init__(self, device * 100000)
+
+class TestSocketReporterLoop(unittest.TestCase):
+    def startReporter(self, resumeTimeout = 0, outputLimit = 0):
+        self.reporter = SocketReporter(None, SequenceFormatter(), ("127.0.0.1", 0), 10, resumeTimeout, True, outputLimit)
+        self.reporter.injectDeviceRegistry(RegistryStub())
+        self.thread = threading.Thread(target = self.reporter)
+        self.thread.start()
+        while not self.reporter.running:
+            threading.Event().wait(0.01)
+    def tearDown(self):
+        self.reporter.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+    def waitFor(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            threading.Event().wait(0.01)
+        self.fail("condition not met")
+    def test_singleThread(self):
+        self.startReporter()
+        threads = threading.active_count()
+        clients = [socket.create_connection(self.reporter.server.getsockname()) for _ in range(20)]
+        files = [client.makefile("r", encoding = "utf-8") for client in clients]
+        self.assertEqual(["init:0\n"] * 20, [f.readline() for f in files])
+        self.reporter.report(ReportStub("a"))
+        self.assertEqual(["a:1\n"] * 20, [f.readline() for f in files])
+        self.assertEqual(threads, threading.active_count())
+        for f, client in zip(files, clients):
+            f.close()
+            client.close()
+    def test_deadSessionRemoved(self):
+        self.startReporter()
+        client = socket.create_connection(self.reporter.server.getsockname())
+        self.waitFor(lambda: len(self.reporter.sessions) == 1)
+        # Reset connection instead of orderly close.
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        client.close()
+        self.reporter.report(ReportStub("a"))
+        self.waitFor(lambda: len(self.reporter.sessions) == 0)
+    def test_outputLimit(self):
+        self.startReporter(outputLimit = 100000)
+        client = socket.create_connection(self.reporter.server.getsockname())
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.waitFor(lambda: len(self.reporter.sessions) == 1)
+        for device in range(200):
+            self.reporter.report(LongReportStub(str(device % 10)))
+        self.waitFor(lambda: len(self.reporter.sessions) == 0)
+        client.close()
+    def test_resumeTimeout(self):
+        self.startReporter(resumeTimeout = 0.1)
+        client = socket.create_connection(self.reporter.server.getsockname())
+        lines = client.makefile("r", encoding = "utf-8")
+        self.assertEqual("init:0\n", lines.readline())
+        lines.close()
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,9 @@ import unittest
 from mqreceive.data import DataIdentifier
 from mqreceive.broker import Broker
 
-from mqguard.supervising import UpdateGuard
+from mqguard.supervising import UpdateGuard, DeviceGuard, DeviceRegistry
+from mqguard.alarms import TimeoutAlarm, NumericAlarm, RateAlarm, RangeAlarm, JSONFieldAlarm
+from mqguard.test.stubs import ReportCollector
 
 class TestUpdateGuard(unittest.TestCase):
     def setUp(self):
@@ -37,3 +39,161 @@ class TestUpdateGuard(unittest.TestCase):
     def test_isNotRelevant(self):
         di = DataIdentifier(self.guardedDataIdentifier.broker, self.guardedDataIdentifier.topic[::-1])
         self.assertFalse(self.updateGuard.isUpdateRelevant(di))
+
+class ValueCollectingAlarm(RangeAlarm):
+    def __init__(self):
+        RangeAlarm.__init__(self, 0, 10)
+        self.values = []
+    def checkValue(self, dataIdentifier, value):
+        self.values.append(value)
+        return RangeAlarm.checkValue(self, dataIdentifier, value)
+
+class TestNumericUpdateGuard(unittest.TestCase):
+    def setUp(self):
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        self.updateGuard = UpdateGuard("guard", self.dataIdentifier)
+        self.alarm = ValueCollectingAlarm()
+        self.updateGuard.addAlarm(NumericAlarm())
+        self.updateGuard.addAlarm(self.alarm)
+    def test_parsedValue(self):
+        alarms = self.updateGuard.getUpdateCheck(self.dataIdentifier, b"12.5")
+        self.assertEqual([12.5], self.alarm.values)
+        self.assertEqual(12.5, self.updateGuard.lastValue)
+        self.assertTrue(alarms[self.alarm][0])
+    def test_notNumber(self):
+        alarms = self.updateGuard.getUpdateCheck(self.dataIdentifier, b"abc")
+        self.assertEqual([], self.alarm.values)
+        self.assertIsNone(self.updateGuard.lastValue)
+        self.assertTrue(all(active for active, _ in alarms.values()))
+
+class DocumentCountingAlarm(JSONFieldAlarm):
+    documents = []
+    def checkDocument(self, dataIdentifier, document):
+        self.documents.append(document)
+        return JSONFieldAlarm.checkDocument(self, dataIdentifier, document)
+
+class TestDocumentUpdateGuard(unittest.TestCase):
+    def setUp(self):
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        self.updateGuard = UpdateGuard("guard", self.dataIdentifier)
+        self.updateGuard.addAlarm(DocumentCountingAlarm("temperature", RangeAlarm(0, 50), 64))
+        self.updateGuard.addAlarm(DocumentCountingAlarm("humidity", RangeAlarm(0, 100), 1024))
+        DocumentCountingAlarm.documents = []
+    def test_parsedOnce(self):
+        alarms = self.updateGuard.getUpdateCheck(self.dataIdentifier, b'{"temperature": 20, "humidity": 200}')
+        self.assertIs(DocumentCountingAlarm.documents[0], DocumentCountingAlarm.documents[1])
+        self.assertEqual([False, True], [active for active, _ in alarms.values()])
+    def test_sizeLimit(self):
+        alarms = self.updateGuard.getUpdateCheck(self.dataIdentifier, b'{"temperature": 20, "humidity": 50, "padding": "' + b"x" * 64 + b'"}')
+        self.assertEqual([], DocumentCountingAlarm.documents)
+        self.assertEqual([True, True], [active for active, _ in alarms.values()])
+    def test_deeplyNested(self):
+        updateGuard = UpdateGuard("guard", self.dataIdentifier)
+        updateGuard.addAlarm(DocumentCountingAlarm("temperature", RangeAlarm(0, 50), 1000000))
+        alarms = updateGuard.getUpdateCheck(self.dataIdentifier, b"[" * 200000 + b"]" * 200000)
+        self.assertEqual([], DocumentCountingAlarm.documents)
+        self.assertEqual([True], [active for active, _ in alarms.values()])
+        self.assertTrue(updateGuard.decodeFailed)
+
+class TestWildcardUpdateGuard(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.updateGuard = UpdateGuard("wildcard-guard", DataIdentifier(self.broker, "sensors/+/temperature"))
+        self.updateGuard.addAlarm(TimeoutAlarm.fromSeconds(5))
+    def test_isWildcard(self):
+        self.assertTrue(self.updateGuard.isWildcard())
+    def test_isRelevant(self):
+        self.assertTrue(self.updateGuard.isUpdateRelevant(DataIdentifier(self.broker, "sensors/a/temperature")))
+    def test_isNotRelevant(self):
+        self.assertFalse(self.updateGuard.isUpdateRelevant(DataIdentifier(self.broker, "sensors/a/humidity")))
+        otherBroker = Broker("other-broker", "localhost", 1884)
+        self.assertFalse(self.updateGuard.isUpdateRelevant(DataIdentifier(otherBroker, "sensors/a/temperature")))
+    def test_createInstance(self):
+        di = DataIdentifier(self.broker, "sensors/a/temperature")
+        instance = self.updateGuard.createInstance(di)
+        self.assertFalse(instance.isWildcard())
+        self.assertEqual(di, instance.dataIdentifier)
+        templateAlarms = list(self.updateGuard.getAlarms())
+        instanceAlarms = list(instance.getAlarms())
+        self.assertEqual(len(templateAlarms), len(instanceAlarms))
+        self.assertIsNot(templateAlarms[0], instanceAlarms[0])
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.reportCollector = ReportCollector()
+        self.registry = DeviceRegistry(self.reportCollector)
+        updateGuard = UpdateGuard("guard", DataIdentifier(self.broker, "sensors/+/temperature"))
+        updateGuard.addAlarm(NumericAlarm())
+        self.deviceGuard = DeviceGuard()
+        self.deviceGuard.addUpdateGuard(updateGuard)
+        self.registry.addGuardedDevice("device", self.deviceGuard)
+    def test_unguardedTopic(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/humidity"), b"1")
+        self.assertEqual([], self.reportCollector.reports)
+    def test_wildcardInstance(self):
+        di = DataIdentifier(self.broker, "sensors/a/temperature")
+        self.registry.onNewData(di, b"x")
+        self.assertEqual(1, len(self.deviceGuard.updateGuards))
+        self.assertTrue(self.reportCollector.reports[0].hasAlarmFailures())
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/temperature"), b"1")
+        self.assertEqual(1, len(self.deviceGuard.updateGuards))
+        self.assertFalse(self.reportCollector.reports[1].hasAlarmFailures())
+    def test_separateTopicState(self):
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/a/temperature"), b"x")
+        self.registry.onNewData(DataIdentifier(self.broker, "sensors/b/temperature"), b"1")
+        self.assertEqual(2, len(self.deviceGuard.updateGuards))
+        self.assertTrue(self.reportCollector.reports[-1].hasAlarmFailures())
+        self.assertEqual(1, len(list(self.reportCollector.reports[-1].getAlarmFailures())))
+
+class TestAggregateUpdateGuard(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.reportCollector = ReportCollector()
+        self.registry = DeviceRegistry(self.reportCollector)
+        self.filterDataIdentifier = DataIdentifier(self.broker, "#")
+        updateGuard = UpdateGuard("broker-rate", self.filterDataIdentifier)
+        updateGuard.addAlarm(RateAlarm.aggregated(2, 60))
+        self.deviceGuard = DeviceGuard()
+        self.deviceGuard.addUpdateGuard(updateGuard)
+        self.registry.addGuardedDevice("broker", self.deviceGuard)
+    def test_notInstantiated(self):
+        self.assertFalse(self.deviceGuard.updateGuards[0].isWildcard())
+        self.assertEqual([], self.deviceGuard.wildcardGuards)
+    def test_aggregatedRate(self):
+        for topic in ["a", "b", "c"]:
+            self.registry.onNewData(DataIdentifier(self.broker, topic), b"1")
+        self.assertEqual(1, len(self.deviceGuard.updateGuards))
+        self.assertFalse(self.reportCollector.reports[1].hasAlarmFailures())
+        failures = list(self.reportCollector.reports[2].getAlarmFailures())
+        self.assertEqual(self.filterDataIdentifier, failures[0][0])
+
+class TestReplaceGuardedDevice(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.reportCollector = ReportCollector()
+        self.registry = DeviceRegistry(self.reportCollector)
+        self.keptDataIdentifier = DataIdentifier(self.broker, "kept/topic")
+        self.changedDataIdentifier = DataIdentifier(self.broker, "changed/topic")
+        self.registry.addGuardedDevice("device", self.createDeviceGuard())
+        self.registry.onNewData(DataIdentifier(self.broker, "kept/topic"), b"x")
+        self.registry.onNewData(DataIdentifier(self.broker, "changed/topic"), b"x")
+    def createDeviceGuard(self):
+        deviceGuard = DeviceGuard()
+        for dataIdentifier in [self.keptDataIdentifier, self.changedDataIdentifier]:
+            updateGuard = UpdateGuard("guard", dataIdentifier)
+            updateGuard.addAlarm(NumericAlarm())
+            deviceGuard.addUpdateGuard(updateGuard)
+        return deviceGuard
+    def test_keepsUnchangedState(self):
+        keptGuard = self.registry.guardedDevices["device"].updateGuards[0]
+        self.registry.replaceGuardedDevice("device", self.createDeviceGuard(), {self.keptDataIdentifier}, True)
+        newGuard = self.registry.guardedDevices["device"]
+        self.assertIs(keptGuard, newGuard.updateGuards[0])
+        failures = list(self.registry.getReport("device").getAlarmFailures())
+        self.assertEqual(1, len(failures))
+        self.assertEqual(self.keptDataIdentifier, failures[0][0])
+    def test_removeGuardedDevice(self):
+        self.registry.removeGuardedDevice("device")
+        self.assertEqual({}, self.registry.getDeviceReports())
+        self.assertTrue(self.registry.topicTries[self.broker].isEmpty())
@@ -0,0 +1,128 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import threading
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.throttling import Notification, NotificationThrottle, RateLimiter, ThrottledReporter
+from mqguard.common import DeviceReport
+from mqguard.alarms import NumericAlarm
+
+class NotificationSink:
+    def __init__(self):
+        self.notifications = []
+        self.digests = []
+    def sendNotification(self, notification):
+        self.notifications.append(notification)
+    def sendDigest(self, notifications, dropped):
+        self.digests.append((notifications, dropped))
+
+class CollectingReporter(NotificationSink, ThrottledReporter):
+    def __init__(self, throttle):
+        ThrottledReporter.__init__(self, None, throttle)
+        NotificationSink.__init__(self)
+
+class TestRateLimiter(unittest.TestCase):
+    def test_refill(self):
+        limiter = RateLimiter(2, 10, 0)
+        for _ in range(2):
+            self.assertTrue(limiter.hasToken(0))
+            limiter.take()
+        self.assertFalse(limiter.hasToken(1))
+        self.assertTrue(limiter.hasToken(5))
+        self.assertFalse(limiter.isFull(5))
+        self.assertTrue(limiter.isFull(100))
+
+class TestNotificationThrottle(unittest.TestCase):
+    def setUp(self):
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        self.throttle = NotificationThrottle(deviceLimit = 2, globalLimit = 3, ratePeriod = 3600, digestInterval = 60)
+        self.sink = NotificationSink()
+    def createNotification(self, device, active, name = "alarm"):
+        return Notification(device, self.dataIdentifier, name, active, "message", 0)
+    def test_deduplication(self):
+        self.throttle.add(self.createNotification("device", True))
+        self.throttle.add(self.createNotification("device", True))
+        self.throttle.flush(self.sink, 0)
+        self.assertEqual(1, len(self.sink.notifications))
+    def test_returnToDeliveredState(self):
+        self.throttle.add(self.createNotification("device", True))
+        self.throttle.flush(self.sink, 0)
+        self.throttle.add(self.createNotification("device", False))
+        self.throttle.add(self.createNotification("device", True))
+        self.throttle.flush(self.sink, 1)
+        self.assertEqual(1, len(self.sink.notifications))
+    def test_deviceLimit(self):
+        for name in ("a", "b", "c"):
+            self.throttle.add(self.createNotification("device", True, name))
+        self.throttle.add(self.createNotification("other", True))
+        self.throttle.flush(self.sink, 0)
+        self.assertEqual(["a", "b", "alarm"], [n.name for n in self.sink.notifications])
+        self.assertEqual([], self.sink.digests)
+        self.assertEqual(60, self.throttle.getWaitTime(0))
+        self.throttle.flush(self.sink, 60)
+        self.assertEqual(1, len(self.sink.digests))
+        notifications, dropped = self.sink.digests[0]
+        self.assertEqual(["c"], [n.name for n in notifications])
+        self.assertIsNone(self.throttle.getWaitTime(60))
+    def test_globalLimit(self):
+        for device in range(5):
+            self.throttle.add(self.createNotification(device, True))
+        self.throttle.flush(self.sink, 0)
+        self.assertEqual(3, len(self.sink.notifications))
+        self.assertEqual(2, len(self.throttle.digest))
+    def test_digestReplaced(self):
+        for name in ("a", "b", "c"):
+            self.throttle.add(self.createNotification("device", True, name))
+        self.throttle.flush(self.sink, 0)
+        # Alarm recovered before digest, nobody was notified about it.
+        self.throttle.add(self.createNotification("device", False, "c"))
+        self.throttle.flush(self.sink, 60)
+        self.assertEqual([], self.sink.digests)
+
+class TestThrottledReporter(unittest.TestCase):
+    def test_report(self):
+        dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        alarm = NumericAlarm()
+        reporter = CollectingReporter(NotificationThrottle(digestInterval = 0))
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        reporter.report(DeviceReport("device", (None, (False, False, False, None)),
+            {dataIdentifier: {alarm: (True, True, True, "Not a number")}}))
+        reporter.report(DeviceReport("device", (None, (False, False, False, None)),
+            {dataIdentifier: {alarm: (True, False, True, "Not a number")}}))
+        reporter.stop()
+        thread.join()
+        self.assertEqual(1, len(reporter.notifications))
+        self.assertEqual("Not a number", reporter.notifications[0].message)
+    def test_removeDeviceWhenFull(self):
+        dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        reporter = CollectingReporter(NotificationThrottle(digestInterval = 0))
+        reporter.throttle.delivered[("device", dataIdentifier, "NumericAlarm")] = True
+        reporter.queue.maxSize = 1
+        reporter.report(DeviceReport("device", (None, (False, False, False, None)),
+            {dataIdentifier: {NumericAlarm(): (True, True, True, "Not a number")}}))
+        reporter.removeDevice("device")
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        reporter.stop()
+        thread.join()
+        self.assertEqual([], reporter.notifications)
+        self.assertEqual([], reporter.digests)
+        self.assertEqual({}, reporter.throttle.delivered)
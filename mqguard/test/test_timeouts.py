@@ -0,0 +1,127 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.alarms import BaseAlarm, TimeoutAlarm, AlarmType, AlarmPriority
+from mqguard.supervising import DeviceGuard, UpdateGuard, DeviceRegistry
+from mqguard.timeouts import TimeoutTable, NumpyTimeoutTable, isNumpyAvailable
+from mqguard.test.stubs import ReportCollector
+
+class BaseTestTimeoutTable:
+    def setUp(self):
+        self.table = self.createTable()
+        self.alarms = [TimeoutAlarm.fromSeconds(10) for i in range(3)]
+        for i, alarm in enumerate(self.alarms):
+            self.table.register(alarm, i, 10, 0)
+    def test_noChange(self):
+        self.assertEqual(([], []), self.table.check(5))
+    def test_expired(self):
+        self.table.touch(self.alarms[1].timeoutSlot, 5)
+        self.assertEqual(([(0, 11), (2, 11)], []), self.table.check(11))
+        self.assertEqual(([], []), self.table.check(12))
+    def test_recovered(self):
+        self.table.check(11)
+        self.table.touch(self.alarms[0].timeoutSlot, 12)
+        self.assertEqual(([], [0]), self.table.check(13))
+    def test_release(self):
+        self.table.release(self.alarms[0])
+        self.assertIsNone(self.alarms[0].timeoutTable)
+        self.assertEqual([1, 2], [owner for owner, _ in self.table.check(11)[0]])
+        alarm = TimeoutAlarm.fromSeconds(10)
+        self.table.register(alarm, 3, 10, 11)
+        self.assertEqual(0, alarm.timeoutSlot)
+        self.assertEqual(3, len(self.table))
+    def test_registerTwice(self):
+        self.table.register(self.alarms[0], "owner", 10, 100)
+        self.assertEqual(3, len(self.table))
+        self.assertEqual(["owner", 1, 2], [owner for owner, _ in self.table.check(11)[0]])
+
+    def test_registerExpired(self):
+        alarm = TimeoutAlarm.fromSeconds(10)
+        self.table.register(alarm, 3, 10, 0, True)
+        self.assertEqual(([], []), self.table.check(5))
+        self.table.touch(alarm.timeoutSlot, 6)
+        self.assertEqual(([], [3]), self.table.check(7))
+
+class TestTimeoutTable(BaseTestTimeoutTable, unittest.TestCase):
+    def createTable(self):
+        return TimeoutTable()
+
+@unittest.skipUnless(isNumpyAvailable(), "NumPy is not installed")
+class TestNumpyTimeoutTable(BaseTestTimeoutTable, unittest.TestCase):
+    def createTable(self):
+        return NumpyTimeoutTable(2)
+
+class StaleAlarm(BaseAlarm):
+    def __init__(self):
+        BaseAlarm.__init__(self, AlarmType.periodic, AlarmPriority.other)
+        self.checked = 0
+    def checkPeriodic(self):
+        self.checked += 1
+        return True, "stale"
+
+class TestRegistryTimeoutTable(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker("test-broker", "localhost", 1883)
+        self.reportCollector = ReportCollector()
+        self.registry = DeviceRegistry(self.reportCollector)
+        self.table = TimeoutTable()
+        self.registry.setTimeoutTable(self.table)
+        for device in ["a", "b"]:
+            self.registry.addGuardedDevice(device, self.createDeviceGuard(device))
+    def createDeviceGuard(self, device):
+        updateGuard = UpdateGuard("guard", DataIdentifier(self.broker, "{}/topic".format(device)))
+        updateGuard.addAlarm(TimeoutAlarm.fromSeconds(10))
+        deviceGuard = DeviceGuard()
+        deviceGuard.addUpdateGuard(updateGuard)
+        return deviceGuard
+    def test_onlyChangedDevices(self):
+        self.table.lastSeen[0] -= 20
+        self.registry.onPeriodic()
+        self.assertEqual(["a"], [report.device for report in self.reportCollector.reports])
+        self.assertTrue(self.reportCollector.reports[0].hasAlarmFailures())
+        self.registry.onNewData(DataIdentifier(self.broker, "a/topic"), b"1")
+        self.registry.onPeriodic()
+        self.assertFalse(self.reportCollector.reports[-1].hasAlarmFailures())
+    def test_removeDevice(self):
+        self.registry.removeGuardedDevice("a")
+        self.assertEqual(1, len(self.table))
+    def test_replaceKeepsSlot(self):
+        alarm = next(iter(self.registry.guardedDevices["a"].updateGuards[0].getAlarms()))
+        dataIdentifier = DataIdentifier(self.broker, "a/topic")
+        self.registry.replaceGuardedDevice("a", self.createDeviceGuard("a"), {dataIdentifier}, True)
+        self.assertIs(self.table, alarm.timeoutTable)
+        self.assertEqual(2, len(self.table))
+    def test_otherPeriodicAlarms(self):
+        staleAlarm = StaleAlarm()
+        deviceGuard = self.createDeviceGuard("c")
+        deviceGuard.updateGuards[0].addAlarm(staleAlarm)
+        self.assertEqual(set(), self.registry.periodicDevices)
+        self.registry.addGuardedDevice("c", deviceGuard)
+        self.assertEqual({"c"}, self.registry.periodicDevices)
+        self.registry.onPeriodic()
+        self.assertEqual(1, staleAlarm.checked)
+        self.assertEqual(["c"], [report.device for report in self.reportCollector.reports])
+        alarms = self.registry.alarmMapping["c"][DataIdentifier(self.broker, "c/topic")]
+        self.assertTrue(alarms[staleAlarm][0])
+        timeoutAlarm = next(alarm for alarm in alarms if isinstance(alarm, TimeoutAlarm))
+        self.assertFalse(alarms[timeoutAlarm][0])
+        self.registry.removeGuardedDevice("c")
+        self.assertEqual(set(), self.registry.periodicDevices)
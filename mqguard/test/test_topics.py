@@ -0,0 +1,70 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mqguard.topics import *
+
+class TestTopicFilter(unittest.TestCase):
+    def test_isWildcard(self):
+        self.assertTrue(isWildcardTopic("a/+/c"))
+        self.assertTrue(isWildcardTopic("a/#"))
+        self.assertFalse(isWildcardTopic("a/b/c"))
+    def test_validFilters(self):
+        for topicFilter in ["a/b", "a/+/c", "+", "#", "a/#", "+/+/#"]:
+            self.assertTrue(isValidTopicFilter(topicFilter), topicFilter)
+    def test_invalidFilters(self):
+        for topicFilter in ["", "a/#/c", "a/b#", "a+/b", "a/++"]:
+            self.assertFalse(isValidTopicFilter(topicFilter), topicFilter)
+    def test_topicMatches(self):
+        self.assertTrue(topicMatches("a/+/c", "a/b/c"))
+        self.assertTrue(topicMatches("a/#", "a"))
+        self.assertTrue(topicMatches("a/#", "a/b/c"))
+        self.assertFalse(topicMatches("a/+", "a/b/c"))
+        self.assertFalse(topicMatches("a/+/c", "a/b"))
+        self.assertFalse(topicMatches("#", "$SYS/uptime"))
+    def test_wildcardLevels(self):
+        self.assertEqual(["hsp", "hq"], getWildcardLevels("presence/+/+", "presence/hsp/hq"))
+        self.assertEqual(["b/c"], getWildcardLevels("a/#", "a/b/c"))
+        self.assertIsNone(getWildcardLevels("presence/+", "status/hsp"))
+
+class TestTopicTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = TopicTrie()
+        self.trie.add("a/b/c", "exact")
+        self.trie.add("a/+/c", "single")
+        self.trie.add("a/#", "multi")
+        self.trie.add("#", "all")
+    def test_exactMatch(self):
+        self.assertEqual({"exact", "single", "multi", "all"}, set(self.trie.match("a/b/c")))
+    def test_singleLevel(self):
+        self.assertEqual({"single", "multi", "all"}, set(self.trie.match("a/x/c")))
+    def test_multiLevelParent(self):
+        self.assertEqual({"multi", "all"}, set(self.trie.match("a")))
+    def test_noMatch(self):
+        self.assertEqual(["all"], self.trie.match("b/c"))
+    def test_systemTopic(self):
+        self.trie.add("$SYS/#", "sys")
+        self.assertEqual(["sys"], self.trie.match("$SYS/uptime"))
+    def test_remove(self):
+        self.assertTrue(self.trie.remove("a/+/c", "single"))
+        self.assertFalse(self.trie.remove("a/+/c", "single"))
+        self.assertEqual({"exact", "multi", "all"}, set(self.trie.match("a/b/c")))
+    def test_removePrunesNodes(self):
+        trie = TopicTrie()
+        trie.add("x/y/z", 1)
+        trie.remove("x/y/z", 1)
+        self.assertTrue(trie.isEmpty())
@@ -0,0 +1,91 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.triggerreporting import CommandPool, TriggerReporter
+from mqguard.throttling import NotificationThrottle
+from mqguard.common import DeviceReport
+from mqguard.alarms import NumericAlarm
+
+WRITE_SCRIPT = """
+import json, os, sys
+with open(sys.argv[1], "a") as f:
+    f.write(json.dumps({"env": os.environ.get("MQGUARD_ALARM"), "stdin": json.load(sys.stdin)}) + "\\n")
+"""
+
+class TestCommandPool(unittest.TestCase):
+    def test_timeout(self):
+        pool = CommandPool(1, 10, 0.2)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertFalse(pool.runCommand([sys.executable, "-c", "import time; time.sleep(5)"], {}, b""))
+        self.assertEqual(1, pool.failed)
+    def test_missingCommand(self):
+        pool = CommandPool(1, 10, 1)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertFalse(pool.runCommand(["/nonexistent/command"], {}, b""))
+    def test_nulInEnvironment(self):
+        pool = CommandPool(1, 10, 5)
+        script = "import os, sys; sys.exit(os.environ['MQGUARD_MESSAGE'] != 'ab')"
+        self.assertTrue(pool.runCommand([sys.executable, "-c", script], {"MQGUARD_MESSAGE": "a\0b"}, b""))
+    def test_workerSurvivesFailure(self):
+        pool = CommandPool(1, 10, 5)
+        pool.start()
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            pool.submit([sys.executable, "-c", "pass"], {"MQGUARD\0NAME": "x"}, b"")
+            pool.submit([sys.executable, "-c", "pass"], {}, b"")
+            pool.stop()
+        self.assertEqual(1, pool.failed)
+        self.assertEqual(1, stderr.getvalue().count("failed"))
+    def test_boundedQueue(self):
+        pool = CommandPool(1, 2, 1)
+        self.assertTrue(pool.submit(["true"], {}, b""))
+        self.assertTrue(pool.submit(["true"], {}, b""))
+        self.assertFalse(pool.submit(["true"], {}, b""))
+
+class TestTriggerReporter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "output")
+    def tearDown(self):
+        self.directory.cleanup()
+    def test_command(self):
+        dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        alarm = NumericAlarm()
+        reporter = TriggerReporter(None, NotificationThrottle(), [sys.executable, "-c", WRITE_SCRIPT, self.output],
+            CommandPool(2, 10, 10))
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        reporter.report(DeviceReport("device", (None, (False, False, False, None)),
+            {dataIdentifier: {alarm: (True, True, True, "Not a number")}}))
+        reporter.stop()
+        thread.join()
+        with open(self.output) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(1, len(lines))
+        self.assertEqual(alarm.getName(), lines[0]["env"])
+        self.assertEqual("test/topic", lines[0]["stdin"]["topic"])
+        self.assertEqual("Not a number", lines[0]["stdin"]["message"])
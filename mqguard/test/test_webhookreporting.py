@@ -0,0 +1,233 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import contextlib
+import http.server
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+from mqreceive.data import DataIdentifier
+from mqreceive.broker import Broker
+
+from mqguard.webhookreporting import WebhookReporter, WebhookConnection, Spool, MemorySpool
+from mqguard.formatting import JSONFormatter
+from mqguard.common import DeviceReport
+from mqguard.alarms import NumericAlarm
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.bodies.append(json.loads(body))
+        status = self.server.status
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    def log_message(self, format, *args):
+        pass
+
+class WebhookEndpoint(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    def __init__(self):
+        http.server.ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), WebhookHandler)
+        self.connections = 0
+        self.bodies = []
+        self.status = 200
+
+def openSpool(directory, maxSize):
+    spool = Spool(directory, maxSize)
+    spool.open()
+    return spool
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+    def tearDown(self):
+        self.directory.cleanup()
+    def test_order(self):
+        spool = openSpool(self.directory.name, 1000)
+        spool.push(b"1")
+        spool.push(b"2")
+        name, body = spool.claim()
+        self.assertEqual(b"1", body)
+        self.assertEqual(b"2", spool.claim()[1])
+        self.assertIsNone(spool.claim())
+        spool.release(name, True)
+        self.assertEqual(1, len(spool))
+    def test_restart(self):
+        openSpool(self.directory.name, 1000).push(b"1")
+        spool = openSpool(self.directory.name, 1000)
+        spool.push(b"2")
+        self.assertEqual(b"1", spool.claim()[1])
+    def test_size(self):
+        spool = openSpool(self.directory.name, 10)
+        for i in range(4):
+            spool.push(b"1234")
+        self.assertEqual(2, len(spool))
+        self.assertEqual(2, spool.takeDropped())
+
+    def test_foreignFiles(self):
+        with open(os.path.join(self.directory.name, "notes.json"), "w") as f:
+            f.write("{}")
+        spool = openSpool(self.directory.name, 1000)
+        self.assertEqual(0, len(spool))
+        spool.push(b"1")
+        self.assertEqual(b"1", spool.claim()[1])
+    def test_removedFile(self):
+        spool = openSpool(self.directory.name, 1000)
+        spool.push(b"1")
+        spool.push(b"2")
+        name, body = spool.claim()
+        for fileName in os.listdir(self.directory.name):
+            os.remove(os.path.join(self.directory.name, fileName))
+        spool.release(name, True)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertIsNone(spool.claim())
+        self.assertEqual(0, len(spool))
+        self.assertEqual(1, spool.takeDropped())
+    def test_unwritableDirectory(self):
+        spool = openSpool(os.path.join(self.directory.name, "spool"), 1000)
+        spool.push(b"1")
+        os.rename(spool.directory, spool.directory + ".moved")
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            spool.push(b"2")
+        self.assertIn("kept in memory", stderr.getvalue())
+        self.assertEqual(2, len(spool))
+        name, body = spool.claim()
+        self.assertEqual(b"2", body)
+        spool.release(name, True)
+        self.assertEqual(0, len(spool.fallback))
+
+class TestMemorySpool(unittest.TestCase):
+    def test_retryOrder(self):
+        spool = MemorySpool(10)
+        spool.push(b"1")
+        spool.push(b"2")
+        name, body = spool.claim()
+        spool.release(name, False)
+        self.assertEqual(b"1", spool.claim()[1])
+    def test_size(self):
+        spool = MemorySpool(2)
+        for body in (b"1", b"2", b"3"):
+            spool.push(body)
+        self.assertEqual(2, len(spool))
+        self.assertEqual(1, spool.takeDropped())
+        self.assertEqual(b"2", spool.claim()[1])
+
+class TestWebhookReporter(unittest.TestCase):
+    def setUp(self):
+        self.endpoint = WebhookEndpoint()
+        threading.Thread(target = self.endpoint.serve_forever).start()
+        self.url = "http://127.0.0.1:{}/hook".format(self.endpoint.server_address[1])
+        self.directory = tempfile.TemporaryDirectory()
+        self.dataIdentifier = DataIdentifier(Broker("test-broker", "localhost", 1883), "test/topic")
+        self.alarm = NumericAlarm()
+    def tearDown(self):
+        self.endpoint.shutdown()
+        self.endpoint.server_close()
+        self.directory.cleanup()
+    def createReport(self, device):
+        return DeviceReport(device, (None, (False, False, False, None)),
+            {self.dataIdentifier: {self.alarm: (True, True, True, "Not a number")}})
+    def test_keepAlive(self):
+        reporter = WebhookReporter(None, JSONFormatter(None), [WebhookConnection(self.url)])
+        for i in range(20):
+            reporter.deliver(reporter.connections[0], JSONFormatter(None).formatDeviceReports(
+                [self.createReport("device{}".format(i))]).encode())
+        reporter.connections[0].close()
+        self.assertEqual(20, len(self.endpoint.bodies))
+        self.assertEqual(1, self.endpoint.connections)
+        self.assertEqual("device0", self.endpoint.bodies[0]["devices"][0]["name"])
+    def test_batches(self):
+        reporter = WebhookReporter(None, JSONFormatter(None), [WebhookConnection(self.url)], batchSize = 10)
+        for i in range(25):
+            reporter.report(self.createReport("device{}".format(i)))
+        thread = threading.Thread(target = reporter)
+        thread.start()
+        reporter.stop()
+        thread.join()
+        self.assertEqual([10, 10, 5], [len(body["devices"]) for body in self.endpoint.bodies])
+    def test_spool(self):
+        spool = openSpool(self.directory.name, 1000000)
+        reporter = WebhookReporter(None, JSONFormatter(None), [WebhookConnection(self.url)], spool)
+        body = JSONFormatter(None).formatDeviceReports([self.createReport("device")]).encode()
+        self.endpoint.status = 503
+        with contextlib.redirect_stderr(io.StringIO()):
+            reporter.addBody(body)
+            self.assertFalse(reporter.deliver(reporter.connections[0], reporter.outbox.getBatch(1)[0]))
+        reporter.spool.push(body)
+        self.assertIsNotNone(reporter.retryTime)
+        # Body posted during backoff goes directly to spool.
+        reporter.addBody(body)
+        self.assertEqual(2, len(spool))
+        self.endpoint.status = 200
+        reporter.retryTime = None
+        sender = threading.Thread(target = reporter.runSender, args = (reporter.connections[0],))
+        sender.start()
+        for _ in range(100):
+            if len(spool) == 0:
+                break
+            time.sleep(0.05)
+        reporter.outbox.close()
+        sender.join()
+        self.assertEqual(0, len(spool))
+        self.assertEqual(3, len(self.endpoint.bodies))
+    def test_retryWithoutSpool(self):
+        reporter = WebhookReporter(None, JSONFormatter(None), [WebhookConnection(self.url)])
+        body = JSONFormatter(None).formatDeviceReports([self.createReport("device")]).encode()
+        self.endpoint.status = 503
+        sender = threading.Thread(target = reporter.runSender, args = (reporter.connections[0],))
+        with contextlib.redirect_stderr(io.StringIO()):
+            reporter.addBody(body)
+            sender.start()
+            for _ in range(100):
+                if reporter.retryTime is not None:
+                    break
+                time.sleep(0.05)
+            # Batch produced during backoff waits in memory as well.
+            reporter.addBody(body)
+            self.endpoint.status = 200
+            reporter.retryTime = None
+            for _ in range(100):
+                if len(reporter.spool) == 0:
+                    break
+                time.sleep(0.05)
+        reporter.outbox.close()
+        sender.join()
+        self.assertEqual(0, len(reporter.spool))
+        self.assertEqual(3, len(self.endpoint.bodies))
+    def test_unusableSpoolDirectory(self):
+        path = os.path.join(self.directory.name, "file")
+        open(path, "w").close()
+        reporter = WebhookReporter(None, JSONFormatter(None), [WebhookConnection(self.url)],
+            Spool(os.path.join(path, "spool"), 1000))
+        reporter.report(self.createReport("device"))
+        thread = threading.Thread(target = reporter)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            thread.start()
+            reporter.stop()
+            thread.join()
+        self.assertIn("kept in memory", stderr.getvalue())
+        self.assertIsInstance(reporter.spool, MemorySpool)
+        self.assertEqual(1, len(self.endpoint.bodies))
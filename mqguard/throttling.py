@@ -0,0 +1,391 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Notification throttling for expensive reporters (mail, SMS, scripts).
+"""
+
+import collections
+import time
+
+from mqguard.reporting import BaseReporter, BatchQueue
+
+class Notification:
+    """!
+    Single alarm or presence transition.
+    """
+
+    __slots__ = ("device", "dataIdentifier", "name", "active", "message", "time")
+
+    def __init__(self, device, dataIdentifier, name, active, message, time):
+        """!
+        Initiate notification.
+
+        @param device Device identifier.
+        @param dataIdentifier DataIdentifier object.
+        @param name Alarm name, 'Presence' for presence transitions.
+        @param active Is alarm active flag.
+        @param message Alarm message.
+        @param time UNIX time of transition.
+        """
+        self.device = device
+        self.dataIdentifier = dataIdentifier
+        self.name = name
+        self.active = active
+        self.message = message
+        self.time = time
+
+    @classmethod
+    def fromReport(cls, deviceReport, now):
+        """!
+        Create notifications of all transitions of device report.
+
+        @param deviceReport DeviceReport object.
+        @param now Current UNIX time.
+        @return List of Notification objects.
+        """
+        notifications = []
+        for dataIdentifier, alarm, report in deviceReport.getAlarmChanges():
+            active, _, _, message = report
+            notifications.append(cls(deviceReport.device, dataIdentifier, alarm.getName(), active, message, now))
+        if deviceReport.hasPresenceChange():
+            devicePresence, track = deviceReport.getPresence()
+            active, _, _, message = track
+            notifications.append(cls(deviceReport.device, devicePresence.getDataIdentifier(),
+                "Presence", active, message, now))
+        return notifications
+
+    def getKey(self):
+        """!
+        Get identity of transitioning alarm.
+
+        @return Hashable tuple.
+        """
+        return self.device, self.dataIdentifier, self.name
+
+class RateLimiter:
+    """!
+    Token bucket allowing given number of events per period. Tokens are refilled
+    continuously, so full bucket allows burst of whole limit.
+    """
+
+    __slots__ = ("limit", "period", "tokens", "lastTime")
+
+    def __init__(self, limit, period, now):
+        """!
+        Initiate full bucket.
+
+        @param limit Maximum number of events per period.
+        @param period Period in seconds.
+        @param now Current monotonic time in seconds.
+        """
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.lastTime = now
+
+    def refill(self, now):
+        """!
+        Add tokens accumulated since last refill.
+
+        @param now Current monotonic time in seconds.
+        """
+        self.tokens = min(self.limit, self.tokens + (now - self.lastTime) * self.limit / self.period)
+        self.lastTime = now
+
+    def hasToken(self, now):
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def isFull(self, now):
+        self.refill(now)
+        return self.tokens >= self.limit
+
+class NotificationThrottle:
+    """!
+    Deduplicate and rate limit notifications. Notifications are collected between
+    flushes and only latest transition of every alarm is kept. Transition returning
+    alarm into already delivered state is dropped. Notifications within device and
+    global rate limits are sent one by one, others are grouped into digest sent at
+    most once per digest interval.
+
+    Throttle isn't thread safe, it is used by single reporter thread.
+    """
+
+    ## @var deviceLimit
+    # Maximum number of notifications of single device per rate period. Zero disables limit.
+
+    ## @var globalLimit
+    # Maximum number of all notifications per rate period. Zero disables limit.
+
+    ## @var ratePeriod
+    # Rate limit period in seconds.
+
+    ## @var digestInterval
+    # Minimal interval between two digests in seconds.
+
+    ## @var pending
+    # Ordered mapping notification key : Notification waiting for flush.
+
+    ## @var digest
+    # Ordered mapping notification key : Notification waiting for digest.
+
+    ## @var delivered
+    # Mapping notification key : last delivered alarm state, or state before first
+    # transition if nothing was delivered yet.
+
+    def __init__(self, deviceLimit = 10, globalLimit = 100, ratePeriod = 3600, digestInterval = 300):
+        """!
+        Initiate throttle.
+
+        @param deviceLimit Maximum number of notifications of single device per rate period.
+        @param globalLimit Maximum number of all notifications per rate period.
+        @param ratePeriod Rate limit period in seconds.
+        @param digestInterval Minimal interval between two digests in seconds.
+        """
+        self.deviceLimit = deviceLimit
+        self.globalLimit = globalLimit
+        self.ratePeriod = ratePeriod
+        self.digestInterval = digestInterval
+        self.pending = collections.OrderedDict()
+        self.digest = collections.OrderedDict()
+        self.delivered = {}
+        self.deviceLimiters = {}
+        self.globalLimiter = None
+        self.lastDigestTime = None
+        self.dropped = 0
+
+    def add(self, notification):
+        """!
+        Add notification. Pending notification of the same alarm is replaced.
+
+        @param notification Notification object.
+        """
+        key = notification.getKey()
+        # Alarm was in opposite state before its first transition.
+        self.delivered.setdefault(key, not notification.active)
+        self.pending.pop(key, None)
+        self.pending[key] = notification
+
+    def addDropped(self, dropped):
+        """!
+        Count notifications lost before reaching throttle. Number is part of next digest.
+
+        @param dropped Number of lost notifications.
+        """
+        self.dropped += dropped
+
+    def flush(self, sink, now):
+        """!
+        Send pending notifications and digest if its interval elapsed.
+
+        @param sink Object with methods sendNotification(notification) and
+            sendDigest(notifications, dropped).
+        @param now Current monotonic time in seconds.
+        """
+        if self.lastDigestTime is None:
+            self.lastDigestTime = now
+        pending = self.pending
+        self.pending = collections.OrderedDict()
+        for key, notification in pending.items():
+            self.digest.pop(key, None)
+            if self.delivered.get(key) == notification.active:
+                # Alarm returned into delivered state before anybody was notified.
+                continue
+            if self.acquire(notification.device, now):
+                self.delivered[key] = notification.active
+                sink.sendNotification(notification)
+            else:
+                self.digest[key] = notification
+        if now - self.lastDigestTime >= self.digestInterval:
+            self.lastDigestTime = now
+            if len(self.digest) > 0 or self.dropped > 0:
+                notifications = list(self.digest.values())
+                for key, notification in self.digest.items():
+                    self.delivered[key] = notification.active
+                sink.sendDigest(notifications, self.dropped)
+                self.digest.clear()
+                self.dropped = 0
+            self.removeIdleLimiters(now)
+
+    def acquire(self, device, now):
+        """!
+        Take token of device and global rate limiter.
+
+        @param device Device identifier.
+        @param now Current monotonic time in seconds.
+        @return True if notification may be sent, False if some limit is reached.
+        """
+        deviceLimiter = None
+        if self.deviceLimit > 0:
+            deviceLimiter = self.deviceLimiters.get(device)
+            if deviceLimiter is None:
+                deviceLimiter = RateLimiter(self.deviceLimit, self.ratePeriod, now)
+                self.deviceLimiters[device] = deviceLimiter
+            if not deviceLimiter.hasToken(now):
+                return False
+        if self.globalLimit > 0:
+            if self.globalLimiter is None:
+                self.globalLimiter = RateLimiter(self.globalLimit, self.ratePeriod, now)
+            if not self.globalLimiter.hasToken(now):
+                return False
+            self.globalLimiter.take()
+        if deviceLimiter is not None:
+            deviceLimiter.take()
+        return True
+
+    def removeIdleLimiters(self, now):
+        """!
+        Forget limiters of devices which didn't send anything for whole period.
+
+        @param now Current monotonic time in seconds.
+        """
+        for device in [d for d, limiter in self.deviceLimiters.items() if limiter.isFull(now)]:
+            del self.deviceLimiters[device]
+
+    def forgetDevice(self, device):
+        """!
+        Forget all state of removed device. Its pending and throttled notifications
+        aren't sent.
+
+        @param device Device identifier.
+        """
+        for mapping in (self.pending, self.digest, self.delivered):
+            for key in [k for k in mapping if k[0] == device]:
+                del mapping[key]
+        self.deviceLimiters.pop(device, None)
+
+    def getWaitTime(self, now):
+        """!
+        Get time to next digest.
+
+        @param now Current monotonic time in seconds.
+        @return Seconds to next digest, or None if nothing waits for digest.
+        """
+        if len(self.digest) == 0 and self.dropped == 0:
+            return None
+        return max(0, self.lastDigestTime + self.digestInterval - now)
+
+class ThrottledReporter(BaseReporter):
+    """!
+    Base class of reporters whose notifications are expensive. Transitions are
+    taken from device reports on reporting thread and queued, so evaluation is
+    never blocked. Reporter thread passes them through NotificationThrottle and
+    calls sendNotification() and sendDigest() of implementation.
+    """
+
+    ## @var throttle
+    # NotificationThrottle object.
+
+    ## @var queue
+    # BatchQueue of notifications waiting for throttle.
+
+    def __init__(self, synchronizer, throttle, queueSize = 10000, batchSize = 1000):
+        """!
+        Initialize throttled reporter.
+
+        @param synchronizer Synchronizing object.
+        @param throttle NotificationThrottle object.
+        @param queueSize Maximum number of queued notifications.
+        @param batchSize Maximum number of notifications taken from queue at once.
+        """
+        BaseReporter.__init__(self, synchronizer)
+        self.throttle = throttle
+        self.queue = BatchQueue(queueSize)
+        self.batchSize = batchSize
+
+    def report(self, deviceReport):
+        """!
+        @copydoc BaseReporter::report()
+        """
+        if not deviceReport.hasChanges():
+            return
+        for notification in Notification.fromReport(deviceReport, time.time()):
+            self.queue.put(notification)
+
+    def removeDevice(self, device):
+        """!
+        @copydoc BaseReporter::removeDevice()
+        """
+        # Removal keeps its order among notifications and is never dropped, so
+        # throttle state of removed device doesn't stay forever.
+        self.queue.put(device, force = True)
+
+    def __call__(self):
+        """!
+        Run throttle until reporter is stopped. Notifications queued before stop are
+        flushed, waiting digest is sent.
+        """
+        self.running = True
+        try:
+            while not self.queue.isDrained():
+                batch = self.queue.getBatch(self.batchSize, self.getWaitTime(time.monotonic()))
+                for item in batch:
+                    if isinstance(item, Notification):
+                        self.throttle.add(item)
+                    else:
+                        self.throttle.forgetDevice(item)
+                self.throttle.addDropped(self.queue.takeDropped())
+                now = time.monotonic()
+                self.throttle.flush(self, now)
+                self.onFlush(now, False)
+            self.throttle.digestInterval = 0
+            now = time.monotonic()
+            self.throttle.flush(self, now)
+            self.onFlush(now, True)
+        finally:
+            self.running = False
+
+    def stop(self):
+        """!
+        Stop reporter thread.
+        """
+        self.queue.close()
+
+    def getWaitTime(self, now):
+        """!
+        Get maximum time reporter thread waits for new notifications.
+
+        @param now Current monotonic time in seconds.
+        @return Seconds, or None to wait until some notification is queued.
+        """
+        return self.throttle.getWaitTime(now)
+
+    def onFlush(self, now, final):
+        """!
+        Called on reporter thread after every throttle flush. Implementations
+        buffering notifications send them here.
+
+        @param now Current monotonic time in seconds.
+        @param final Reporter is stopping, nothing should stay buffered.
+        """
+
+    def sendNotification(self, notification):
+        """!
+        Send single notification. Called on reporter thread.
+
+        @param notification Notification object.
+        """
+
+    def sendDigest(self, notifications, dropped):
+        """!
+        Send digest of throttled notifications. Called on reporter thread.
+
+        @param notifications List of Notification objects.
+        @param dropped Number of notifications dropped because queue was full.
+        """
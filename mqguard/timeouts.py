@@ -0,0 +1,212 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Columnar table of update timeouts.
+"""
+
+import array
+import importlib.util
+import math
+
+# NumPy is imported only when NumPy table is created, so startup doesn't pay for
+# it otherwise.
+numpy = None
+
+class TimeoutTable:
+    """!
+    Table of timeout alarms stored in columns, one row (slot) per alarm. Periodic check
+    compares all rows at once and returns only alarms which expired or recovered
+    since the last check.
+
+    This implementation stores columns in standard arrays. NumpyTimeoutTable
+    evaluates the columns by vectorized comparison.
+    """
+
+    ## @var lastSeen
+    # Column of monotonic times of last message.
+
+    ## @var periods
+    # Column of timeout periods in seconds. Free slots have infinite period.
+
+    ## @var expired
+    # Column of expiration flags reported by the last check.
+
+    ## @var owners
+    # List of slot owners. Owner is returned by check() for changed slots.
+
+    ## @var freeSlots
+    # List of released slots.
+
+    def __init__(self):
+        self.lastSeen = array.array("d")
+        self.periods = array.array("d")
+        self.expired = bytearray()
+        self.owners = []
+        self.freeSlots = []
+
+    def register(self, alarm, owner, period, now, expired = False):
+        """!
+        Add timeout alarm into table. Alarm already registered in the table keeps
+        its slot and state, only its owner is replaced.
+
+        @param alarm TimeoutAlarm object.
+        @param owner Object returned by check() for the alarm.
+        @param period Timeout period in seconds.
+        @param now Current monotonic time.
+        @param expired Initial expiration flag, e.g. of alarm restored as active.
+            Expired alarm recovers by next message.
+        """
+        if alarm.timeoutTable is self:
+            self.owners[alarm.timeoutSlot] = owner
+            return
+        if len(self.freeSlots) > 0:
+            slot = self.freeSlots.pop()
+            self.owners[slot] = owner
+        else:
+            slot = len(self.owners)
+            self.owners.append(owner)
+            self.grow(slot + 1)
+        # Expired alarm stays overdue until message is received.
+        self.lastSeen[slot] = -math.inf if expired else now
+        self.periods[slot] = period
+        self.expired[slot] = expired
+        alarm.attachTable(self, slot)
+
+    def release(self, alarm):
+        """!
+        Remove alarm from table. Its slot is reused by next registered alarm.
+
+        @param alarm TimeoutAlarm object.
+        """
+        if alarm.timeoutTable is not self:
+            return
+        slot = alarm.timeoutSlot
+        self.periods[slot] = math.inf
+        self.expired[slot] = False
+        self.owners[slot] = None
+        self.freeSlots.append(slot)
+        alarm.attachTable(None, None)
+
+    def touch(self, slot, now):
+        """!
+        Notify message of slot alarm.
+
+        @param slot Slot number.
+        @param now Current monotonic time.
+        """
+        self.lastSeen[slot] = now
+
+    def grow(self, size):
+        """!
+        Make columns at least given size long.
+
+        @param size Minimal number of rows.
+        """
+        while len(self.periods) < size:
+            self.lastSeen.append(0.0)
+            self.periods.append(math.inf)
+            self.expired.append(False)
+
+    def check(self, now):
+        """!
+        Find alarms which changed state since last check.
+
+        @param now Current monotonic time.
+        @return Tuple (expired, recovered).
+            @li expired List of tuples (owner, elapsed seconds) of newly expired alarms.
+            @li recovered List of owners of newly recovered alarms.
+        """
+        expired = []
+        recovered = []
+        lastSeen, periods, flags = self.lastSeen, self.periods, self.expired
+        for slot in range(len(flags)):
+            elapsed = now - lastSeen[slot]
+            overdue = elapsed > periods[slot]
+            if overdue != flags[slot]:
+                flags[slot] = overdue
+                if overdue:
+                    expired.append((self.owners[slot], elapsed))
+                else:
+                    recovered.append(self.owners[slot])
+        return expired, recovered
+
+    def __len__(self):
+        return len(self.owners) - len(self.freeSlots)
+
+class NumpyTimeoutTable(TimeoutTable):
+    """!
+    Timeout table with NumPy columns. Columns are preallocated and doubled when full.
+    """
+
+    def __init__(self, capacity = 1024):
+        """!
+        Initiate table. NumPy is imported by first NumPy table.
+
+        @param capacity Initial number of slots.
+        @throws ImportError If NumPy isn't installed.
+        """
+        global numpy
+        if numpy is None:
+            import numpy
+        TimeoutTable.__init__(self)
+        self.lastSeen = numpy.zeros(capacity)
+        self.periods = numpy.full(capacity, math.inf)
+        self.expired = numpy.zeros(capacity, dtype = bool)
+
+    def grow(self, size):
+        capacity = len(self.periods)
+        if size > capacity:
+            while capacity < size:
+                capacity *= 2
+            self.lastSeen = numpy.concatenate((self.lastSeen, numpy.zeros(capacity - len(self.lastSeen))))
+            self.periods = numpy.concatenate((self.periods, numpy.full(capacity - len(self.periods), math.inf)))
+            self.expired = numpy.concatenate((self.expired, numpy.zeros(capacity - len(self.expired), dtype = bool)))
+
+    def check(self, now):
+        elapsed = now - self.lastSeen
+        overdue = elapsed > self.periods
+        changed = numpy.flatnonzero(overdue != self.expired)
+        if len(changed) == 0:
+            return [], []
+        self.expired[changed] = overdue[changed]
+        expired = []
+        recovered = []
+        for slot in changed.tolist():
+            if overdue[slot]:
+                expired.append((self.owners[slot], float(elapsed[slot])))
+            else:
+                recovered.append(self.owners[slot])
+        return expired, recovered
+
+def isNumpyAvailable():
+    """!
+    Check if NumPy is installed. NumPy isn't imported.
+
+    @return True if NumPy can be imported.
+    """
+    return numpy is not None or importlib.util.find_spec("numpy") is not None
+
+def createTimeoutTable(useNumpy):
+    """!
+    Create timeout table.
+
+    @param useNumpy Use NumPy columns. Standard arrays are used if False.
+    @return TimeoutTable object.
+    @throws ImportError If NumPy is requested, but not installed.
+    """
+    if useNumpy:
+        return NumpyTimeoutTable()
+    return TimeoutTable()
@@ -0,0 +1,222 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+MQTT topic filters and topic matching.
+"""
+
+SINGLE_LEVEL_WILDCARD = "+"
+MULTI_LEVEL_WILDCARD = "#"
+TOPIC_SEPARATOR = "/"
+
+def isWildcardTopic(topicFilter):
+    """!
+    Check if topic filter contains some wildcard.
+
+    @param topicFilter Topic filter string.
+    @return True if topic filter contains wildcard, False otherwise.
+    """
+    return SINGLE_LEVEL_WILDCARD in topicFilter or MULTI_LEVEL_WILDCARD in topicFilter
+
+def isValidTopicFilter(topicFilter):
+    """!
+    Check if topic filter is valid according to MQTT specification.
+
+    Wildcard characters must occupy whole topic level and multi-level wildcard
+    must be the last level of topic filter.
+
+    @param topicFilter Topic filter string.
+    @return True if topic filter is valid, False otherwise.
+    """
+    if len(topicFilter) == 0:
+        return False
+    levels = topicFilter.split(TOPIC_SEPARATOR)
+    for i, level in enumerate(levels):
+        if MULTI_LEVEL_WILDCARD in level:
+            if level != MULTI_LEVEL_WILDCARD or i != len(levels) - 1:
+                return False
+        if SINGLE_LEVEL_WILDCARD in level and level != SINGLE_LEVEL_WILDCARD:
+            return False
+    return True
+
+def topicMatches(topicFilter, topic):
+    """!
+    Check if topic matches topic filter.
+
+    @param topicFilter Topic filter string. It may contain wildcards.
+    @param topic Concrete topic string.
+    @return True if topic matches the filter, False otherwise.
+    """
+    return getWildcardLevels(topicFilter, topic) is not None
+
+def getWildcardLevels(topicFilter, topic):
+    """!
+    Get topic levels matched by filter wildcards.
+
+    Single-level wildcard captures exactly one level. Multi-level wildcard captures
+    the rest of the topic as one string.
+
+    @param topicFilter Topic filter string.
+    @param topic Concrete topic string.
+    @return List of captured levels, or None if topic doesn't match the filter.
+    """
+    filterLevels = topicFilter.split(TOPIC_SEPARATOR)
+    topicLevels = topic.split(TOPIC_SEPARATOR)
+    if isSystemTopic(topic) and filterLevels[0] in (SINGLE_LEVEL_WILDCARD, MULTI_LEVEL_WILDCARD):
+        return None
+    captured = []
+    for i, filterLevel in enumerate(filterLevels):
+        if filterLevel == MULTI_LEVEL_WILDCARD:
+            captured.append(TOPIC_SEPARATOR.join(topicLevels[i:]))
+            return captured
+        if i >= len(topicLevels):
+            return None
+        if filterLevel == SINGLE_LEVEL_WILDCARD:
+            captured.append(topicLevels[i])
+        elif filterLevel != topicLevels[i]:
+            return None
+    if len(filterLevels) != len(topicLevels):
+        return None
+    return captured
+
+def isSystemTopic(topic):
+    """!
+    Check if topic is broker system topic. Wildcards at first level don't match
+    these topics.
+
+    @param topic Topic string.
+    @return True if topic starts with '$' character.
+    """
+    return topic.startswith("$")
+
+class TopicTrie:
+    """!
+    Trie of MQTT topic filters. Each node represents single topic level.
+
+    Matching cost of a topic depends on its depth and on number of matching
+    wildcard branches. It doesn't depend on total number of stored filters.
+    """
+
+    ## @var root
+    # Root node.
+
+    def __init__(self):
+        """!
+        Initiate empty topic trie.
+        """
+        self.root = TopicTrieNode()
+
+    def add(self, topicFilter, value):
+        """!
+        Store value under topic filter.
+
+        @param topicFilter Topic filter string.
+        @param value Stored object.
+        """
+        node = self.root
+        for level in topicFilter.split(TOPIC_SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = TopicTrieNode()
+                node.children[level] = child
+            node = child
+        node.values.append(value)
+
+    def remove(self, topicFilter, value):
+        """!
+        Remove value stored under topic filter. Empty nodes are pruned.
+
+        @param topicFilter Topic filter string.
+        @param value Stored object.
+        @return True if value was found and removed, False otherwise.
+        """
+        path = [self.root]
+        levels = topicFilter.split(TOPIC_SEPARATOR)
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                return False
+            path.append(child)
+        node = path[-1]
+        try:
+            node.values.remove(value)
+        except ValueError:
+            return False
+        for level, parent, child in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if child.isEmpty():
+                del parent.children[level]
+            else:
+                break
+        return True
+
+    def match(self, topic):
+        """!
+        Get all values stored under filters matching given topic.
+
+        @param topic Concrete topic string.
+        @return List of matching values.
+        """
+        result = []
+        levels = topic.split(TOPIC_SEPARATOR)
+        nodes = [self.root]
+        # Wildcards on the first level don't match system topics.
+        allowWildcards = not isSystemTopic(topic)
+        for level in levels:
+            nextNodes = []
+            for node in nodes:
+                children = node.children
+                if allowWildcards:
+                    multiLevel = children.get(MULTI_LEVEL_WILDCARD)
+                    if multiLevel is not None:
+                        result.extend(multiLevel.values)
+                    singleLevel = children.get(SINGLE_LEVEL_WILDCARD)
+                    if singleLevel is not None:
+                        nextNodes.append(singleLevel)
+                child = children.get(level)
+                if child is not None:
+                    nextNodes.append(child)
+            if len(nextNodes) == 0:
+                return result
+            nodes = nextNodes
+            allowWildcards = True
+        for node in nodes:
+            result.extend(node.values)
+            # Multi-level wildcard matches its parent level too.
+            multiLevel = node.children.get(MULTI_LEVEL_WILDCARD)
+            if multiLevel is not None:
+                result.extend(multiLevel.values)
+        return result
+
+    def isEmpty(self):
+        """!
+        Check if trie contains any value.
+
+        @return True if trie is empty, False otherwise.
+        """
+        return self.root.isEmpty()
+
+class TopicTrieNode:
+    """!
+    Single node of topic trie.
+    """
+
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+
+    def isEmpty(self):
+        return len(self.children) == 0 and len(self.values) == 0
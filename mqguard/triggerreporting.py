@@ -0,0 +1,231 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Running commands on alarm transitions.
+"""
+
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+
+from mqguard.reporting import BatchQueue
+from mqguard.config import ConfigException
+from mqguard.throttling import ThrottledReporter
+
+class CommandPool:
+    """!
+    Bounded pool of worker threads, each running at most one command process at
+    time. Commands wait in bounded queue, commands submitted to full queue are dropped.
+    """
+
+    ## @var workers
+    # Number of worker threads, which is maximum number of running processes.
+
+    ## @var timeout
+    # Command timeout in seconds. Process is killed when timeout expires.
+
+    ## @var queue
+    # BatchQueue of tuples (args, environment, input) waiting for worker.
+
+    def __init__(self, workers = 4, queueSize = 100, timeout = 30):
+        """!
+        Initiate command pool.
+
+        @param workers Maximum number of running processes.
+        @param queueSize Maximum number of waiting commands.
+        @param timeout Command timeout in seconds.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.queue = BatchQueue(queueSize)
+        self.threads = []
+        self.failed = 0
+
+    def start(self):
+        """!
+        Start worker threads.
+        """
+        for _ in range(self.workers):
+            thread = threading.Thread(target = self.runWorker)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, args, environment, data):
+        """!
+        Queue command. Never blocks.
+
+        @param args Command argument list.
+        @param environment Variables added to environment of command.
+        @param data Bytes written to command standard input.
+        @return True if command was queued, False if it was dropped.
+        """
+        return self.queue.put((args, environment, data))
+
+    def runWorker(self):
+        """!
+        Run queued commands until pool is stopped and queue is drained.
+        """
+        while not self.queue.isDrained():
+            for args, environment, data in self.queue.getBatch(1):
+                try:
+                    self.runCommand(args, environment, data)
+                except Exception as ex:
+                    # Single failed command must not stop the worker.
+                    self.failed += 1
+                    print("{}: command {} failed: {}".format(self.__class__.__name__, args[0], ex),
+                        file=sys.stderr)
+
+    def runCommand(self, args, environment, data):
+        """!
+        Run single command and wait for its exit.
+
+        @param args Command argument list.
+        @param environment Variables added to environment of command.
+        @param data Bytes written to command standard input.
+        @return True if command succeeded, False otherwise.
+        """
+        env = dict(os.environ)
+        # Alarm messages may embed payload, environment can't hold NUL characters.
+        env.update((name, value.replace("\0", "")) for name, value in environment.items())
+        try:
+            result = subprocess.run(args, input = data, env = env, timeout = self.timeout,
+                stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            if result.returncode == 0:
+                return True
+            error = "exit code {}".format(result.returncode)
+        except subprocess.TimeoutExpired:
+            error = "killed after {} seconds".format(self.timeout)
+        except (OSError, ValueError) as ex:
+            error = str(ex)
+        self.failed += 1
+        print("{}: command {} failed: {}".format(self.__class__.__name__, args[0], error), file=sys.stderr)
+        return False
+
+    def stop(self):
+        """!
+        Stop worker threads. Already queued commands are run.
+        """
+        self.queue.close()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+class TriggerReporter(ThrottledReporter):
+    """!
+    Run command on every alarm and presence transition. Notification is passed to
+    command in environment variables and as JSON document on standard input. Digest
+    of throttled notifications is passed as JSON list, with MQGUARD_DIGEST variable
+    holding number of notifications.
+    """
+
+    ## @var args
+    # Command argument list.
+
+    ## @var pool
+    # CommandPool object.
+
+    def __init__(self, synchronizer, throttle, args, pool):
+        """!
+        Initiate trigger reporter.
+
+        @param synchronizer Synchronizing object.
+        @param throttle NotificationThrottle object.
+        @param args Command argument list.
+        @param pool CommandPool object.
+        """
+        ThrottledReporter.__init__(self, synchronizer, throttle)
+        self.args = args
+        self.pool = pool
+
+    def __call__(self):
+        """!
+        Run command pool and throttle.
+        """
+        self.pool.start()
+        try:
+            ThrottledReporter.__call__(self)
+        finally:
+            self.pool.stop()
+
+    def sendNotification(self, notification):
+        """!
+        @copydoc ThrottledReporter::sendNotification()
+        """
+        environment = {
+            "MQGUARD_DEVICE": str(notification.device),
+            "MQGUARD_BROKER": notification.dataIdentifier.broker.name,
+            "MQGUARD_TOPIC": notification.dataIdentifier.topic,
+            "MQGUARD_ALARM": notification.name,
+            "MQGUARD_ACTIVE": "1" if notification.active else "0",
+            "MQGUARD_MESSAGE": notification.message or "",
+            "MQGUARD_TIME": str(int(notification.time))}
+        self.submit(environment, self.createDocument(notification))
+
+    def sendDigest(self, notifications, dropped):
+        """!
+        @copydoc ThrottledReporter::sendDigest()
+        """
+        environment = {
+            "MQGUARD_DIGEST": str(len(notifications)),
+            "MQGUARD_DROPPED": str(dropped)}
+        self.submit(environment, [self.createDocument(notification) for notification in notifications])
+
+    def submit(self, environment, document):
+        """!
+        Submit command into pool.
+
+        @param environment Variables added to environment of command.
+        @param document JSON serializable object written to command standard input.
+        """
+        if not self.pool.submit(self.args, environment, json.dumps(document).encode()):
+            print("{}: command dropped, queue is full".format(self.__class__.__name__), file=sys.stderr)
+
+    def createDocument(self, notification):
+        return {
+            "device": notification.device,
+            "broker": notification.dataIdentifier.broker.name,
+            "topic": notification.dataIdentifier.topic,
+            "alarm": notification.name,
+            "active": notification.active,
+            "message": notification.message,
+            "time": notification.time}
+
+def createTriggerReporter(config, reporterSection):
+    """!
+    Create TriggerReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return TriggerReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    config.checkForOptionList(reporterSection, ["Command"])
+    try:
+        args = shlex.split(config.parser.get(reporterSection, "Command"))
+    except ValueError as ex:
+        raise ConfigException("Section {}: invalid Command: {}".format(reporterSection, ex))
+    if len(args) == 0:
+        raise ConfigException("Section {}: Command is empty".format(reporterSection))
+    workers = config.getNonNegativeInt(reporterSection, "Workers", 4)
+    queueSize = config.getNonNegativeInt(reporterSection, "QueueSize", 100)
+    timeout = config.getNonNegativeInt(reporterSection, "Timeout", 30)
+    if workers == 0:
+        raise ConfigException("Section {}: option Workers must be positive".format(reporterSection))
+    pool = CommandPool(workers, queueSize, timeout if timeout > 0 else None)
+    return TriggerReporter(None, config.createNotificationThrottle(reporterSection), args, pool)
@@ -0,0 +1,577 @@
+# Copyright (C) Ivo Slanina <ivo.slanina@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""!
+Posting device report changes to HTTP endpoint.
+"""
+
+import collections
+import http.client
+import itertools
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+from mqguard.reporting import BaseReporter, BatchQueue
+from mqguard.formatting import JSONFormatter, SystemDataProvider
+from mqguard.config import ConfigException
+
+class WebhookConnection:
+    """!
+    Keep-alive HTTP connection to webhook endpoint.
+    """
+
+    def __init__(self, url, timeout = 10, headers = None):
+        """!
+        Initiate connection. Nothing is connected until first request.
+
+        @param url Endpoint URL.
+        @param timeout Socket timeout in seconds.
+        @param headers Mapping of additional request headers.
+        """
+        parts = urllib.parse.urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        if headers is not None:
+            self.headers.update(headers)
+        self.connection = None
+
+    def connect(self):
+        if self.https:
+            self.connection = http.client.HTTPSConnection(self.host, self.port, timeout = self.timeout)
+        else:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout = self.timeout)
+
+    def post(self, body):
+        """!
+        Post request body. Connection closed by server while idle is reopened once.
+
+        @param body Request body bytes.
+        @return HTTP status code.
+        @throws OSError, http.client.HTTPException If endpoint isn't reachable.
+        """
+        for attempt in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self.connect()
+            try:
+                self.connection.request("POST", self.path, body, self.headers)
+                response = self.connection.getresponse()
+                # Response must be read whole before connection is reused.
+                response.read()
+                if response.will_close:
+                    self.close()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if not reused:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class Spool:
+    """!
+    Bounded on-disk queue of request bodies which couldn't be delivered. Every body
+    is stored in separate file, oldest files are removed when spool exceeds its
+    size. Spool survives program restart. Bodies which can't be written to disk
+    are kept in memory.
+    """
+
+    ## @var directory
+    # Spool directory.
+
+    ## @var maxSize
+    # Maximum total size of spooled bodies in bytes.
+
+    ## @var files
+    # Mapping file name : size of spooled files.
+
+    ## @var fallback
+    # MemorySpool object keeping bodies which couldn't be written to disk.
+
+    def __init__(self, directory, maxSize, fallbackCount = 1000):
+        """!
+        Initiate spool. Directory isn't touched until open() is called.
+
+        @param directory Spool directory. It is created if it doesn't exist.
+        @param maxSize Maximum total size of spooled bodies in bytes.
+        @param fallbackCount Maximum number of bodies kept in memory when disk
+            isn't writable.
+        """
+        self.directory = directory
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.fallback = MemorySpool(fallbackCount)
+        self.files = {}
+        self.claimed = set()
+        self.size = 0
+        self.dropped = 0
+        self.sequence = 0
+
+    def open(self):
+        """!
+        Create spool directory and take over files left by previous run. Called by
+        reporter thread, so directory isn't shared with reporter being replaced.
+
+        @throws OSError If directory can't be created or read.
+        """
+        with self.lock:
+            os.makedirs(self.directory, exist_ok = True)
+            for name in os.listdir(self.directory):
+                # Other files in the directory aren't touched.
+                if name.endswith(".json") and name[:-5].isdigit():
+                    size = os.path.getsize(os.path.join(self.directory, name))
+                    self.files[name] = size
+                    self.size += size
+            self.sequence = max([int(name[:-5]) for name in self.files] + [0])
+
+    def push(self, body):
+        """!
+        Store body. Oldest bodies are dropped to keep spool size. Body which can't
+        be written is kept in memory.
+
+        @param body Request body bytes.
+        """
+        with self.lock:
+            self.sequence += 1
+            name = "{:020d}.json".format(self.sequence)
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path + ".tmp", "wb") as f:
+                    f.write(body)
+                os.replace(path + ".tmp", path)
+            except OSError as ex:
+                print("{}: body kept in memory, it can't be spooled: {}".format(self.__class__.__name__, ex),
+                    file=sys.stderr)
+                self.removePath(path + ".tmp")
+                self.fallback.push(body)
+                return
+            self.files[name] = len(body)
+            self.size += len(body)
+            for oldName in sorted(self.files):
+                if self.size <= self.maxSize:
+                    break
+                if oldName not in self.claimed:
+                    self.removeFile(oldName)
+                    self.dropped += 1
+
+    def claim(self):
+        """!
+        Take oldest body which isn't being delivered. Bodies kept in memory are
+        taken after spooled files.
+
+        @return Tuple (name, body), or None if nothing waits.
+        """
+        with self.lock:
+            for name in sorted(self.files):
+                if name not in self.claimed:
+                    try:
+                        with open(os.path.join(self.directory, name), "rb") as f:
+                            body = f.read()
+                    except OSError as ex:
+                        # File was removed or became unreadable, it is forgotten.
+                        print("{}: spooled body {} lost: {}".format(self.__class__.__name__, name, ex),
+                            file=sys.stderr)
+                        self.size -= self.files.pop(name)
+                        self.dropped += 1
+                        continue
+                    self.claimed.add(name)
+                    return name, body
+            return self.fallback.claim()
+
+    def release(self, name, delivered):
+        """!
+        Finish delivery of claimed body.
+
+        @param name Name returned by claim().
+        @param delivered Body was delivered and can be removed.
+        """
+        with self.lock:
+            if name not in self.claimed:
+                self.fallback.release(name, delivered)
+                return
+            self.claimed.discard(name)
+            if delivered and name in self.files:
+                self.removeFile(name)
+
+    def removeFile(self, name):
+        self.size -= self.files.pop(name)
+        self.removePath(os.path.join(self.directory, name))
+
+    def removePath(self, path):
+        """!
+        Remove spool file. File which is already missing is ignored.
+
+        @param path File path.
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            print("{}: {} can't be removed: {}".format(self.__class__.__name__, path, ex), file=sys.stderr)
+
+    def hasUnclaimed(self):
+        """!
+        Check if some body waits for delivery and nobody delivers it.
+
+        @return True if claim() would return body.
+        """
+        with self.lock:
+            return len(self.files) > len(self.claimed) or self.fallback.hasUnclaimed()
+
+    def takeDropped(self):
+        with self.lock:
+            dropped = self.dropped
+            self.dropped = 0
+            return dropped + self.fallback.takeDropped()
+
+    def __len__(self):
+        return len(self.files) + len(self.fallback)
+
+class MemorySpool:
+    """!
+    In-memory retry queue of undelivered bodies, used when spool directory isn't
+    configured. It has the same interface as Spool, bodies are lost on exit.
+    """
+
+    ## @var maxCount
+    # Maximum number of kept bodies.
+
+    ## @var bodies
+    # Deque of tuples (name, body) waiting for delivery, oldest first.
+
+    ## @var claimed
+    # Mapping name : body of bodies being delivered.
+
+    def __init__(self, maxCount):
+        """!
+        Initiate retry queue.
+
+        @param maxCount Maximum number of kept bodies.
+        """
+        self.maxCount = maxCount
+        self.lock = threading.Lock()
+        self.bodies = collections.deque()
+        self.claimed = {}
+        self.names = itertools.count()
+        self.dropped = 0
+
+    def push(self, body):
+        """!
+        Store body. Oldest bodies are dropped to keep queue size.
+
+        @param body Request body bytes.
+        """
+        with self.lock:
+            self.bodies.append((next(self.names), body))
+            self.trim()
+
+    def trim(self):
+        while len(self.bodies) > 0 and len(self.bodies) + len(self.claimed) > self.maxCount:
+            self.bodies.popleft()
+            self.dropped += 1
+
+    def claim(self):
+        """!
+        Take oldest body which isn't being delivered.
+
+        @return Tuple (name, body), or None if nothing waits.
+        """
+        with self.lock:
+            if len(self.bodies) == 0:
+                return None
+            name, body = self.bodies.popleft()
+            self.claimed[name] = body
+            return name, body
+
+    def release(self, name, delivered):
+        """!
+        Finish delivery of claimed body. Undelivered body returns to queue head.
+
+        @param name Name returned by claim().
+        @param delivered Body was delivered and can be removed.
+        """
+        with self.lock:
+            body = self.claimed.pop(name, None)
+            if not delivered and body is not None:
+                self.bodies.appendleft((name, body))
+                self.trim()
+
+    def hasUnclaimed(self):
+        with self.lock:
+            return len(self.bodies) > 0
+
+    def takeDropped(self):
+        with self.lock:
+            dropped = self.dropped
+            self.dropped = 0
+            return dropped
+
+    def __len__(self):
+        with self.lock:
+            return len(self.bodies) + len(self.claimed)
+
+class WebhookReporter(BaseReporter):
+    """!
+    Post device reports with changes to HTTP endpoint. Reports are queued by
+    reporting thread, reporter thread formats them by JSONFormatter into batches.
+    Batches are posted by small pool of sender threads, each keeping its own
+    keep-alive connection. Batches which can't be delivered are spooled and
+    delivered when endpoint recovers. Sending is retried with exponential backoff.
+    """
+
+    ## @var formatter
+    # JSONFormatter object.
+
+    ## @var queue
+    # BatchQueue of device reports.
+
+    ## @var outbox
+    # BatchQueue of formatted request bodies waiting for sender.
+
+    ## @var spool
+    # Spool object, or MemorySpool object if spool directory isn't set.
+
+    ## @var retryTime
+    # Monotonic time of next delivery attempt after failure, or None.
+
+    def __init__(self, synchronizer, formatter, connections, spool = None, queueSize = 100000,
+            batchSize = 100, flushInterval = 1, maxBackoff = 300, retryQueueSize = 1000):
+        """!
+        Initiate webhook reporter.
+
+        @param synchronizer Synchronizing object.
+        @param formatter JSONFormatter object.
+        @param connections List of WebhookConnection objects, one per sender thread.
+        @param spool Spool object, or None to keep undelivered batches in memory.
+        @param queueSize Maximum number of queued device reports.
+        @param batchSize Maximum number of device reports in one request.
+        @param flushInterval Maximum time in seconds report waits for batch.
+        @param maxBackoff Maximum delay between delivery attempts in seconds.
+        @param retryQueueSize Maximum number of undelivered batches kept in memory
+            if spool isn't used.
+        """
+        BaseReporter.__init__(self, synchronizer)
+        self.formatter = formatter
+        self.connections = connections
+        self.spool = spool if spool is not None else MemorySpool(retryQueueSize)
+        self.retryQueueSize = retryQueueSize
+        self.queue = BatchQueue(queueSize)
+        # Without spool directory, batches wait in memory until some sender is free.
+        self.outbox = BatchQueue(len(connections) * 2 if spool is not None else 0)
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.maxBackoff = maxBackoff
+        self.backoff = 0
+        self.retryTime = None
+        self.backoffLock = threading.Lock()
+        self.delivered = 0
+
+    def report(self, deviceReport):
+        """!
+        @copydoc BaseReporter::report()
+        """
+        if deviceReport.hasChanges():
+            self.queue.put(deviceReport)
+
+    def __call__(self):
+        """!
+        Run formatting and sender threads. Queued reports are delivered or spooled
+        before reporter stops.
+        """
+        self.running = True
+        self.openSpool()
+        senders = [threading.Thread(target = self.runSender, args = (connection,))
+            for connection in self.connections]
+        for sender in senders:
+            sender.start()
+        try:
+            while not self.queue.isDrained():
+                batch = self.queue.getBatch(self.batchSize, self.flushInterval)
+                if len(batch) > 0:
+                    self.addBody(self.formatter.formatDeviceReports(batch).encode())
+                dropped = self.queue.takeDropped()
+                if dropped > 0:
+                    print("{}: {} reports dropped, queue is full".format(self.__class__.__name__, dropped),
+                        file=sys.stderr)
+                dropped = self.spool.takeDropped()
+                if dropped > 0:
+                    print("{}: {} undelivered batches dropped".format(self.__class__.__name__, dropped),
+                        file=sys.stderr)
+        finally:
+            self.outbox.close()
+            for sender in senders:
+                sender.join()
+            remaining = len(self.spool.fallback if isinstance(self.spool, Spool) else self.spool)
+            if remaining > 0:
+                print("{}: {} undelivered batches dropped on exit".format(self.__class__.__name__, remaining),
+                    file=sys.stderr)
+            self.running = False
+
+    def openSpool(self):
+        """!
+        Open spool directory. Undelivered batches are kept in memory if spool
+        directory can't be used.
+        """
+        if not isinstance(self.spool, Spool):
+            return
+        try:
+            self.spool.open()
+        except OSError as ex:
+            print("{}: spool directory can't be used, undelivered batches are kept in memory: {}".format(
+                self.__class__.__name__, ex), file=sys.stderr)
+            self.spool = MemorySpool(self.retryQueueSize)
+
+    def addBody(self, body):
+        """!
+        Pass request body to senders. Body is spooled when senders are busy or
+        endpoint is failing.
+
+        @param body Request body bytes.
+        """
+        if self.isBackingOff(time.monotonic()) or not self.outbox.put(body):
+            self.spool.push(body)
+
+    def runSender(self, connection):
+        """!
+        Sender thread. Fresh batches take precedence over spooled ones, spool is
+        replayed only while endpoint accepts requests.
+
+        @param connection WebhookConnection object owned by this thread.
+        """
+        try:
+            while not self.outbox.isDrained():
+                bodies = self.outbox.getBatch(1, self.getSenderWaitTime())
+                if len(bodies) > 0:
+                    if not self.deliver(connection, bodies[0]):
+                        self.spool.push(bodies[0])
+                    continue
+                if self.isBackingOff(time.monotonic()):
+                    continue
+                claimed = self.spool.claim()
+                if claimed is not None:
+                    name, body = claimed
+                    self.spool.release(name, self.deliver(connection, body))
+        finally:
+            connection.close()
+
+    def getSenderWaitTime(self):
+        """!
+        Get time sender waits for fresh batch before it looks into spool.
+
+        @return Seconds.
+        """
+        if self.spool.hasUnclaimed():
+            retryTime = self.retryTime
+            if retryTime is None:
+                return 0
+            return max(0, min(self.flushInterval, retryTime - time.monotonic()))
+        return self.flushInterval
+
+    def deliver(self, connection, body):
+        """!
+        Post single request body.
+
+        @param connection WebhookConnection object.
+        @param body Request body bytes.
+        @return True if body was delivered or refused for good, False if it should
+            be retried later.
+        """
+        try:
+            status = connection.post(body)
+        except (OSError, http.client.HTTPException) as ex:
+            self.failed("{}".format(ex))
+            return False
+        if status >= 500 or status == 429:
+            self.failed("HTTP status {}".format(status))
+            return False
+        with self.backoffLock:
+            self.backoff = 0
+            self.retryTime = None
+        if status >= 400:
+            print("{}: batch refused with HTTP status {}".format(self.__class__.__name__, status), file=sys.stderr)
+        else:
+            self.delivered += 1
+        return True
+
+    def failed(self, error):
+        """!
+        Start or prolong backoff after failed delivery.
+
+        @param error Error description.
+        """
+        with self.backoffLock:
+            self.backoff = min(self.maxBackoff, max(1, self.backoff * 2))
+            self.retryTime = time.monotonic() + self.backoff
+            print("{}: delivery failed, retry in {} s: {}".format(self.__class__.__name__, self.backoff, error),
+                file=sys.stderr)
+
+    def isBackingOff(self, now):
+        retryTime = self.retryTime
+        return retryTime is not None and now < retryTime
+
+    def stop(self):
+        """!
+        Stop reporter. Already queued reports are delivered or spooled.
+        """
+        self.queue.close()
+
+def createWebhookReporter(config, reporterSection):
+    """!
+    Create WebhookReporter from reporter section.
+
+    @param config ProgramConfig object.
+    @param reporterSection Reporter section name.
+    @return WebhookReporter object.
+    @throws ConfigException If section is invalid.
+    """
+    config.checkForOptionList(reporterSection, ["URL"])
+    url = config.parser.get(reporterSection, "URL")
+    if not (url.startswith("http://") or url.startswith("https://")):
+        raise ConfigException("Section {}: unsupported URL: {}".format(reporterSection, url))
+    headers = {}
+    if config.parser.has_option(reporterSection, "Authorization"):
+        headers["Authorization"] = config.parser.get(reporterSection, "Authorization")
+    timeout = config.getNonNegativeInt(reporterSection, "Timeout", 10)
+    connectionCount = config.getNonNegativeInt(reporterSection, "Connections", 2)
+    if connectionCount == 0:
+        raise ConfigException("Section {}: option Connections must be positive".format(reporterSection))
+    connections = [WebhookConnection(url, timeout, headers) for _ in range(connectionCount)]
+    flushInterval = config.getNonNegativeInt(reporterSection, "FlushInterval", 1)
+    if flushInterval == 0:
+        raise ConfigException("Section {}: option FlushInterval must be positive".format(reporterSection))
+    spool = None
+    if config.parser.has_option(reporterSection, "SpoolDirectory"):
+        spool = Spool(config.parser.get(reporterSection, "SpoolDirectory"),
+            config.getNonNegativeInt(reporterSection, "SpoolSize", 100 * 1024 * 1024),
+            config.getNonNegativeInt(reporterSection, "RetryQueueSize", 1000))
+    return WebhookReporter(None, JSONFormatter(SystemDataProvider()), connections, spool,
+        config.getNonNegativeInt(reporterSection, "QueueSize", 100000),
+        max(1, config.getNonNegativeInt(reporterSection, "BatchSize", 100)),
+        flushInterval,
+        config.getNonNegativeInt(reporterSection, "MaxBackoff", 300),
+        config.getNonNegativeInt(reporterSection, "RetryQueueSize", 1000))
@@ -25,6 +25,8 @@ setup(
     install_requires = [
         'mqreceive>=0.1.0',
         'websockets>=2.6'],
+    extras_require = {
+        'numpy': ['numpy']},
     author = mqguard.__author__,
     author_email = mqguard.__email__,
     description = "MQTT traffic diagnostic tool",